@@ -1,3 +1,38 @@
 # Version of module
 
 __version__ = 3.5
+
+# Sub packages & the main classes are imported on first access only, so `import pyembedded` costs nothing,
+# i.e. pyembedded.GSM imports pyembedded.gsm_module.gsm and nothing else
+_SUBPACKAGES = ('gps_module', 'gsm_module', 'raspberry_pi_tools', 'rfid_module', 'serial_tools', 'simulator',
+                'telemetry')
+
+_CLASSES = {
+    'GSM': 'pyembedded.gsm_module.gsm',
+    'AsyncGSM': 'pyembedded.gsm_module.async_gsm',
+    'GPS': 'pyembedded.gps_module.gps',
+    'AsyncGPS': 'pyembedded.gps_module.async_gps',
+    'RFID': 'pyembedded.rfid_module.rfid',
+    'AsyncRFID': 'pyembedded.rfid_module.async_rfid',
+    'RFIDHub': 'pyembedded.rfid_module.hub',
+    'PI': 'pyembedded.raspberry_pi_tools.raspberrypi',
+    'LazySerial': 'pyembedded.serial_tools.port',
+    'SerialLink': 'pyembedded.serial_tools.link',
+    'TelemetryStore': 'pyembedded.telemetry.store',
+}
+
+
+def __getattr__(name):
+    import importlib
+    if name in _SUBPACKAGES:
+        return importlib.import_module('pyembedded.' + name)
+    if name in _CLASSES:
+        value = getattr(importlib.import_module(_CLASSES[name]), name)
+        # cached, next access does not come here
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'pyembedded' has no attribute %r" % name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBPACKAGES) | set(_CLASSES))
@@ -0,0 +1,119 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module is the asyncio interface of the gps module.
+Fixes are delivered as an async stream:
+
+    async for fix in gps.fixes():
+        print(fix.lat, fix.long)
+"""
+
+import asyncio
+import collections
+
+from pyembedded.gps_module.gps import GPSFix
+from pyembedded.gps_module.nmea import GGA, RMC
+from pyembedded.gps_module.ubx import NAVPVT, UBXParser
+from pyembedded.serial_tools.async_serial import AsyncSerial
+from pyembedded.serial_tools.link import SerialLink
+
+
+class AsyncGPS:
+    def __init__(self, port, baud_rate, serial_port=None):
+        """
+        Initialize the serial communication port to access gps module.
+        Must be created from a running event loop.
+        :param port: port to be used for serial communication.
+                    Use COM1, COM2, COM3 etc in case of windows
+                    Use /dev/ttyUSB0 etc in case of linux based devices
+        :param baud_rate: Set the appropriate baud rate.
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        """
+        # timeouts of the protocol, the port is opened again by AsyncSerial from the executor
+        self.gps_serial_port = AsyncSerial(SerialLink(port, baud_rate, 'gnss', reopen_timeout=0)
+                                          if serial_port is None else serial_port)
+        self.parser = UBXParser()
+        self.latest_fix = None
+        self.latest_rmc = None
+        # records parsed but not handed out yet, one read holds several sentences
+        self._pending = collections.deque()
+
+    async def _next_record(self):
+        while not self._pending:
+            self._pending.extend(self.parser.feed(await self.gps_serial_port.read()))
+        return self._pending.popleft()
+
+    async def records(self):
+        """
+        Async stream of every decoded NMEA sentence and UBX message
+        :return: async generator of nmea.GGA, RMC, VTG, GSA & GSV objects and ubx.NAVPVT, NAVSAT & UBXAck objects
+        """
+        while True:
+            yield await self._next_record()
+
+    async def fixes(self):
+        """
+        Async stream of fixes, one for every GGA packet or NAV-PVT message
+        :return: async generator of GPSFix
+        """
+        async for line, record in self.records():
+            if isinstance(record, RMC):
+                self.latest_rmc = record
+            elif isinstance(record, GGA):
+                self.latest_fix = GPSFix(line, record, self.latest_rmc)
+                yield self.latest_fix
+            elif isinstance(record, NAVPVT):
+                self.latest_fix = GPSFix(None, record.to_gga(), record.to_rmc(), pvt=record)
+                yield self.latest_fix
+
+    def send_ubx(self, frame):
+        """
+        Sends a UBX message i.e. ubx.cfg_rate(10), its UBXAck comes through records()
+        :param frame: bytes of the frame
+        """
+        self.gps_serial_port.write(frame)
+
+    async def get_fix(self, timeout=None):
+        """
+        Waits for the next fix
+        :param timeout: max time in secs to wait, None waits forever
+        :return: GPSFix or None on timeout
+        """
+        async def next_fix():
+            async for fix in self.fixes():
+                return fix
+
+        try:
+            return await asyncio.wait_for(next_fix(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get_lat_long(self, timeout=None):
+        """
+        :param timeout: max time in secs to wait for the next fix
+        :return: tuple of lat & long in decimal degrees or None on timeout
+        """
+        fix = await self.get_fix(timeout)
+        if fix is not None:
+            return fix.lat, fix.long
+
+    def close(self):
+        """
+        Closes the serial port
+        """
+        self.gps_serial_port.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
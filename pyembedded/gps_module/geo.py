@@ -0,0 +1,404 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module does the geo math on GPS fixes: distance & bearing, geofences and track simplification.
+Fences are kept in a grid index of lat/long cells, so a fix is tested only against the fences
+overlapping its cell instead of every fence. GeofenceMonitor follows many vehicles and reports
+enter & exit events. haversine(), bearing(), track_length(), points_in_polygon() and simplify()
+also work on numpy arrays for whole tracks at once, which requires numpy (pip3 install numpy).
+Fences crossing the 180th meridian are not supported.
+"""
+
+import math
+import threading
+import time
+
+# mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+ENTER = 'enter'
+EXIT = 'exit'
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for track processing, install it with: pip3 install numpy')
+    return numpy
+
+
+def _is_scalar(*values):
+    return all(isinstance(value, (int, float)) for value in values)
+
+
+def haversine(lat1, long1, lat2, long2):
+    """
+    Great circle distance, works on floats or numpy arrays of the same shape (broadcast)
+    :return: distance in meters
+    """
+    if _is_scalar(lat1, long1, lat2, long2):
+        lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2
+        return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+    np = _numpy()
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def bearing(lat1, long1, lat2, long2):
+    """
+    Initial bearing from the first to the second point, works on floats or numpy arrays
+    :return: degrees clockwise from north, 0 to 360
+    """
+    if _is_scalar(lat1, long1, lat2, long2):
+        lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+        y = math.sin(long2 - long1) * math.cos(lat2)
+        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(long2 - long1)
+        return math.degrees(math.atan2(y, x)) % 360
+    np = _numpy()
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    y = np.sin(long2 - long1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(long2 - long1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def track_length(lats, longs):
+    """
+    :param lats: array of latitudes of the track points in order
+    :param longs: array of longitudes
+    :return: length of the track in meters
+    """
+    np = _numpy()
+    lats, longs = np.asarray(lats, dtype=np.float64), np.asarray(longs, dtype=np.float64)
+    if len(lats) < 2:
+        return 0.0
+    return float(haversine(lats[:-1], longs[:-1], lats[1:], longs[1:]).sum())
+
+
+def _project(np, lats, longs, lat0):
+    """
+    Equirectangular projection to meters around lat0, accurate for the extent of a track or fence
+    """
+    scale = EARTH_RADIUS * math.pi / 180
+    return longs * scale * math.cos(math.radians(lat0)), lats * scale
+
+
+def simplify(lats, longs, tolerance):
+    """
+    Douglas-Peucker simplification, drops the points closer than tolerance to the simplified track
+    :param lats: array of latitudes of the track points in order
+    :param longs: array of longitudes
+    :param tolerance: max distance in meters of a dropped point from the simplified track
+    :return: numpy array of the indexes of the kept points, first & last are always kept
+    """
+    np = _numpy()
+    lats, longs = np.asarray(lats, dtype=np.float64), np.asarray(longs, dtype=np.float64)
+    count = len(lats)
+    if count < 3:
+        return np.arange(count)
+    x, y = _project(np, lats, longs, float(lats.mean()))
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    # iterative, a long track would exceed the recursion limit
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        index = int(distances.argmax())
+        if distances[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+def points_in_polygon(lats, longs, polygon):
+    """
+    Tests many points against one polygon at once
+    :param lats: array of latitudes of the points
+    :param longs: array of longitudes
+    :param polygon: list of (lat, long) vertices
+    :return: numpy array of bool, True for the points inside
+    """
+    np = _numpy()
+    y, x = np.asarray(lats, dtype=np.float64), np.asarray(longs, dtype=np.float64)
+    inside = np.zeros(y.shape, dtype=bool)
+    previous = polygon[-1]
+    for vertex in polygon:
+        y1, x1 = previous
+        y2, x2 = vertex
+        if y1 != y2:
+            crosses = (y1 > y) != (y2 > y)
+            inside ^= crosses & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+        previous = vertex
+    return inside
+
+
+class PolygonFence:
+    def __init__(self, name, points):
+        """
+        :param name: unique name of the fence
+        :param points: list of (lat, long) vertices, the polygon is closed automatically
+        """
+        if len(points) < 3:
+            raise ValueError('a polygon needs at least 3 points')
+        self.name = name
+        self.points = [(float(lat), float(long)) for lat, long in points]
+        lats = [lat for lat, _ in self.points]
+        longs = [long for _, long in self.points]
+        self.bbox = (min(lats), min(longs), max(lats), max(longs))
+        self._edges = list(zip([self.points[-1]] + self.points[:-1], self.points))
+
+    def contains(self, lat, long):
+        """
+        :return: True if the point is inside the polygon (ray casting)
+        """
+        min_lat, min_long, max_lat, max_long = self.bbox
+        if not (min_lat <= lat <= max_lat and min_long <= long <= max_long):
+            return False
+        inside = False
+        for (y1, x1), (y2, x2) in self._edges:
+            if (y1 > lat) != (y2 > lat) and long < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+
+
+class CircleFence:
+    def __init__(self, name, lat, long, radius):
+        """
+        :param name: unique name of the fence
+        :param lat: latitude of the center
+        :param long: longitude of the center
+        :param radius: radius in meters
+        """
+        self.name = name
+        self.lat = float(lat)
+        self.long = float(long)
+        self.radius = float(radius)
+        span_lat = math.degrees(radius / EARTH_RADIUS)
+        span_long = span_lat / max(math.cos(math.radians(lat)), 1e-6)
+        self.bbox = (lat - span_lat, long - span_long, lat + span_lat, long + span_long)
+
+    def contains(self, lat, long):
+        """
+        :return: True if the point is within radius of the center
+        """
+        return haversine(self.lat, self.long, float(lat), float(long)) <= self.radius
+
+
+class GridIndex:
+    def __init__(self, cell_size=0.01):
+        """
+        Spatial index of fences in a grid of lat/long cells, a fence is listed in every cell its bounding box overlaps
+        :param cell_size: size of a cell in degrees, 0.01 is about 1.1 km. Use about the size of a typical fence
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        self._fences = {}
+
+    def __len__(self):
+        return len(self._fences)
+
+    def _cell(self, lat, long):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(long / self.cell_size))
+
+    def _cells_of(self, bbox):
+        min_row, min_col = self._cell(bbox[0], bbox[1])
+        max_row, max_col = self._cell(bbox[2], bbox[3])
+        return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+
+    def add(self, fence):
+        """
+        :param fence: PolygonFence or CircleFence, a fence with the same name is replaced
+        """
+        self.remove(fence.name)
+        self._fences[fence.name] = fence
+        for cell in self._cells_of(fence.bbox):
+            self._cells.setdefault(cell, []).append(fence)
+
+    def remove(self, name):
+        """
+        :param name: name of the fence
+        :return: removed fence or None
+        """
+        fence = self._fences.pop(name, None)
+        if fence is None:
+            return None
+        for cell in self._cells_of(fence.bbox):
+            fences = self._cells[cell]
+            fences.remove(fence)
+            if not fences:
+                del self._cells[cell]
+        return fence
+
+    def get(self, name):
+        return self._fences.get(name)
+
+    def candidates(self, lat, long):
+        """
+        :return: list of fences whose bounding box may contain the point
+        """
+        return self._cells.get(self._cell(lat, long), [])
+
+    def query(self, lat, long):
+        """
+        :return: list of fences containing the point
+        """
+        return [fence for fence in self.candidates(lat, long) if fence.contains(lat, long)]
+
+
+class GeofenceEvent:
+    __slots__ = ('vehicle', 'fence', 'kind', 'lat', 'long', 'timestamp')
+
+    def __init__(self, vehicle, fence, kind, lat, long, timestamp):
+        """
+        :param vehicle: id of the vehicle
+        :param fence: name of the fence
+        :param kind: ENTER or EXIT
+        :param timestamp: time.time() value of the fix
+        """
+        self.vehicle = vehicle
+        self.fence = fence
+        self.kind = kind
+        self.lat = lat
+        self.long = long
+        self.timestamp = timestamp
+
+
+class GeofenceMonitor:
+    def __init__(self, cell_size=0.01):
+        """
+        Follows the position of many vehicles and reports when they enter or exit a fence
+        :param cell_size: cell size in degrees of the grid index
+        """
+        self.index = GridIndex(cell_size)
+        self._inside = {}
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def add_fence(self, fence):
+        """
+        :param fence: PolygonFence or CircleFence
+        """
+        with self._lock:
+            self.index.add(fence)
+
+    def remove_fence(self, name):
+        """
+        Removes the fence, vehicles inside it do not get an exit event
+        :param name: name of the fence
+        """
+        with self._lock:
+            self.index.remove(name)
+            for inside in self._inside.values():
+                inside.discard(name)
+
+    def on(self, kind, callback):
+        """
+        Registers callback(event) for ENTER, EXIT or '*' for both. Called from the thread calling update()
+        """
+        with self._lock:
+            self._callbacks.setdefault(kind, []).append(callback)
+
+    def off(self, kind, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(kind, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def inside(self, vehicle):
+        """
+        :return: set of the names of the fences the vehicle is in
+        """
+        with self._lock:
+            return set(self._inside.get(vehicle, ()))
+
+    def update(self, vehicle, lat, long, timestamp=None):
+        """
+        Processes a new position of the vehicle
+        :param vehicle: id of the vehicle
+        :param lat: latitude in decimal degrees
+        :param long: longitude in decimal degrees
+        :param timestamp: time.time() value of the fix, now if None
+        :return: list of GeofenceEvent, exits first
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            now = {fence.name for fence in self.index.query(lat, long)}
+            before = self._inside.get(vehicle, set())
+            if now == before:
+                return []
+            self._inside[vehicle] = now
+            events = [GeofenceEvent(vehicle, name, EXIT, lat, long, timestamp) for name in sorted(before - now)]
+            events += [GeofenceEvent(vehicle, name, ENTER, lat, long, timestamp) for name in sorted(now - before)]
+            callbacks = {kind: list(self._callbacks.get(kind, ())) for kind in (ENTER, EXIT, '*')}
+        for event in events:
+            for callback in callbacks[event.kind] + callbacks['*']:
+                callback(event)
+        return events
+
+    def update_fix(self, vehicle, fix):
+        """
+        :param vehicle: id of the vehicle
+        :param fix: GPSFix, fixes without a position are ignored
+        :return: list of GeofenceEvent
+        """
+        if fix is None or fix.gga.lat is None or fix.gga.long is None:
+            return []
+        return self.update(vehicle, fix.gga.lat, fix.gga.long, fix.received_at)
+
+    def follow(self, gps, vehicle, poll_timeout=0.5):
+        """
+        Starts a thread feeding every fix of the gps stream to update(), the stream is started if needed
+        :param gps: GPS object
+        :param vehicle: id of the vehicle
+        :param poll_timeout: max time in secs a wait for the next fix may block, used to stop the thread in time
+        """
+        with self._lock:
+            if vehicle in self._threads:
+                raise ValueError('vehicle %s is already followed' % vehicle)
+            self._stop.clear()
+            gps.start_stream()
+            thread = threading.Thread(target=self._follow, args=(gps, vehicle, poll_timeout),
+                                      name='geofence-' + str(vehicle), daemon=True)
+            self._threads[vehicle] = thread
+        thread.start()
+
+    def _follow(self, gps, vehicle, poll_timeout):
+        fix = None
+        while not self._stop.is_set():
+            latest = gps.wait_for_fix(poll_timeout, newer_than=fix)
+            if latest is not None:
+                fix = latest
+                self.update_fix(vehicle, fix)
+
+    def stop(self):
+        """
+        Stops the threads started by follow(), the gps streams keep running
+        """
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, {}
+        for thread in threads.values():
+            thread.join()
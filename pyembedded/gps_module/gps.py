@@ -9,101 +9,385 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 """
-This module reads and process the GGPA packet received from GPS module.
+This module reads and process the GGA packet received from GPS module.
 It returns useful data like, lat, long, time, satellite etc
+u-blox receivers can be switched to the UBX binary NAV-PVT message for high rate fixes,
+UBX & NMEA are read from the same port.
 """
 
-import serial
+import threading
+import time
+
+from pyembedded.gps_module.nmea import GGA, RMC
+from pyembedded.gps_module.ubx import MESSAGES, NAVPVT, NAVSAT, UBXAck, UBXParser, cfg_msg, cfg_nmea, cfg_prt_uart, \
+    cfg_rate
+from pyembedded.serial_tools.framing import get_field, to_text
+from pyembedded.serial_tools.link import SerialLink
+
+# (class, id): name i.e. 'UBX-CFG-RATE', used to label the metrics
+_MESSAGE_NAMES = {value: 'UBX-' + name for name, value in MESSAGES.items()}
+
+
+class GPSFix:
+    """
+    Snapshot of the latest GGA packet together with the latest RMC packet, or of the latest UBX NAV-PVT message
+    """
+    __slots__ = ('sentence', '_raw', 'gga', 'rmc', 'received_at', 'pvt')
+
+    def __init__(self, raw, gga, rmc=None, received_at=None, pvt=None):
+        """
+        :param raw: bytes of the GGA packet, or list of its comma separated fields, None for a NAV-PVT fix
+        :param gga: decoded nmea.GGA
+        :param rmc: decoded nmea.RMC received before the GGA packet, if any
+        :param received_at: time.time() value when the packet was received
+        :param pvt: ubx.NAVPVT the fix is made of, if any
+        """
+        self.pvt = pvt
+        if isinstance(raw, (bytes, bytearray)):
+            # the fields are decoded only if raw is asked for
+            self.sentence = bytes(raw)
+            self._raw = None
+        else:
+            self.sentence = None
+            self._raw = raw
+        self.gga = gga
+        self.rmc = rmc
+        self.received_at = time.time() if received_at is None else received_at
+
+    @property
+    def raw(self):
+        """
+        :return: list of comma separated fields of the GGA packet, None for a NAV-PVT fix
+        """
+        if self._raw is None and self.sentence is not None:
+            self._raw = to_text(self.sentence).strip().split(',')
+        return self._raw
+
+    @property
+    def lat(self):
+        return "N/A" if self.gga.lat is None or self.gga.long is None else self.gga.lat
+
+    @property
+    def long(self):
+        return "N/A" if self.gga.lat is None or self.gga.long is None else self.gga.long
+
+    @property
+    def time(self):
+        """
+        :return: time as hh.mm
+        """
+        if self.gga.time is None:
+            return "N/A"
+        return self.gga.time.hour + self.gga.time.minute / 100
+
+    def _field(self, index, value):
+        if self._raw is not None:
+            return self._raw[index]
+        if self.sentence is not None:
+            return to_text(get_field(self.sentence, index))
+        # NAV-PVT fix, formatted like the GGA field
+        return '%02d' % value if index == 7 else str(value)
+
+    @property
+    def quality(self):
+        return self._field(6, self.gga.quality)
+
+    @property
+    def satellites(self):
+        return self._field(7, self.gga.satellites)
 
 
 class GPS:
-    def __init__(self, port, baud_rate):
+    def __init__(self, port, baud_rate, serial_port=None, metrics=None):
         """
         Initialize the serial communication port to access gps module
         :param port: port to be used for serial communication.
                     Use COM1, COM2, COM3 etc in case of windows
                     Use /dev/ttyUSB0 etc in case of linux based devices
-        :param baud_rate: Set the appropriate baud rate.
+        :param baud_rate: Set the appropriate baud rate, None to detect it
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        :param metrics: telemetry.metrics.Metrics recording bytes, fixes, parser errors & the UBX CFG round trips
+        """
+        self.metrics = None if metrics is None else metrics.device('gps', port)
+        self.gps_serial_port = SerialLink(port, baud_rate, 'gnss') if serial_port is None else serial_port
+        self.latest_fix = None
+        self.latest_rmc = None
+        self.latest_satellites = None
+        # no of GGA packets & NAV-PVT messages received by the stream
+        self.fix_count = 0
+        # (class, id): UBXAck of the CFG messages sent with send_ubx()
+        self._acks = {}
+        self._stream_thread = None
+        self._port_timeout = None
+        self._stream_stop = threading.Event()
+        self._fix_available = threading.Condition()
+        if self.metrics is not None and hasattr(self.gps_serial_port, 'on_reopen'):
+            self.gps_serial_port.on_reopen.append(lambda port: self.metrics.count('reopens'))
+
+    def start_stream(self, read_timeout=0.5):
+        """
+        Starts a background thread which continuously reads the port and keeps the latest fix in memory.
+        Once started, all the getters return the latest fix without reading the port.
+        :param read_timeout: max time in secs a single read may block, used to stop the thread in time
+        """
+        if self.streaming:
+            return
+        self._stream_stop.clear()
+        self._port_timeout = self.gps_serial_port.timeout
+        self.gps_serial_port.timeout = read_timeout
+        self._stream_thread = threading.Thread(target=self._stream_worker, name='gps-stream', daemon=True)
+        self._stream_thread.start()
+
+    def stop_stream(self):
+        """
+        Stops the background reader thread started by start_stream()
         """
-        self.gps_serial_port = serial.Serial(port, baud_rate)
+        if not self.streaming:
+            return
+        self._stream_stop.set()
+        self._stream_thread.join()
+        self._stream_thread = None
+        self.gps_serial_port.timeout = self._port_timeout
+
+    @property
+    def streaming(self):
+        """
+        :return: True if the background reader thread is running
+        """
+        return self._stream_thread is not None and self._stream_thread.is_alive()
+
+    def wait_for_fix(self, timeout=None, newer_than=None):
+        """
+        Blocks until the stream has received at least one GGA packet
+        :param timeout: max time in secs to wait, None waits forever
+        :param newer_than: GPSFix already seen, waits for the next one
+        :return: latest GPSFix or None on timeout
+        """
+        with self._fix_available:
+            self._fix_available.wait_for(lambda: self.latest_fix is not None and self.latest_fix is not newer_than,
+                                         timeout)
+            return self.latest_fix if self.latest_fix is not newer_than else None
+
+    def _stream_worker(self):
+        """
+        Feeds the incoming data to the UBX / NMEA parser and updates latest_fix for every GGA packet or NAV-PVT message
+        """
+        parser = UBXParser()
+        port = self.gps_serial_port
+        # SerialLink sizes the reads to the data rate
+        read_chunk = getattr(port, 'read_chunk', None)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.track(parser)
+        try:
+            while not self._stream_stop.is_set():
+                data = read_chunk() if read_chunk is not None else port.read(port.in_waiting or 1)
+                if data:
+                    if metrics is not None:
+                        metrics.bytes_in += len(data)
+                    for line, record in parser.feed(data):
+                        self._process_record(line, record)
+        finally:
+            if metrics is not None:
+                metrics.untrack(parser)
+
+    def _process_record(self, line, record):
+        """
+        Updates latest_fix with the decoded sentence
+        :param line: bytes of the sentence or UBX frame
+        :param record: decoded sentence or UBX message
+        """
+        if isinstance(record, RMC):
+            self.latest_rmc = record
+        elif isinstance(record, (GGA, NAVPVT)):
+            if isinstance(record, GGA):
+                fix = GPSFix(line, record, self.latest_rmc)
+            else:
+                fix = GPSFix(None, record.to_gga(), record.to_rmc(), pvt=record)
+            with self._fix_available:
+                self.latest_fix = fix
+                self.fix_count += 1
+                self._fix_available.notify_all()
+            if self.metrics is not None:
+                self.metrics.count('fixes')
+        elif isinstance(record, NAVSAT):
+            self.latest_satellites = record
+        elif isinstance(record, UBXAck):
+            with self._fix_available:
+                self._acks[record.msg_class, record.msg_id] = record
+                self._fix_available.notify_all()
+
+    def _get_fix(self):
+        """
+        Returns the GGA packet either from the stream or by reading the port
+        :return: GPSFix of the latest GGA packet or NAV-PVT message or None
+        """
+        if self.streaming:
+            return self.latest_fix
+        started = time.perf_counter() if self.metrics is not None else None
+        parser = UBXParser()
+        data = bytearray()
+        while len(data) < 500:
+            # a port with a timeout returns less, stop once nothing arrives
+            chunk = self.gps_serial_port.read(500 - len(data))
+            if not chunk:
+                break
+            data += chunk
+        fix = None
+        rmc = None
+        for line, record in parser.feed(data):
+            if isinstance(record, RMC):
+                rmc = record
+            elif isinstance(record, GGA):
+                fix = GPSFix(line, record, rmc)
+                break
+            elif isinstance(record, NAVPVT):
+                fix = GPSFix(None, record.to_gga(), record.to_rmc(), pvt=record)
+                break
+        if self.metrics is not None:
+            self.metrics.bytes_in += len(data)
+            self.metrics.collect(parser)
+            self.metrics.observe('read_fix', time.perf_counter() - started, 'timeout' if fix is None else 'ok')
+        return fix
+
+    def send_ubx(self, frame, timeout=1.0):
+        """
+        Sends a UBX CFG message and waits for its ACK, works with & without the stream
+        :param frame: bytes of the frame i.e. ubx.cfg_rate(10)
+        :param timeout: max time in secs to wait for the ACK
+        :return: True for ACK-ACK, False for ACK-NAK, None if there was no reply i.e. not a u-blox receiver
+        """
+        key = (frame[2], frame[3])
+        started = time.perf_counter()
+        with self._fix_available:
+            self._acks.pop(key, None)
+        self.gps_serial_port.write(frame)
+        if self.streaming:
+            with self._fix_available:
+                self._fix_available.wait_for(lambda: key in self._acks, timeout)
+        else:
+            self._read_until(lambda: key in self._acks, timeout)
+        with self._fix_available:
+            ack = self._acks.pop(key, None)
+        if self.metrics is not None:
+            self.metrics.bytes_out += len(frame)
+            self.metrics.observe(_MESSAGE_NAMES.get(key, 'UBX-%02X-%02X' % key), time.perf_counter() - started,
+                                 'timeout' if ack is None else 'ok' if ack.acked else 'error')
+        return None if ack is None else ack.acked
+
+    def _read_until(self, done, timeout):
+        """
+        Reads the port without the stream until done() is True or timeout secs
+        """
+        port = self.gps_serial_port
+        parser = UBXParser()
+        port_timeout = port.timeout
+        deadline = time.monotonic() + timeout
+        try:
+            while not done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                port.timeout = min(remaining, 0.1)
+                data = port.read(port.in_waiting or 1)
+                if self.metrics is not None:
+                    self.metrics.bytes_in += len(data)
+                for line, record in parser.feed(data):
+                    self._process_record(line, record)
+        finally:
+            port.timeout = port_timeout
+            if self.metrics is not None:
+                self.metrics.collect(parser)
+
+    def configure_ubx(self, rate=10, messages=('NAV-PVT',), disable_nmea=('GLL', 'GSA', 'GSV', 'VTG', 'GGA', 'RMC'),
+                      timeout=1.0):
+        """
+        Switches a u-blox receiver to high rate binary output, the unneeded NMEA sentences are turned off
+        first to free the link. Use set_baud_rate() as well, 9600 baud is too slow for 10 Hz NMEA.
+        :param rate: solutions per sec
+        :param messages: UBX messages sent with every solution i.e. ('NAV-PVT', 'NAV-SAT')
+        :param disable_nmea: NMEA sentences turned off
+        :param timeout: max time in secs to wait for the ACK of every message
+        :return: True if the receiver acknowledged every message
+        """
+        frames = [cfg_nmea(sentence, 0) for sentence in disable_nmea]
+        frames += [cfg_msg(MESSAGES[name][0], MESSAGES[name][1], 1) for name in messages]
+        frames.append(cfg_rate(rate))
+        return all([self.send_ubx(frame, timeout) for frame in frames])
+
+    def set_baud_rate(self, baud_rate, timeout=1.0):
+        """
+        Changes the baud rate of the receiver UART1 with CFG-PRT, then of the host port. UBX & NMEA stay enabled.
+        :param baud_rate: new baud rate i.e. 115200
+        :param timeout: max time in secs to wait for the ACK, sent at the old baud rate
+        :return: True for ACK-ACK, False for ACK-NAK, None if there was no reply
+        """
+        acked = self.send_ubx(cfg_prt_uart(baud_rate), timeout)
+        if acked is not False:
+            self.gps_serial_port.baudrate = baud_rate
+        return acked
 
     def get_lat_long(self):
         """
-        This function reads and process the GPGGA packet & return lat long
-        :return: tuple of lat & long
-        """
-        s = self.gps_serial_port.read(500)
-        s = s.decode('utf-8')
-        data = s.splitlines()
-        for i in range(len(data)):
-            d = data[i].split(',')
-            if d[0] == "$GPGGA" and len(d) == 15:
-                if d[2] == '' or d[4] == '':
-                    return "N/A", "N/A"
-                else:
-                    lat = float(d[2]) / 100
-                    long = float(d[4]) / 100
-                    return lat, long
+        This function reads and process the GGA packet & return lat long
+        :return: tuple of lat & long in decimal degrees, negative for S & W
+        """
+        fix = self._get_fix()
+        if fix is not None:
+            return fix.lat, fix.long
 
     def get_time(self):
         """
-        This function reads and process the GPGGA packet & return time value as hh.mm
+        This function reads and process the GGA packet & return time value as hh.mm
         :return: str time value as hh.mm
         """
-        s = self.gps_serial_port.read(500)
-        s = s.decode('utf-8')
-        data = s.splitlines()
-        for i in range(len(data)):
-            d = data[i].split(',')
-            if d[0] == "$GPGGA" and len(d) == 15:
-                if d[1] == '':
-                    return "N/A"
-                else:
-                    time_val = int(float(d[1]) / 100)
-                    time_val = time_val / 100
-                    return time_val
+        fix = self._get_fix()
+        if fix is not None:
+            return fix.time
 
     def get_quality_indicator(self):
         """
-        This function reads and process the GPGGA packet & return quality indicator
+        This function reads and process the GGA packet & return quality indicator
         :return: str value of quality indicator as below:
         1 = Uncorrected coordinate
         2 = Differentially correct coordinate (e.g., WAAS, DGPS)
         4 = RTK Fix coordinate (centimeter precision)
         5 = RTK Float (decimeter precision.
         """
-        s = self.gps_serial_port.read(500)
-        s = s.decode('utf-8')
-        data = s.splitlines()
-        for i in range(len(data)):
-            d = data[i].split(',')
-            if d[0] == "$GPGGA" and len(d) == 15:
-                return d[6]
+        fix = self._get_fix()
+        if fix is not None:
+            return fix.quality
 
     def get_no_of_satellites(self):
         """
-        This function reads and process the GPGGA packet & return no of satellite
+        This function reads and process the GGA packet & return no of satellite
         :return: str value as no of satellite
         """
-        s = self.gps_serial_port.read(500)
-        s = s.decode('utf-8')
-        data = s.splitlines()
-        for i in range(len(data)):
-            d = data[i].split(',')
-            if d[0] == "$GPGGA" and len(d) == 15:
-                return d[7]
+        fix = self._get_fix()
+        if fix is not None:
+            return fix.satellites
 
     def get_raw_data(self):
         """
-        :return: returns raw data of ggpa packet
+        :return: returns raw data of gga packet
+        """
+        fix = self._get_fix()
+        if fix is not None:
+            return fix.raw
+
+    def close(self):
         """
-        s = self.gps_serial_port.read(500)
-        s = s.decode('utf-8')
-        data = s.splitlines()
-        for i in range(len(data)):
-            d = data[i].split(',')
-            if d[0] == "$GPGGA" and len(d) == 15:
-                return d
+        Stops the stream and closes the serial port. A port opened by GPS is opened again on next use.
+        """
+        self.stop_stream()
+        self.gps_serial_port.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 if __name__ == '__main__':
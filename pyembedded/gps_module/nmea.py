@@ -0,0 +1,290 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module decodes NMEA 0183 sentences received from GPS/GNSS modules.
+Supported sentences are GGA, RMC, VTG, GSA and GSV from any talker i.e. $GP, $GN, $GL, $GA, $GB
+Sentences with a wrong *hh checksum are dropped.
+"""
+
+import datetime
+
+from pyembedded.serial_tools.framing import LineFramer
+
+
+class GGA:
+    """
+    Global positioning system fix data
+    """
+    __slots__ = ('talker', 'time', 'lat', 'long', 'quality', 'satellites', 'hdop', 'altitude', 'geoid_separation')
+
+    def __init__(self, talker, time, lat, long, quality, satellites, hdop, altitude, geoid_separation):
+        self.talker = talker
+        self.time = time
+        self.lat = lat
+        self.long = long
+        self.quality = quality
+        self.satellites = satellites
+        self.hdop = hdop
+        self.altitude = altitude
+        self.geoid_separation = geoid_separation
+
+
+class RMC:
+    """
+    Recommended minimum specific GNSS data
+    """
+    __slots__ = ('talker', 'time', 'valid', 'lat', 'long', 'speed_knots', 'course', 'date', 'magnetic_variation')
+
+    def __init__(self, talker, time, valid, lat, long, speed_knots, course, date, magnetic_variation):
+        self.talker = talker
+        self.time = time
+        self.valid = valid
+        self.lat = lat
+        self.long = long
+        self.speed_knots = speed_knots
+        self.course = course
+        self.date = date
+        self.magnetic_variation = magnetic_variation
+
+
+class VTG:
+    """
+    Course over ground and ground speed
+    """
+    __slots__ = ('talker', 'course_true', 'course_magnetic', 'speed_knots', 'speed_kmph')
+
+    def __init__(self, talker, course_true, course_magnetic, speed_knots, speed_kmph):
+        self.talker = talker
+        self.course_true = course_true
+        self.course_magnetic = course_magnetic
+        self.speed_knots = speed_knots
+        self.speed_kmph = speed_kmph
+
+
+class GSA:
+    """
+    GNSS DOP and active satellites
+    """
+    __slots__ = ('talker', 'mode', 'fix_type', 'prns', 'pdop', 'hdop', 'vdop')
+
+    def __init__(self, talker, mode, fix_type, prns, pdop, hdop, vdop):
+        self.talker = talker
+        self.mode = mode
+        self.fix_type = fix_type
+        self.prns = prns
+        self.pdop = pdop
+        self.hdop = hdop
+        self.vdop = vdop
+
+
+class GSV:
+    """
+    GNSS satellites in view. satellites is a tuple of (prn, elevation, azimuth, snr)
+    """
+    __slots__ = ('talker', 'total_messages', 'message_number', 'satellites_in_view', 'satellites')
+
+    def __init__(self, talker, total_messages, message_number, satellites_in_view, satellites):
+        self.talker = talker
+        self.total_messages = total_messages
+        self.message_number = message_number
+        self.satellites_in_view = satellites_in_view
+        self.satellites = satellites
+
+
+def checksum(data):
+    """
+    Calculates the NMEA checksum i.e. XOR of all the bytes between $ and *
+    :param data: bytes between $ and *
+    :return: int checksum
+    """
+    if not data:
+        return 0
+    # fold the whole sentence as one integer instead of looping over every byte in python
+    value = int.from_bytes(data, 'little')
+    bits = 8 << (len(data) - 1).bit_length()
+    while bits > 8:
+        bits >>= 1
+        value = (value >> bits) ^ (value & ((1 << bits) - 1))
+    return value
+
+
+def to_degrees(value, hemisphere):
+    """
+    Converts NMEA ddmm.mmmm / dddmm.mmmm value to signed decimal degrees
+    :param value: bytes/str value i.e. '4807.038'
+    :param hemisphere: N, S, E or W
+    :return: float degrees or None if empty
+    """
+    if not value:
+        return None
+    value = float(value)
+    degrees = int(value // 100)
+    degrees = degrees + (value - degrees * 100) / 60
+    if hemisphere in (b'S', b'W', 'S', 'W'):
+        return -degrees
+    return degrees
+
+
+def _time(value):
+    if len(value) < 6:
+        return None
+    microsecond = int(round(float(value[6:] or b'0') * 1000000)) if len(value) > 6 else 0
+    return datetime.time(int(value[0:2]), int(value[2:4]), int(value[4:6]), min(microsecond, 999999))
+
+
+def _date(value):
+    if len(value) != 6:
+        return None
+    year = int(value[4:6])
+    year = year + 1900 if year >= 80 else year + 2000
+    return datetime.date(year, int(value[2:4]), int(value[0:2]))
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+def _int(value):
+    return int(value) if value else None
+
+
+def _parse_gga(talker, f):
+    return GGA(talker, _time(f[1]), to_degrees(f[2], f[3]), to_degrees(f[4], f[5]), _int(f[6]), _int(f[7]),
+               _float(f[8]), _float(f[9]), _float(f[11]))
+
+
+def _parse_rmc(talker, f):
+    variation = _float(f[10]) if len(f) > 11 else None
+    if variation is not None and f[11] == b'W':
+        variation = -variation
+    return RMC(talker, _time(f[1]), f[2] == b'A', to_degrees(f[3], f[4]), to_degrees(f[5], f[6]),
+               _float(f[7]), _float(f[8]), _date(f[9]), variation)
+
+
+def _parse_vtg(talker, f):
+    return VTG(talker, _float(f[1]), _float(f[3]), _float(f[5]), _float(f[7]))
+
+
+def _parse_gsa(talker, f):
+    prns = tuple(int(prn) for prn in f[3:15] if prn)
+    return GSA(talker, f[1].decode('ascii'), _int(f[2]), prns, _float(f[15]), _float(f[16]), _float(f[17]))
+
+
+def _parse_gsv(talker, f):
+    satellites = []
+    for i in range(4, len(f) - 3, 4):
+        if f[i]:
+            satellites.append((int(f[i]), _int(f[i + 1]), _int(f[i + 2]), _int(f[i + 3])))
+    return GSV(talker, int(f[1]), int(f[2]), int(f[3]), tuple(satellites))
+
+
+# sentence type: (parser, minimum no of fields)
+SENTENCE_PARSERS = {
+    b'GGA': (_parse_gga, 15),
+    b'RMC': (_parse_rmc, 10),
+    b'VTG': (_parse_vtg, 9),
+    b'GSA': (_parse_gsa, 18),
+    b'GSV': (_parse_gsv, 4),
+}
+
+
+class NMEAError(ValueError):
+    """
+    Raised for sentences which are malformed
+    """
+
+
+class NMEAChecksumError(NMEAError):
+    """
+    Raised for sentences with wrong or missing checksum
+    """
+
+
+def parse_sentence(sentence, verify_checksum=True):
+    """
+    Decodes a single NMEA sentence
+    :param sentence: bytes of the sentence i.e. b'$GNGGA,...*47' (line ending is optional)
+    :param verify_checksum: if True, sentences with wrong or missing checksum raise NMEAError
+    :return: GGA, RMC, VTG, GSA or GSV object, None for unsupported sentences
+    """
+    if isinstance(sentence, str):
+        sentence = sentence.encode('ascii', errors='replace')
+    start = sentence.find(b'$')
+    if start == -1:
+        raise NMEAError('no sentence start')
+    star = sentence.find(b'*', start)
+    if star == -1:
+        if verify_checksum:
+            raise NMEAChecksumError('missing checksum')
+        body = sentence[start + 1:].rstrip()
+    else:
+        body = sentence[start + 1:star]
+        if verify_checksum:
+            try:
+                expected = int(sentence[star + 1:star + 3], 16)
+            except ValueError:
+                raise NMEAChecksumError('invalid checksum field')
+            if checksum(body) != expected:
+                raise NMEAChecksumError('checksum mismatch')
+    if len(body) < 5:
+        raise NMEAError('invalid address field')
+    parser = SENTENCE_PARSERS.get(body[2:5])
+    if parser is None:
+        return None
+    fields = body.split(b',')
+    if len(fields) < parser[1]:
+        raise NMEAError('too few fields in %s' % body[:5].decode('ascii', errors='replace'))
+    try:
+        return parser[0](body[0:2].decode('ascii', errors='replace'), fields)
+    except (ValueError, IndexError) as e:
+        raise NMEAError(str(e))
+
+
+class NMEAParser:
+    def __init__(self, verify_checksum=True, max_sentence_length=256):
+        """
+        Incremental parser, feed it with the bytes read from port and it returns the decoded sentences
+        :param verify_checksum: drop sentences with wrong or missing checksum
+        :param max_sentence_length: partial data longer than this without a new line is dropped
+        """
+        self.verify_checksum = verify_checksum
+        self.max_sentence_length = max_sentence_length
+        self.checksum_errors = 0
+        self.parse_errors = 0
+        self._framer = LineFramer(b'\n', max_sentence_length)
+
+    def feed(self, data):
+        """
+        :param data: bytes read from the port
+        :return: list of (sentence bytes, decoded object) for every complete supported sentence
+        """
+        records = []
+        for line in self._framer.feed(data):
+            record = self.parse(line)
+            if record is not None:
+                records.append((line, record))
+        return records
+
+    def parse(self, line):
+        """
+        Decodes one sentence and counts the errors instead of raising them
+        :param line: bytes of one sentence
+        :return: decoded object or None
+        """
+        if b'$' not in line:
+            return None
+        try:
+            return parse_sentence(line, self.verify_checksum)
+        except NMEAChecksumError:
+            self.checksum_errors += 1
+        except NMEAError:
+            self.parse_errors += 1
+        return None
@@ -0,0 +1,310 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module decodes recorded NMEA logs in bulk.
+Every GGA & RMC sentence of the log is decoded into columnar numpy arrays. Delimiters are located
+for the whole buffer at once and the fields are converted with array operations, so there is no
+python loop per line. Requires numpy (pip3 install numpy).
+
+Columns returned by decode_buffer(), decode_log() and iter_decode_log():
+    sentence:    0 for GGA, 1 for RMC
+    offset:      byte offset of the sentence in the log
+    time:        secs since midnight UTC
+    date:        datetime64[D], taken from the latest RMC sentence (NaT before the first RMC)
+    timestamp:   secs since epoch (NaN if date is not known yet)
+    lat, long:   decimal degrees, negative for S & W
+    altitude:    meters above mean sea level (GGA only)
+    quality:     fix quality indicator (GGA only, -1 if missing)
+    satellites:  no of satellites in use (GGA only, -1 if missing)
+    hdop:        horizontal dilution of precision (GGA only)
+    speed_knots: speed over ground (RMC only)
+    course:      course over ground in degrees (RMC only)
+    valid:       RMC status A, always True for GGA with quality > 0
+"""
+
+import mmap
+import os
+
+GGA = 0
+RMC = 1
+
+# minimum no of commas in a sentence for the fields used below
+_MIN_COMMAS = {GGA: 14, RMC: 10}
+
+COLUMNS = ('sentence', 'offset', 'time', 'date', 'timestamp', 'lat', 'long', 'altitude', 'quality',
+           'satellites', 'hdop', 'speed_knots', 'course', 'valid')
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for bulk NMEA decoding, install it with: pip3 install numpy')
+    return numpy
+
+
+def _hex_table(np):
+    table = np.full(256, -1, dtype=np.int16)
+    for i, c in enumerate(b'0123456789ABCDEF'):
+        table[c] = i
+    for i, c in enumerate(b'abcdef'):
+        table[c] = 10 + i
+    return table
+
+
+def _parse_numbers(np, data, starts, ends, max_width=16):
+    """
+    Converts the ascii numbers data[starts:ends] to float64 without creating python strings.
+    Loops over the character positions (at most max_width), every step works on all the fields at once.
+    :return: float64 array, NaN for empty or invalid fields
+    """
+    n = len(starts)
+    if n == 0:
+        return np.empty(0, dtype=np.float64)
+    lengths = ends - starts
+    last = len(data) - 1
+    mantissa = np.zeros(n, dtype=np.int64)
+    decimals = np.zeros(n, dtype=np.int64)
+    seen_dot = np.zeros(n, dtype=bool)
+    bad = (lengths == 0) | (lengths > max_width)
+    negative = (data[np.minimum(starts, last)] == 45) & (lengths > 0)
+    for j in range(min(max_width, int(lengths.max()))):
+        c = data[np.minimum(starts + j, last)]
+        active = j < lengths
+        digit = c.astype(np.int64) - 48
+        is_digit = (digit >= 0) & (digit <= 9) & active
+        is_dot = (c == 46) & active
+        mantissa = np.where(is_digit, mantissa * 10 + digit, mantissa)
+        decimals += is_digit & seen_dot
+        invalid = active & ~is_digit & ~is_dot
+        if j == 0:
+            invalid &= ~negative
+        bad |= invalid | (is_dot & seen_dot)
+        seen_dot |= is_dot
+    values = mantissa / np.power(10.0, decimals)
+    values = np.where(negative, -values, values)
+    values[bad] = np.nan
+    return values
+
+
+def _to_degrees(np, values, hemisphere):
+    degrees = np.floor(values / 100)
+    degrees = degrees + (values - degrees * 100) / 60
+    return np.where((hemisphere == 83) | (hemisphere == 87), -degrees, degrees)
+
+
+def _to_date(np, values):
+    values = np.where(np.isnan(values), 0, values).astype(np.int64)
+    day = values // 10000
+    month = (values // 100) % 100
+    year = values % 100
+    year = np.where(year >= 80, 1900 + year, 2000 + year)
+    ok = (day >= 1) & (day <= 31) & (month >= 1) & (month <= 12)
+    month = np.where(ok, month, 1)
+    day = np.where(ok, day, 1)
+    dates = (year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]')
+    dates = dates.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    dates[~ok] = np.datetime64('NaT')
+    return dates
+
+
+def _empty(np, n):
+    return {
+        'sentence': np.empty(n, dtype=np.uint8),
+        'offset': np.empty(n, dtype=np.int64),
+        'time': np.full(n, np.nan),
+        'date': np.full(n, np.datetime64('NaT'), dtype='datetime64[D]'),
+        'timestamp': np.full(n, np.nan),
+        'lat': np.full(n, np.nan),
+        'long': np.full(n, np.nan),
+        'altitude': np.full(n, np.nan),
+        'quality': np.full(n, -1, dtype=np.int8),
+        'satellites': np.full(n, -1, dtype=np.int16),
+        'hdop': np.full(n, np.nan),
+        'speed_knots': np.full(n, np.nan),
+        'course': np.full(n, np.nan),
+        'valid': np.zeros(n, dtype=bool),
+    }
+
+
+def decode_buffer(buffer, verify_checksum=True, base_offset=0, initial_date=None):
+    """
+    Decodes all GGA & RMC sentences of a buffer
+    :param buffer: bytes, bytearray, mmap or memoryview with the NMEA log
+    :param verify_checksum: drop sentences with wrong or missing checksum
+    :param base_offset: added to the offset column, used when decoding a log in chunks
+    :param initial_date: numpy.datetime64 date used for the sentences before the first RMC
+    :return: dict of column name: numpy array, see COLUMNS
+    """
+    np = _numpy()
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return _empty(np, 0)
+
+    # one pass over the buffer per delimiter, everything else works on these positions
+    ends = np.flatnonzero(data == 10)
+    if data[-1] != 10:
+        ends = np.append(ends, len(data))
+    line_starts = np.concatenate(([0], ends[:-1] + 1))
+    dollars = np.flatnonzero(data == 36)
+    stars = np.flatnonzero(data == 42)
+    commas = np.flatnonzero(data == 44)
+
+    i = np.searchsorted(dollars, line_starts)
+    has_dollar = i < len(dollars)
+    starts = dollars[np.minimum(i, len(dollars) - 1)] if len(dollars) else line_starts
+    keep = has_dollar & (starts + 6 < ends)
+    starts, ends = starts[keep], ends[keep]
+
+    last = len(data) - 1
+    t0 = data[np.minimum(starts + 3, last)]
+    t1 = data[np.minimum(starts + 4, last)]
+    t2 = data[np.minimum(starts + 5, last)]
+    is_gga = (t0 == 71) & (t1 == 71) & (t2 == 65)
+    is_rmc = (t0 == 82) & (t1 == 77) & (t2 == 67)
+    keep = is_gga | is_rmc
+    starts, ends, is_gga = starts[keep], ends[keep], is_gga[keep]
+
+    i = np.searchsorted(stars, starts)
+    star = stars[np.minimum(i, len(stars) - 1)] if len(stars) else ends
+    has_star = (i < len(stars)) & (star < ends)
+    # sentence body ends at * or at the end of line if there is no checksum
+    body_end = np.where(has_star, star, ends)
+    if verify_checksum:
+        keep = has_star & (star + 2 < ends) & (star > starts + 1)
+        starts, ends, is_gga, star = starts[keep], ends[keep], is_gga[keep], star[keep]
+        body_end = star
+        if len(starts):
+            bounds = np.empty(2 * len(starts), dtype=np.int64)
+            bounds[0::2] = starts + 1
+            bounds[1::2] = star
+            calculated = np.bitwise_xor.reduceat(data, bounds)[0::2]
+            hex_table = _hex_table(np)
+            expected = hex_table[data[star + 1]] * 16 + hex_table[data[star + 2]]
+            keep = calculated == expected
+            starts, ends, is_gga, body_end = starts[keep], ends[keep], is_gga[keep], body_end[keep]
+
+    first_comma = np.searchsorted(commas, starts)
+    no_of_commas = np.searchsorted(commas, body_end) - first_comma
+    keep = np.where(is_gga, no_of_commas >= _MIN_COMMAS[GGA], no_of_commas >= _MIN_COMMAS[RMC])
+    starts, is_gga, first_comma, body_end = starts[keep], is_gga[keep], first_comma[keep], body_end[keep]
+
+    n = len(starts)
+    result = _empty(np, n)
+    result['sentence'][:] = np.where(is_gga, GGA, RMC)
+    result['offset'][:] = starts + base_offset
+
+    def field(rows, k):
+        # field k (1 based) lies between comma k-1 and comma k
+        c = first_comma[rows]
+        return commas[c + k - 1] + 1, commas[c + k]
+
+    def number(rows, k):
+        field_start, field_end = field(rows, k)
+        return _parse_numbers(np, data, field_start, field_end)
+
+    def char(rows, k):
+        field_start, field_end = field(rows, k)
+        return np.where(field_end > field_start, data[np.minimum(field_start, last)], 0)
+
+    for kind, rows in ((GGA, np.flatnonzero(is_gga)), (RMC, np.flatnonzero(~is_gga))):
+        if not len(rows):
+            continue
+        lat_k = 2 if kind == GGA else 3
+        tod = number(rows, 1)
+        result['time'][rows] = np.floor(tod / 10000) * 3600 + (np.floor(tod / 100) % 100) * 60 + tod % 100
+        result['lat'][rows] = _to_degrees(np, number(rows, lat_k), char(rows, lat_k + 1))
+        result['long'][rows] = _to_degrees(np, number(rows, lat_k + 2), char(rows, lat_k + 3))
+        if kind == GGA:
+            quality = number(rows, 6)
+            satellites = number(rows, 7)
+            result['quality'][rows] = np.where(np.isnan(quality), -1, quality)
+            result['satellites'][rows] = np.where(np.isnan(satellites), -1, satellites)
+            result['hdop'][rows] = number(rows, 8)
+            result['altitude'][rows] = number(rows, 9)
+            result['valid'][rows] = quality > 0
+        else:
+            result['valid'][rows] = char(rows, 2) == 65
+            result['speed_knots'][rows] = number(rows, 7)
+            result['course'][rows] = number(rows, 8)
+            result['date'][rows] = _to_date(np, number(rows, 9))
+
+    # GGA has no date, carry the date of the latest RMC forward
+    has_date = ~np.isnat(result['date'])
+    latest = np.maximum.accumulate(np.where(has_date, np.arange(n), -1)) if n else np.empty(0, dtype=np.int64)
+    known = latest >= 0
+    result['date'][known] = result['date'][latest[known]]
+    if initial_date is not None and not np.isnat(initial_date):
+        result['date'][~known] = initial_date
+        known[:] = True
+    seconds = result['date'][known].astype('datetime64[s]').astype(np.int64)
+    result['timestamp'][known] = seconds + result['time'][known]
+    return result
+
+
+def decode_log(path, verify_checksum=True):
+    """
+    Memory maps the log file and decodes all GGA & RMC sentences
+    :param path: path of the NMEA log file
+    :param verify_checksum: drop sentences with wrong or missing checksum
+    :return: dict of column name: numpy array, see COLUMNS
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return _empty(_numpy(), 0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return decode_buffer(mm, verify_checksum)
+
+
+def iter_decode_log(path, chunk_size=64 * 1024 * 1024, verify_checksum=True):
+    """
+    Decodes the log file chunk by chunk so that files larger than RAM can be processed.
+    Chunks are split on line endings, so no sentence is lost between two chunks.
+    :param path: path of the NMEA log file
+    :param chunk_size: approx no of bytes decoded at once
+    :param verify_checksum: drop sentences with wrong or missing checksum
+    :return: generator of dict of column name: numpy array, see COLUMNS
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            date = None
+            while pos < size:
+                end = min(pos + chunk_size, size)
+                if end < size:
+                    newline = mm.rfind(b'\n', pos, end)
+                    if newline != -1:
+                        end = newline + 1
+                view = memoryview(mm)[pos:end]
+                try:
+                    chunk = decode_buffer(view, verify_checksum, base_offset=pos, initial_date=date)
+                finally:
+                    view.release()
+                if len(chunk['date']):
+                    date = chunk['date'][-1]
+                yield chunk
+                pos = end
+
+
+def concatenate(chunks):
+    """
+    Joins the chunks returned by iter_decode_log() into a single set of columns
+    :param chunks: iterable of dict of column name: numpy array
+    :return: dict of column name: numpy array
+    """
+    np = _numpy()
+    chunks = list(chunks)
+    if not chunks:
+        return _empty(np, 0)
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
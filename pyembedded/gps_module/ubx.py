@@ -0,0 +1,416 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module decodes the u-blox UBX binary protocol, used for 10-25 Hz navigation where NMEA text
+saturates the serial link. NAV-PVT, NAV-SAT and ACK messages are decoded, frames with a wrong
+Fletcher checksum are dropped. UBXParser splits a port carrying both UBX and NMEA, so the receiver
+can be switched over with the CFG-PRT, CFG-RATE & CFG-MSG messages built here.
+"""
+
+import datetime
+import operator
+import struct
+
+from pyembedded.gps_module.nmea import GGA, RMC, NMEAParser
+
+SYNC = b'\xb5\x62'
+
+# message classes
+NAV = 0x01
+ACK = 0x05
+CFG = 0x06
+NMEA_STD = 0xF0
+# classes a frame may start with, anything else after the sync chars is line noise
+UBX_CLASSES = frozenset((0x01, 0x02, 0x04, 0x05, 0x06, 0x09, 0x0A, 0x0B, 0x0D, 0x10, 0x13, 0x21, 0x27, 0x28))
+
+# message name: (class, id)
+MESSAGES = {
+    'NAV-PVT': (NAV, 0x07),
+    'NAV-SAT': (NAV, 0x35),
+    'ACK-NAK': (ACK, 0x00),
+    'ACK-ACK': (ACK, 0x01),
+    'CFG-PRT': (CFG, 0x00),
+    'CFG-MSG': (CFG, 0x01),
+    'CFG-RATE': (CFG, 0x08),
+}
+
+# NMEA sentences which can be turned on & off with CFG-MSG
+NMEA_MESSAGES = {'GGA': 0x00, 'GLL': 0x01, 'GSA': 0x02, 'GSV': 0x03, 'RMC': 0x04, 'VTG': 0x05, 'GRS': 0x06,
+                 'GST': 0x07, 'ZDA': 0x08, 'GBS': 0x09, 'DTM': 0x0A}
+
+# CFG-PRT protocol masks
+PROTOCOL_UBX = 0x01
+PROTOCOL_NMEA = 0x02
+PROTOCOL_RTCM3 = 0x20
+
+# NAV-PVT fix types
+FIX_NONE = 0
+FIX_DEAD_RECKONING = 1
+FIX_2D = 2
+FIX_3D = 3
+FIX_GNSS_DEAD_RECKONING = 4
+FIX_TIME_ONLY = 5
+
+# NAV-PVT up to pDOP, the rest of the 92 bytes is not used
+_NAV_PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH')
+_NAV_PVT_LENGTH = 92
+_NAV_SAT_HEADER = struct.Struct('<IBB2x')
+_NAV_SAT_BLOCK = struct.Struct('<BBBbhhI')
+_HEADER = struct.Struct('<BBH')
+_CFG_PRT = struct.Struct('<BBHIIHHHH')
+_CFG_RATE = struct.Struct('<HHH')
+_CFG_MSG = struct.Struct('<BBB')
+# 8 data bits, no parity, 1 stop bit
+_UART_8N1 = 0x08D0
+
+
+class UBXError(ValueError):
+    """
+    Raised for frames which are malformed
+    """
+
+
+class UBXChecksumError(UBXError):
+    """
+    Raised for frames with wrong checksum
+    """
+
+
+class UBXMessage:
+    """
+    Message without a decoder, payload is kept as bytes
+    """
+    __slots__ = ('msg_class', 'msg_id', 'payload')
+
+    def __init__(self, msg_class, msg_id, payload):
+        self.msg_class = msg_class
+        self.msg_id = msg_id
+        self.payload = payload
+
+
+class UBXAck:
+    """
+    ACK-ACK or ACK-NAK of a CFG message
+    """
+    __slots__ = ('msg_class', 'msg_id', 'acked')
+
+    def __init__(self, msg_class, msg_id, acked):
+        self.msg_class = msg_class
+        self.msg_id = msg_id
+        self.acked = acked
+
+
+class NAVPVT:
+    """
+    Navigation position velocity time solution
+    """
+    __slots__ = ('itow', 'time', 'fix_type', 'fix_ok', 'differential', 'carrier_solution', 'satellites', 'lat',
+                 'long', 'height', 'altitude', 'h_acc', 'v_acc', 'vel_n', 'vel_e', 'vel_d', 'speed', 'heading',
+                 'speed_acc', 'heading_acc', 'pdop')
+
+    def __init__(self, itow, time, fix_type, fix_ok, differential, carrier_solution, satellites, lat, long, height,
+                 altitude, h_acc, v_acc, vel_n, vel_e, vel_d, speed, heading, speed_acc, heading_acc, pdop):
+        """
+        Units are degrees, meters, m/s and secs
+        :param time: UTC datetime, None until the receiver has a valid date & time
+        :param carrier_solution: 0 none, 1 RTK float, 2 RTK fixed
+        """
+        self.itow = itow
+        self.time = time
+        self.fix_type = fix_type
+        self.fix_ok = fix_ok
+        self.differential = differential
+        self.carrier_solution = carrier_solution
+        self.satellites = satellites
+        self.lat = lat
+        self.long = long
+        self.height = height
+        self.altitude = altitude
+        self.h_acc = h_acc
+        self.v_acc = v_acc
+        self.vel_n = vel_n
+        self.vel_e = vel_e
+        self.vel_d = vel_d
+        self.speed = speed
+        self.heading = heading
+        self.speed_acc = speed_acc
+        self.heading_acc = heading_acc
+        self.pdop = pdop
+
+    @property
+    def quality(self):
+        """
+        :return: GGA quality indicator of the solution
+        """
+        if not self.fix_ok or self.fix_type in (FIX_NONE, FIX_TIME_ONLY):
+            return 0
+        if self.fix_type == FIX_DEAD_RECKONING:
+            return 6
+        if self.carrier_solution == 2:
+            return 4
+        if self.carrier_solution == 1:
+            return 5
+        return 2 if self.differential else 1
+
+    def to_gga(self):
+        """
+        :return: nmea.GGA with the same solution, so it can be used where a GGA sentence is expected
+        """
+        has_fix = self.quality != 0
+        return GGA('UBX', None if self.time is None else self.time.time(), self.lat if has_fix else None,
+                   self.long if has_fix else None, self.quality, self.satellites, None,
+                   self.altitude if has_fix else None, self.height - self.altitude if has_fix else None)
+
+    def to_rmc(self):
+        """
+        :return: nmea.RMC with the same solution
+        """
+        return RMC('UBX', None if self.time is None else self.time.time(), self.fix_ok, self.lat, self.long,
+                   self.speed * 3600 / 1852, self.heading, None if self.time is None else self.time.date(), None)
+
+
+class NAVSAT:
+    """
+    Satellites in view. satellites is a tuple of (gnss_id, sv_id, cno, elevation, azimuth, used)
+    """
+    __slots__ = ('itow', 'satellites')
+
+    def __init__(self, itow, satellites):
+        self.itow = itow
+        self.satellites = satellites
+
+
+def fletcher_checksum(data):
+    """
+    Calculates the 8-bit Fletcher checksum of UBX frames
+    :param data: bytes from the class byte up to the end of the payload
+    :return: tuple of ck_a & ck_b
+    """
+    # ck_b is the sum of the running ck_a, i.e. every byte weighted by its distance from the end
+    return sum(data) & 0xFF, sum(map(operator.mul, data, range(len(data), 0, -1))) & 0xFF
+
+
+def build_message(msg_class, msg_id, payload=b''):
+    """
+    :param msg_class: message class i.e. CFG
+    :param msg_id: message id
+    :param payload: bytes of the payload
+    :return: bytes of the frame with sync chars & checksum
+    """
+    body = _HEADER.pack(msg_class, msg_id, len(payload)) + payload
+    return SYNC + body + bytes(fletcher_checksum(body))
+
+
+def cfg_rate(rate=1.0, nav_rate=1, time_ref=1):
+    """
+    CFG-RATE sets how often the receiver computes & outputs a solution
+    :param rate: solutions per sec i.e. 10 for 10 Hz
+    :param nav_rate: no of measurements per navigation solution
+    :param time_ref: 0 for UTC, 1 for GPS time aligned measurements
+    :return: bytes of the frame
+    """
+    return build_message(CFG, 0x08, _CFG_RATE.pack(int(round(1000 / rate)), nav_rate, time_ref))
+
+
+def cfg_msg(msg_class, msg_id, rate):
+    """
+    CFG-MSG sets the output rate of a message on the port it is sent on
+    :param rate: message is sent once every rate solutions, 0 turns it off
+    :return: bytes of the frame
+    """
+    return build_message(CFG, 0x01, _CFG_MSG.pack(msg_class, msg_id, rate))
+
+
+def cfg_nmea(sentence, rate):
+    """
+    :param sentence: NMEA sentence i.e. 'GSV'
+    :param rate: sentence is sent once every rate solutions, 0 turns it off
+    :return: bytes of the CFG-MSG frame
+    """
+    return cfg_msg(NMEA_STD, NMEA_MESSAGES[sentence], rate)
+
+
+def cfg_prt_uart(baud_rate, in_protocols=PROTOCOL_UBX | PROTOCOL_NMEA, out_protocols=PROTOCOL_UBX | PROTOCOL_NMEA,
+                 port_id=1):
+    """
+    CFG-PRT sets the baud rate and the protocols of an uart port, 8N1.
+    The receiver switches after the ACK is sent, the host port must be switched to the new baud rate
+    :param baud_rate: new baud rate i.e. 115200
+    :param in_protocols: PROTOCOL_* mask accepted by the receiver
+    :param out_protocols: PROTOCOL_* mask sent by the receiver
+    :param port_id: 1 for UART1, 2 for UART2
+    :return: bytes of the frame
+    """
+    return build_message(CFG, 0x00, _CFG_PRT.pack(port_id, 0, 0, _UART_8N1, baud_rate, in_protocols, out_protocols,
+                                                  0, 0))
+
+
+def _decode_nav_pvt(payload):
+    if len(payload) < _NAV_PVT_LENGTH:
+        raise UBXError('NAV-PVT too short')
+    (itow, year, month, day, hour, minute, second, valid, t_acc, nano, fix_type, flags, flags2, satellites, lon, lat,
+     height, h_msl, h_acc, v_acc, vel_n, vel_e, vel_d, g_speed, head_mot, s_acc, head_acc,
+     pdop) = _NAV_PVT.unpack_from(payload)
+    time = None
+    # validDate & validTime
+    if valid & 0x03 == 0x03:
+        try:
+            time = datetime.datetime(year, month, day, hour, minute, second)
+            time += datetime.timedelta(microseconds=nano // 1000)
+        except ValueError:
+            pass
+    return NAVPVT(itow, time, fix_type, bool(flags & 0x01), bool(flags & 0x02), flags >> 6, satellites, lat * 1e-7,
+                  lon * 1e-7, height / 1000, h_msl / 1000, h_acc / 1000, v_acc / 1000, vel_n / 1000, vel_e / 1000,
+                  vel_d / 1000, g_speed / 1000, head_mot * 1e-5, s_acc / 1000, head_acc * 1e-5, pdop / 100)
+
+
+def _decode_nav_sat(payload):
+    if len(payload) < _NAV_SAT_HEADER.size:
+        raise UBXError('NAV-SAT too short')
+    itow, version, count = _NAV_SAT_HEADER.unpack_from(payload)
+    end = _NAV_SAT_HEADER.size + count * _NAV_SAT_BLOCK.size
+    if len(payload) < end:
+        raise UBXError('NAV-SAT too short for %d satellites' % count)
+    # flags bit 3 is svUsed
+    satellites = tuple((gnss_id, sv_id, cno, elevation, azimuth, bool(flags & 0x08))
+                       for gnss_id, sv_id, cno, elevation, azimuth, pr_res, flags
+                       in _NAV_SAT_BLOCK.iter_unpack(payload[_NAV_SAT_HEADER.size:end]))
+    return NAVSAT(itow, satellites)
+
+
+def _decode_ack(acked):
+    def decode(payload):
+        if len(payload) < 2:
+            raise UBXError('ACK too short')
+        return UBXAck(payload[0], payload[1], acked)
+    return decode
+
+
+# (class, id): decoder of the payload
+DECODERS = {
+    (NAV, 0x07): _decode_nav_pvt,
+    (NAV, 0x35): _decode_nav_sat,
+    (ACK, 0x00): _decode_ack(False),
+    (ACK, 0x01): _decode_ack(True),
+}
+
+
+def parse_message(frame, verify_checksum=True):
+    """
+    Decodes a single UBX frame
+    :param frame: bytes or memoryview of the frame starting with the sync chars
+    :param verify_checksum: if True, frames with wrong checksum raise UBXChecksumError
+    :return: NAVPVT, NAVSAT, UBXAck or UBXMessage for messages without a decoder
+    """
+    frame = memoryview(frame)
+    if len(frame) < 8 or frame[:2] != SYNC:
+        raise UBXError('no frame start')
+    msg_class, msg_id, length = _HEADER.unpack_from(frame, 2)
+    if len(frame) < length + 8:
+        raise UBXError('frame shorter than its length')
+    if verify_checksum and fletcher_checksum(frame[2:6 + length]) != (frame[6 + length], frame[7 + length]):
+        raise UBXChecksumError('checksum mismatch')
+    payload = frame[6:6 + length]
+    decoder = DECODERS.get((msg_class, msg_id))
+    if decoder is None:
+        return UBXMessage(msg_class, msg_id, payload.tobytes())
+    try:
+        return decoder(payload)
+    except struct.error as e:
+        raise UBXError(str(e))
+
+
+class UBXParser:
+    def __init__(self, verify_checksum=True, max_payload_length=4096, nmea_parser=None):
+        """
+        Incremental parser of a port carrying both UBX & NMEA, feed it with the bytes read from port
+        :param verify_checksum: drop frames & sentences with wrong checksum
+        :param max_payload_length: frames announcing a longer payload are treated as line noise
+        :param nmea_parser: NMEAParser decoding the sentences between the frames, a default one if None
+        """
+        self.verify_checksum = verify_checksum
+        self.max_payload_length = max_payload_length
+        self.nmea = NMEAParser(verify_checksum) if nmea_parser is None else nmea_parser
+        self.checksum_errors = 0
+        self.parse_errors = 0
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        :param data: bytes read from the port
+        :return: list of (frame or sentence bytes, decoded object) in the received order
+        """
+        buffer = self.buffer
+        buffer += data
+        records = []
+        pos = 0
+        # positions are searched once and again only after they are passed, so a batch is scanned in one pass
+        sync = buffer.find(SYNC)
+        dollar = buffer.find(b'$')
+        with memoryview(buffer) as view:
+            while True:
+                if sync != -1 and sync < pos:
+                    sync = buffer.find(SYNC, pos)
+                if dollar != -1 and dollar < pos:
+                    dollar = buffer.find(b'$', pos)
+                if sync != -1 and (dollar == -1 or sync < dollar):
+                    if len(buffer) - sync < 8:
+                        pos = sync
+                        break
+                    length = buffer[sync + 4] | buffer[sync + 5] << 8
+                    if buffer[sync + 2] not in UBX_CLASSES or length > self.max_payload_length:
+                        self.parse_errors += 1
+                        pos = sync + 1
+                        continue
+                    end = sync + 8 + length
+                    if end > len(buffer):
+                        pos = sync
+                        break
+                    frame = view[sync:end]
+                    pos = end
+                    try:
+                        records.append((frame.tobytes(), parse_message(frame, self.verify_checksum)))
+                    except UBXChecksumError:
+                        self.checksum_errors += 1
+                        pos = sync + 1
+                    except UBXError:
+                        self.parse_errors += 1
+                    finally:
+                        frame.release()
+                elif dollar != -1:
+                    newline = buffer.find(b'\n', dollar)
+                    if sync != -1 and (newline == -1 or sync < newline):
+                        # sentence cut by a frame
+                        self.nmea.parse_errors += 1
+                        pos = sync
+                        continue
+                    if newline == -1:
+                        if len(buffer) - dollar > self.nmea.max_sentence_length:
+                            self.nmea.parse_errors += 1
+                            pos = dollar + 1
+                            continue
+                        pos = dollar
+                        break
+                    start = buffer.rfind(b'$', dollar, newline)
+                    if start != dollar:
+                        # sentence cut by line noise, the last one up to the new line may be complete
+                        self.nmea.parse_errors += 1
+                    line = view[start:newline].tobytes()
+                    pos = newline + 1
+                    record = self.nmea.parse(line)
+                    if record is not None:
+                        records.append((line, record))
+                else:
+                    # keep a trailing first sync char, the rest is line noise
+                    pos = len(buffer) - 1 if buffer.endswith(SYNC[:1]) else len(buffer)
+                    break
+        del buffer[:pos]
+        return records
@@ -0,0 +1,182 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module is the asyncio interface of the gsm module.
+Every command is a coroutine, so many modems can be driven from a single event loop.
+"""
+
+import asyncio
+
+from pyembedded.gsm_module.at_command import ATResponseCollector, SMS_SEND_TIMEOUT, get_command_timeout
+from pyembedded.serial_tools.async_serial import AsyncSerial
+from pyembedded.serial_tools.link import SerialLink
+
+
+class AsyncGSM:
+    def __init__(self, port, baud_rate, serial_port=None):
+        """
+        Initialize the serial communication port to access gsm module.
+        Must be created from a running event loop.
+        :param port: port to be used for serial communication.
+                    Use COM1, COM2, COM3 etc in case of windows
+                    Use /dev/ttyUSB0 etc in case of linux based devices
+        :param baud_rate: Set the appropriate baud rate.
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        """
+        # timeouts of the protocol, the port is opened again by AsyncSerial from the executor
+        self.gsm_serial_port = AsyncSerial(SerialLink(port, baud_rate, 'at', reopen_timeout=0)
+                                          if serial_port is None else serial_port)
+        self.ongoing_call = False
+        self.default_timeout = 5
+        self._lock = asyncio.Lock()
+
+    async def execute(self, command, timeout=None, prompt=False):
+        """
+        Sends the command and waits for the final result code
+        :param command: AT command without the trailing carriage return i.e. 'AT+CSQ'
+        :param timeout: timeout in secs, if None the timeout is picked from COMMAND_TIMEOUTS
+        :param prompt: True if the command is answered with the > prompt i.e. AT+CMGS
+        :return: ATResponse, final is None on timeout
+        """
+        async with self._lock:
+            return await self._execute(command, timeout, prompt)
+
+    async def _execute(self, command, timeout=None, prompt=False):
+        # execute() without taking the lock, for sequences which hold it already
+        if timeout is None:
+            timeout = get_command_timeout(command, self.default_timeout)
+        self.gsm_serial_port.discard()
+        self.gsm_serial_port.write(bytes(command + '\r', 'utf-8'))
+        return await self._read_response(ATResponseCollector(command, prompt), timeout)
+
+    async def send_data(self, data, timeout=SMS_SEND_TIMEOUT, command=None):
+        """
+        Writes raw data after a > prompt i.e. sms body terminated by ctrl+z
+        :param data: str or bytes to be written
+        :param timeout: timeout in secs
+        :param command: command the data belongs to, used to filter the echo
+        :return: ATResponse
+        """
+        async with self._lock:
+            return await self._send_data(data, timeout, command)
+
+    async def _send_data(self, data, timeout=SMS_SEND_TIMEOUT, command=None):
+        # send_data() without taking the lock
+        if isinstance(data, str):
+            data = bytes(data, 'utf-8')
+        self.gsm_serial_port.write(data)
+        return await self._read_response(ATResponseCollector(command), timeout)
+
+    async def _read_response(self, collector, timeout):
+        """
+        Feeds the received data to the collector until the response is complete or timeout
+        :return: ATResponse
+        """
+        async def collect():
+            while not collector.feed(await self.gsm_serial_port.read()):
+                pass
+
+        try:
+            await asyncio.wait_for(collect(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return collector.response()
+
+    async def modem_active(self):
+        """
+        :return: True if modem responds with OK or else False
+        """
+        return (await self.execute('AT')).ok
+
+    async def get_signal_strength(self):
+        """
+        This function runs command AT+CSQ
+        :return: returns tuple of signal strength
+        """
+        csq_res = await self.execute('AT+CSQ')
+        csq = csq_res.get_line('+CSQ:')
+        if csq_res.ok and csq is not None:
+            signal = int(csq.split(',')[0].strip())
+            if signal >= 20:
+                return "Excellent", signal
+            else:
+                return "Poor", signal
+
+    async def make_call(self, number):
+        """
+        :param number: phone number to dial
+        :return: True if call was made successfully or else False
+        """
+        if (await self.execute('ATD' + number + ';')).ok:
+            self.ongoing_call = True
+            return True
+        return False
+
+    async def end_ongoing_call(self):
+        """
+        :return: True if call was canceled or else False in tuple
+        """
+        if not self.ongoing_call:
+            return False, "No Ongoing Call"
+        if (await self.execute('ATH')).ok:
+            self.ongoing_call = False
+            return True, "Call Cancelled"
+        return False, "Error"
+
+    async def send_sms(self, number, message):
+        """
+        :param number: phone number on which sms will be sent
+        :param message: sms content
+        :return: tuple of sms status
+        """
+        text_mode_res = await self.execute('AT+CMGF=1')
+        if not text_mode_res.ok:
+            return False, "Unable to activate sms text mode", text_mode_res.raw
+        # no other command may get between the prompt and the body, it would be sent as part of the message
+        async with self._lock:
+            prompt_res = await self._execute('AT+CMGS="' + number + '"', prompt=True)
+            if not prompt_res.ok:
+                if prompt_res.timed_out:
+                    # leave the message input mode in case the prompt arrives late
+                    await self._send_data(chr(27), timeout=1)
+                return False, "Message not sent", prompt_res.raw
+            sms_res = await self._send_data(message + chr(26), command=message + chr(26))
+        if sms_res.ok:
+            return True, "Message sent", sms_res.raw
+        return False, "Message not sent", sms_res.raw
+
+    async def read_all_sms(self):
+        """
+        :return: tuple of status & raw response of AT+CMGL="ALL"
+        """
+        read_sms_res = await self.execute('AT+CMGL="ALL"')
+        return read_sms_res.ok, read_sms_res.raw
+
+    async def read_sms_by_msg_id(self, msg_id):
+        """
+        :param msg_id: which msg to read i.e. 1 being the 1st msg in memory
+        :return: tuple of status & raw response of AT+CMGR
+        """
+        msg_res = await self.execute("AT+CMGR=" + str(msg_id))
+        return msg_res.ok, msg_res.raw
+
+    def close(self):
+        """
+        Closes the serial port
+        """
+        self.gsm_serial_port.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
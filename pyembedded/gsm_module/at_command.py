@@ -0,0 +1,430 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module sends AT commands to a modem and collects the response.
+Instead of sleeping for a fixed time, the response is read until the modem
+sends a final result code (OK, ERROR, +CME ERROR, +CMS ERROR, > prompt etc)
+or the per command timeout expires.
+"""
+
+import collections
+import threading
+import time
+
+from pyembedded.serial_tools.framing import LineFramer, to_text
+
+DEFAULT_TIMEOUT = 5
+
+# Worst case time (secs) the modem may take before sending the final result code
+COMMAND_TIMEOUTS = {
+    'ATD': 30,
+    'ATH': 20,
+    'AT+CMGS': 10,
+    'AT+CMGL': 20,
+    'AT+CMGR': 10,
+    'AT+CMGD': 10,
+    'AT+COPS': 60,
+    'AT+CIICR': 85,
+    'AT+CIPSHUT': 65,
+    'AT+CIPSTART': 10,
+    'AT+CIPSEND': 10,
+    'AT+CIPCLOSE': 10,
+}
+
+# Timeout for the sms body once the > prompt was received
+SMS_SEND_TIMEOUT = 60
+
+FINAL_OK = ('OK', 'CONNECT')
+FINAL_ERROR = ('ERROR', '+CME ERROR', '+CMS ERROR', 'NO CARRIER', 'BUSY', 'NO ANSWER', 'NO DIALTONE')
+PROMPT = '>'
+
+# Unsolicited result codes, sent by the modem at any time, even in between the lines of a response.
+# +CLCC and +CPIN are also the responses of AT+CLCC & AT+CPIN?, they are unsolicited only for other commands
+URC_PREFIXES = ('+CMTI:', '+CRING:', '+CLIP:', '+CLCC:', '+CPIN:', '+CMT:', '+CDSI:', '+PDP:')
+# CLOSED is sent when the server closes the TCP connection of AT+CIPSTART
+URC_CODES = ('RING', 'CLOSED')
+
+# Call related result codes, final result codes of ATD/ATA but unsolicited when the call ends later
+CALL_COMMANDS = ('ATD', 'ATA')
+CALL_END = ('NO CARRIER', 'BUSY', 'NO ANSWER')
+
+
+def get_command_timeout(command, default=DEFAULT_TIMEOUT):
+    """
+    Returns the timeout to be used for the given command
+    :param command: AT command i.e. 'AT+CSQ', 'ATD9876543210;'
+    :param default: timeout for commands not listed in COMMAND_TIMEOUTS
+    :return: timeout in secs
+    """
+    command = command.strip().upper()
+    for prefix in sorted(COMMAND_TIMEOUTS, key=len, reverse=True):
+        if command.startswith(prefix):
+            return COMMAND_TIMEOUTS[prefix]
+    return default
+
+
+def get_response_prefix(command):
+    """
+    :param command: AT command i.e. 'AT+CSQ', 'AT+CPIN?'
+    :return: prefix of the information lines of the response i.e. '+CSQ:' or None
+    """
+    command = command.strip().upper()
+    if not command.startswith('AT+'):
+        return None
+    name = command[2:]
+    for i, char in enumerate(name[1:], 1):
+        if not char.isalnum():
+            name = name[:i]
+            break
+    return name + ':'
+
+
+def get_command_name(command):
+    """
+    :param command: AT command i.e. 'AT+CMGS="+919876543210"', 'ATD9876543210;'
+    :return: command without its parameters i.e. 'AT+CMGS', 'ATD', used to label the metrics
+    """
+    command = command.strip().upper()
+    if len(command) > 3 and command[2] in '+&^$#%*':
+        for i in range(3, len(command)):
+            if not command[i].isalnum():
+                return command[:i]
+        return command
+    return command[:3]
+
+
+def is_unsolicited(line, response_prefix=None):
+    """
+    :param line: response line without the line ending
+    :param response_prefix: prefix of the response lines of the running command, see get_response_prefix()
+    :return: True if the line is an unsolicited result code
+    """
+    if response_prefix is not None and line.startswith(response_prefix):
+        return False
+    return line in URC_CODES or line.startswith(URC_PREFIXES)
+
+
+def get_final_result(line):
+    """
+    Checks if the line is a final result code
+    :param line: response line without the line ending
+    :return: final result code or None
+    """
+    for code in FINAL_OK + FINAL_ERROR:
+        if line == code or (line.startswith(code) and line[len(code)] in ': '):
+            return code
+    return None
+
+
+class ATResponse:
+    """
+    Response of a single AT command
+    """
+    __slots__ = ('command', 'lines', 'final', 'raw', 'elapsed')
+
+    def __init__(self, command, lines, final, raw, elapsed):
+        """
+        :param command: AT command which was sent
+        :param lines: list of information lines (echo & empty lines removed)
+        :param final: final result line i.e. 'OK', '+CMS ERROR: 500', '>' or None on timeout
+        :param raw: complete decoded response as received from modem
+        :param elapsed: time taken in secs
+        """
+        self.command = command
+        self.lines = lines
+        self.final = final
+        self.raw = raw
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """
+        :return: True if modem responded with OK, CONNECT or the > prompt
+        """
+        return self.final is not None and (self.final == PROMPT or get_final_result(self.final) in FINAL_OK)
+
+    @property
+    def timed_out(self):
+        """
+        :return: True if no final result code was received before the timeout
+        """
+        return self.final is None
+
+    def get_line(self, prefix):
+        """
+        Returns value of the first information line starting with prefix
+        :param prefix: i.e. '+CSQ:'
+        :return: str value after the prefix or None
+        """
+        for line in self.lines:
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+
+    def __repr__(self):
+        return 'ATResponse(command=%r, lines=%r, final=%r)' % (self.command, self.lines, self.final)
+
+
+class ATResponseCollector:
+    """
+    Collects the response of one command from the received bytes without doing any I/O,
+    so the same logic is used by the blocking and the asyncio based interfaces
+    """
+
+    def __init__(self, command=None, prompt=False, buffer=None, results=None):
+        """
+        :param command: AT command which was sent, used to filter the echo
+        :param prompt: True if the command is answered with the > prompt
+        :param buffer: bytearray holding the received data which was not processed yet
+        :param results: tuple of line prefixes ending the response instead of the final result codes,
+                        i.e. ('SEND OK', 'SEND FAIL', 'ERROR') for the data of AT+CIPSEND
+        """
+        self.command = command
+        self.prompt = prompt
+        self.buffer = buffer if buffer is not None else bytearray()
+        self.raw = bytearray()
+        self.lines = []
+        self.unsolicited = []
+        self.final = None
+        self.results = results
+        self.started = time.monotonic()
+        self._echo = command.strip().encode('utf-8') if command else None
+        self._framer = LineFramer(b'\n', buffer=self.buffer)
+        self._response_prefix = get_response_prefix(command) if command else None
+        self._call_command = bool(command) and command.strip().upper().startswith(CALL_COMMANDS)
+        # without a command, everything received is unsolicited or left over from an earlier command
+        self._idle = command is None and not prompt and results is None
+
+    def feed(self, data=b''):
+        """
+        :param data: bytes received from the modem
+        :return: True once the final result code or the prompt was received
+        """
+        framer = self._framer
+        framer.buffer += data
+        try:
+            while self.final is None:
+                raw_line = framer.next_line()
+                if raw_line is None:
+                    if self.prompt and framer.pending.strip() == b'>':
+                        self.raw += framer.pending
+                        framer.clear()
+                        self.final = PROMPT
+                        break
+                    return False
+                self.raw += raw_line + b'\n'
+                raw_line = raw_line.strip()
+                # compare the echo before decoding, most of the received lines are echo or empty
+                if not raw_line or raw_line == self._echo:
+                    continue
+                line = to_text(raw_line)
+                if is_unsolicited(line, self._response_prefix):
+                    self.unsolicited.append(line)
+                    continue
+                if self.results is not None:
+                    if line.startswith(self.results):
+                        self.final = line
+                    else:
+                        self.lines.append(line)
+                    continue
+                final = get_final_result(line)
+                if final in CALL_END and not self._call_command:
+                    # the far end ended a call made earlier
+                    self.unsolicited.append(line)
+                elif self._idle:
+                    continue
+                elif final:
+                    self.final = line
+                else:
+                    self.lines.append(line)
+            return True
+        finally:
+            framer.compact()
+
+    def response(self):
+        """
+        :return: ATResponse of the data collected so far, final is None if it is not complete
+        """
+        return ATResponse(self.command, self.lines, self.final, to_text(self.raw), time.monotonic() - self.started)
+
+
+class ATCommandEngine:
+    def __init__(self, serial_port, default_timeout=DEFAULT_TIMEOUT, poll_interval=0.01, metrics=None):
+        """
+        Shared command/response engine for AT command based modems
+        :param serial_port: opened serial port
+        :param default_timeout: timeout in secs for commands not listed in COMMAND_TIMEOUTS
+        :param poll_interval: time in secs to wait when no data is available on port
+        :param metrics: telemetry.metrics.DeviceMetrics recording every command, None to skip it
+        """
+        self.serial_port = serial_port
+        self.metrics = metrics
+        self.default_timeout = default_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.unsolicited = collections.deque(maxlen=256)
+        self._buffer = bytearray()
+
+    def execute(self, command, timeout=None, prompt=False, results=None):
+        """
+        Sends the command and reads the response until a final result code arrives
+        :param command: AT command without the trailing carriage return i.e. 'AT+CSQ'
+        :param timeout: timeout in secs, if None the timeout is picked from COMMAND_TIMEOUTS
+        :param prompt: True if the command is answered with the > prompt i.e. AT+CMGS
+        :param results: tuple of line prefixes ending the response instead of the final result codes,
+                        for commands answered with i.e. SHUT OK
+        :return: ATResponse
+        """
+        if timeout is None:
+            timeout = get_command_timeout(command, self.default_timeout)
+        with self.lock:
+            self._discard_stale_data()
+            data = bytes(command + '\r', 'utf-8')
+            if self.metrics is None:
+                self.serial_port.write(data)
+                return self._read_response(command, timeout, prompt, results)
+            return self._timed(get_command_name(command), data, command, timeout, prompt, results)
+
+    def send_data(self, data, timeout=SMS_SEND_TIMEOUT, command=None, results=None):
+        """
+        Writes raw data after a > prompt i.e. sms body terminated by ctrl+z
+        :param data: str or bytes to be written
+        :param timeout: timeout in secs
+        :param command: command the data belongs to, used to filter the echo
+        :param results: tuple of line prefixes ending the response instead of the final result codes
+        :return: ATResponse
+        """
+        if isinstance(data, str):
+            data = bytes(data, 'utf-8')
+        with self.lock:
+            if self.metrics is None:
+                self.serial_port.write(data)
+                return self._read_response(command, timeout, False, results)
+            # the data i.e. the sms body is not used as label
+            return self._timed('data', data, command, timeout, False, results)
+
+    def _timed(self, name, data, command, timeout, prompt, results):
+        """
+        Writes data & reads the response like execute(), recording it in metrics
+        :return: ATResponse
+        """
+        started = time.perf_counter()
+        if data:
+            self.serial_port.write(data)
+        response = self._read_response(command, timeout, prompt, results)
+        self.metrics.bytes_out += len(data)
+        self.metrics.observe(name, time.perf_counter() - started,
+                             'timeout' if response.final is None else 'ok' if response.ok else 'error')
+        return response
+
+    def wait_for_result(self, results, timeout):
+        """
+        Reads lines without sending anything until one starts with results,
+        i.e. CONNECT OK which follows the OK of AT+CIPSTART
+        :param results: tuple of line prefixes
+        :param timeout: timeout in secs
+        :return: ATResponse, final is None on timeout
+        """
+        with self.lock:
+            if self.metrics is None:
+                return self._read_response(None, timeout, False, results)
+            return self._timed('wait', b'', None, timeout, False, results)
+
+    def read_data(self, header, timeout):
+        """
+        Reads one length prefixed data block, i.e. '+IPD,<length>:<data>' of the data received over TCP
+        :param header: bytes the block starts with i.e. b'+IPD,'
+        :param timeout: timeout in secs
+        :return: bytes of the data or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                buffer = self._buffer
+                start = buffer.find(header)
+                colon = buffer.find(b':', start + len(header)) if start != -1 else -1
+                if colon != -1:
+                    try:
+                        end = colon + 1 + int(buffer[start + len(header):colon])
+                    except ValueError:
+                        # not a block header, skip it
+                        del buffer[:start + len(header)]
+                        continue
+                    if len(buffer) >= end:
+                        data = bytes(buffer[colon + 1:end])
+                        del buffer[start:end]
+                        return data
+                if not self._fill(deadline):
+                    return None
+
+    def _read_unsolicited(self):
+        """
+        Processes the complete lines received while no command was running, an incomplete line is kept
+        """
+        waiting = self.serial_port.in_waiting
+        if waiting:
+            data = self.serial_port.read(waiting)
+            self._buffer += data
+            if self.metrics is not None:
+                self.metrics.bytes_in += len(data)
+        if self._buffer:
+            collector = ATResponseCollector(buffer=self._buffer)
+            collector.feed()
+            self.unsolicited.extend(collector.unsolicited)
+
+    def _discard_stale_data(self):
+        """
+        Drops everything which was received before the command was sent, except unsolicited result codes
+        """
+        self._read_unsolicited()
+        self._buffer.clear()
+
+    def poll_unsolicited(self):
+        """
+        Reads the data received while no command was running
+        :return: list of unsolicited result code lines received since the last call
+        """
+        with self.lock:
+            self._read_unsolicited()
+            lines = list(self.unsolicited)
+            self.unsolicited.clear()
+        return lines
+
+    def _read_response(self, command, timeout, prompt, results=None):
+        """
+        Reads lines until final result code, prompt or timeout
+        :return: ATResponse
+        """
+        deadline = time.monotonic() + timeout
+        collector = ATResponseCollector(command, prompt, self._buffer, results)
+        while not collector.feed():
+            if not self._fill(deadline):
+                break
+        self.unsolicited.extend(collector.unsolicited)
+        return collector.response()
+
+    def _fill(self, deadline):
+        """
+        Waits for more data from the port
+        :param deadline: time.monotonic() value after which reading is stopped
+        :return: False if the deadline passed without any data
+        """
+        while True:
+            waiting = self.serial_port.in_waiting
+            if waiting:
+                data = self.serial_port.read(waiting)
+                self._buffer += data
+                if self.metrics is not None:
+                    self.metrics.bytes_in += len(data)
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
@@ -12,21 +12,46 @@
 This module is used to interface with gsm module
 """
 
-import serial
+import csv
 import time
 
+from pyembedded.gsm_module.at_command import ATCommandEngine
+from pyembedded.gsm_module.identity import IDENTITY_COMMAND, IDENTITY_FIELDS, IdentityCache, clean_identity_line, \
+    parse_identity
+from pyembedded.gsm_module.urc import CALL_INCOMING, CALL_WAITING, parse_clcc
+from pyembedded.serial_tools.link import SerialLink
+
 
 class GSM:
-    def __init__(self, port, baud_rate):
+    def __init__(self, port, baud_rate, identity_cache=None, serial_port=None, metrics=None):
         """
         Initialize the serial communication port to access gsm module
         :param port: port to be used for serial communication.
                     Use COM1, COM2, COM3 etc in case of windows
                     Use /dev/ttyUSB0 etc in case of linux based devices
-        :param baud_rate: Set the appropriate baud rate.
+        :param baud_rate: Set the appropriate baud rate, None to detect it
+        :param identity_cache: IdentityCache or path of its json file, to keep the modem identity across restarts
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        :param metrics: telemetry.metrics.Metrics recording the latency of every AT command, bytes & timeouts
         """
-        self.gsm_serial_port = serial.Serial(port, baud_rate)
+        self.port = port
+        if isinstance(identity_cache, str):
+            identity_cache = IdentityCache(identity_cache)
+        self.identity_cache = identity_cache
+        self.identity = None
+        self.gsm_serial_port = SerialLink(port, baud_rate, 'at') if serial_port is None else serial_port
+        self.metrics = None if metrics is None else metrics.device('gsm', port)
+        self.at = ATCommandEngine(self.gsm_serial_port, metrics=self.metrics)
         self.ongoing_call = False
+        self.incoming_call = False
+        self.caller = None
+        # call id: dict of the call as reported by +CLCC, kept up to date by URCDispatcher
+        self.calls = {}
+        self.sms_text_mode = None
+        if hasattr(self.gsm_serial_port, 'on_reopen'):
+            # SerialLink opens the port again by itself after the usb serial adapter was unplugged
+            self.gsm_serial_port.on_reopen.append(self._port_reopened)
 
     def modem_active(self):
         """
@@ -35,122 +60,138 @@ class GSM:
         Else there might be some error with modem or serial communication
         :return: True if modem is active or else False
         """
-        status_cmd = 'AT\r'
-        status_cmd = bytes(status_cmd, 'utf-8')
-        self.gsm_serial_port.write(status_cmd)
-        time.sleep(1)
-        status_res = self.gsm_serial_port.read_all()
-        status_res = status_res.decode('utf-8')
-        if 'OK' in status_res:
-            return True
-        else:
-            return False
+        status_res = self.at.execute('AT')
+        return status_res.ok
 
     def get_signal_strength(self):
         """
         This function runs command AT+CSQ
         :return: returns tuple of signal strength
         """
-        csq_cmd = "AT+CSQ\r"
-        csq_cmd = bytes(csq_cmd, "utf-8")
-        self.gsm_serial_port.write(csq_cmd)
-        time.sleep(1)
-        csq_res = self.gsm_serial_port.read_all()
-        csq_res = csq_res.decode("utf-8")
-        if 'OK' in csq_res:
-            csq_res = csq_res.split(',')
-            csq_res = csq_res[0].split(':')
-            signal = int(csq_res[1].strip())
+        csq_res = self.at.execute('AT+CSQ')
+        if csq_res.ok:
+            csq = csq_res.get_line('+CSQ:')
+            if csq is None:
+                return None
+            signal = int(csq.split(',')[0].strip())
             if signal >= 20:
                 return "Excellent", signal
             else:
                 return "Poor", signal
 
-    def get_modem_manufacturer(self):
+    def _query(self, command):
         """
-        Queries command AT+CGMI
-        :return: string of modem manufacturer name
+        Runs a query command which answers with a single information line
+        :param command: AT command i.e. 'AT+CGMI'
+        :return: string of the first information line or else False
         """
-        manufacturer_cmd = 'AT+CGMI\r'
-        manufacturer_cmd = bytes(manufacturer_cmd, 'utf-8')
-        self.gsm_serial_port.write(manufacturer_cmd)
-        time.sleep(1)
-        manufacturer_res = self.gsm_serial_port.read_all()
-        manufacturer_res = manufacturer_res.decode('utf-8')
-        if 'OK' in manufacturer_res:
-            manufacturer_res = manufacturer_res.split('\r\n')
-            return manufacturer_res[1]
+        res = self.at.execute(command)
+        if res.ok and res.lines:
+            return res.lines[0]
         else:
             return False
 
+    def probe_identity(self, refresh=False):
+        """
+        Queries manufacturer, model, revision, IMEI and IMSI with one command line and caches them
+        :param refresh: query the modem even if the identity is cached
+        :return: dict with keys manufacturer, model, revision, serial_number and imsi, a value is False if
+                 the modem did not answer it i.e. IMSI without SIM
+        """
+        if self.identity is not None and not refresh:
+            return self.identity
+        if self.identity_cache is not None and not refresh:
+            self.identity = self.identity_cache.get(self.port)
+            if self.identity is not None:
+                return self.identity
+        res = self.at.execute(IDENTITY_COMMAND)
+        identity = parse_identity(res.lines) if res.ok else None
+        if identity is None:
+            # the whole line fails if one command fails i.e. AT+CIMI without SIM, so query them one by one
+            identity = {}
+            for name, command in IDENTITY_FIELDS:
+                value = self._query('AT' + command)
+                identity[name] = clean_identity_line(value) if value else False
+        self.identity = identity
+        if self.identity_cache is not None and all(identity.values()):
+            self.identity_cache.put(self.port, identity)
+        return identity
+
+    def invalidate_identity(self):
+        """
+        Drops the cached identity, i.e. when the SIM is changed or the port is reopened
+        """
+        self.identity = None
+        if self.identity_cache is not None:
+            self.identity_cache.invalidate(self.port)
+
+    def reopen(self):
+        """
+        Closes and opens the serial port again, i.e. after the usb serial adapter was unplugged.
+        The modem may have been changed or reset, so the cached identity & sms mode are dropped
+        """
+        with self.at.lock:
+            self.gsm_serial_port.close()
+            self.gsm_serial_port.open()
+            self._port_reopened()
+
+    def _port_reopened(self, port=None):
+        self.invalidate_identity()
+        self.sms_text_mode = None
+        if self.metrics is not None:
+            self.metrics.count('reopens')
+
+    def set_baud_rate(self, baud_rate, save=False):
+        """
+        Changes the baud rate of the modem with AT+IPR, then of the host port
+        :param baud_rate: new baud rate i.e. 115200 or 460800
+        :param save: store it in the modem profile with AT&W, else the modem is back at its saved rate after a reset
+        :return: True if the modem answers at the new baud rate
+        """
+        with self.at.lock:
+            if not self.at.execute('AT+IPR=%d' % baud_rate).ok:
+                return False
+            self.gsm_serial_port.baudrate = baud_rate
+            # the modem switches after sending OK
+            time.sleep(0.1)
+            if not self.modem_active():
+                return False
+            return self.at.execute('AT&W').ok if save else True
+
+    def get_modem_manufacturer(self):
+        """
+        Queries command AT+CGMI, cached after the first call
+        :return: string of modem manufacturer name
+        """
+        return self.probe_identity()['manufacturer']
+
     def get_modem_model_number(self):
         """
-        Queries command AT+CGMM
+        Queries command AT+CGMM, cached after the first call
         :return: string of modem manufacturer name
         """
-        model_cmd = 'AT+CGMM\r'
-        model_cmd = bytes(model_cmd, 'utf-8')
-        self.gsm_serial_port.write(model_cmd)
-        time.sleep(1)
-        model_res = self.gsm_serial_port.read_all()
-        model_res = model_res.decode('utf-8')
-        if 'OK' in model_res:
-            model_res = model_res.split('\r\n')
-            return model_res[1]
-        else:
-            return False
+        return self.probe_identity()['model']
 
     def get_modem_revision_number(self):
         """
-        Queries command AT+CGMR
+        Queries command AT+CGMR, cached after the first call
         :return: string of modem revision number
         """
-        revision_cmd = 'AT+CGMR\r'
-        revision_cmd = bytes(revision_cmd, 'utf-8')
-        self.gsm_serial_port.write(revision_cmd)
-        time.sleep(1)
-        revision_res = self.gsm_serial_port.read_all()
-        revision_res = revision_res.decode('utf-8')
-        if 'OK' in revision_res:
-            revision_res = revision_res.split(':')
-            revision_res = revision_res[1].split('\r\n')
-            return revision_res[0]
-        else:
-            return False
+        return self.probe_identity()['revision']
 
     def get_modem_serial_number(self):
         """
-        Queries command AT+CGSN
+        Queries command AT+CGSN, cached after the first call
         :return: string of modem serial number
         """
-        revision_cmd = 'AT+CGSN\r'
-        revision_cmd = bytes(revision_cmd, 'utf-8')
-        self.gsm_serial_port.write(revision_cmd)
-        time.sleep(1)
-        serial_res = self.gsm_serial_port.read_all()
-        serial_res = serial_res.decode('utf-8')
-        if 'OK' in serial_res:
-            serial_res = serial_res.split('\r\n')
-            return serial_res[1]
-        else:
-            return False
+        return self.probe_identity()['serial_number']
 
     def get_international_subscriber_identity(self):
         """
-        Queries command AT+CIMI
+        Queries command AT+CIMI, cached after the first call
         :return: string of modem serial number
         """
-        international_cmd = 'AT+CIMI\r'
-        international_cmd = bytes(international_cmd, 'utf-8')
-        self.gsm_serial_port.write(international_cmd)
-        time.sleep(1)
-        international_res = self.gsm_serial_port.read_all()
-        international_res = international_res.decode('utf-8')
-        if 'OK' in international_res:
-            international_res = international_res.split('\r\n')
-            return international_res[1]
-        else:
-            return False
+        return self.probe_identity()['imsi']
 
     def make_call(self, number):
         """
@@ -158,18 +199,53 @@ class GSM:
         :param number: phone number to dial
         :return: True if call was made successfully or else False
         """
-        call_cmd = 'ATD' + number + ';\r'
-        call_cmd = bytes(call_cmd, 'utf-8')
-        self.gsm_serial_port.write(call_cmd)
-        time.sleep(1)
-        call_res = self.gsm_serial_port.read_all()
-        call_res = call_res.decode('utf-8')
-        if 'OK' in call_res:
+        call_res = self.at.execute('ATD' + number + ';')
+        if call_res.ok:
             self.ongoing_call = True
             return True
         else:
             return False
 
+    def answer_call(self):
+        """
+        Answers the incoming call
+        :return: True if call was answered or else False
+        """
+        answer_res = self.at.execute('ATA')
+        if answer_res.ok:
+            self.incoming_call = False
+            self.ongoing_call = True
+            return True
+        else:
+            return False
+
+    def get_current_calls(self):
+        """
+        Queries command AT+CLCC and updates the call state
+        :return: list of dicts with keys id, direction ('MO' or 'MT'), state and number or None on error
+        """
+        clcc_res = self.at.execute('AT+CLCC')
+        if not clcc_res.ok:
+            return None
+        self.calls = {}
+        for line in clcc_res.lines:
+            if line.startswith('+CLCC:'):
+                call = parse_clcc(next(csv.reader([line[6:].strip()], skipinitialspace=True)))
+                if call is not None:
+                    self.calls[call['id']] = call
+        self.update_call_state()
+        return list(self.calls.values())
+
+    def update_call_state(self):
+        """
+        Sets ongoing_call & incoming_call from the calls reported by +CLCC
+        """
+        incoming = [call for call in self.calls.values() if call['state'] in (CALL_INCOMING, CALL_WAITING)]
+        self.incoming_call = bool(incoming)
+        self.ongoing_call = len(incoming) < len(self.calls)
+        if incoming:
+            self.caller = incoming[0]['number']
+
     def make_miss_call(self, number, timeout=3):
         """
         This will make a call to given number and will cancel it after the timeout
@@ -177,21 +253,11 @@ class GSM:
         :param timeout: time in secs
         :return: tuple of miss call status
         """
-        miss_call_cmd = 'ATD' + number + ';\r'
-        miss_call_cmd = bytes(miss_call_cmd, 'utf-8')
-        self.gsm_serial_port.write(miss_call_cmd)
-        time.sleep(1)
-        miss_call_res = self.gsm_serial_port.read_all()
-        miss_call_res = miss_call_res.decode('utf-8')
-        if 'OK' in miss_call_res:
+        miss_call_res = self.at.execute('ATD' + number + ';')
+        if miss_call_res.ok:
             time.sleep(timeout)
-            end_miss_call_cmd = 'ATH\r'
-            end_miss_call_cmd = bytes(end_miss_call_cmd, 'utf-8')
-            self.gsm_serial_port.write(end_miss_call_cmd)
-            time.sleep(1)
-            end_miss_call_res = self.gsm_serial_port.read_all()
-            end_miss_call_res = end_miss_call_res.decode('utf-8')
-            if 'OK' in end_miss_call_res:
+            end_miss_call_res = self.at.execute('ATH')
+            if end_miss_call_res.ok:
                 return True, "Call Missed"
             else:
                 return False, "Error"
@@ -206,14 +272,10 @@ class GSM:
         if not self.ongoing_call:
             return False, "No Ongoing Call"
         else:
-            end_cmd = 'ATH\r'
-            end_cmd = bytes(end_cmd, 'utf-8')
-            self.gsm_serial_port.write(end_cmd)
-            time.sleep(1)
-            end_call_res = self.gsm_serial_port.read_all()
-            end_call_res = end_call_res.decode('utf-8')
-            if 'OK' in end_call_res:
+            end_call_res = self.at.execute('ATH')
+            if end_call_res.ok:
                 self.ongoing_call = False
+                self.calls = {}
                 return True, "Call Cancelled"
             else:
                 return False, "Error"
@@ -225,45 +287,62 @@ class GSM:
         :param message: sms content
         :return: tuple of sms status
         """
-        text_mode_cmd = "AT+CMGF=1\r"
-        text_mode_cmd = bytes(text_mode_cmd, 'utf-8')
-        self.gsm_serial_port.write(text_mode_cmd)
-        time.sleep(3)
-        text_mode_res = self.gsm_serial_port.read_all()
-        text_mode_res = text_mode_res.decode("utf-8")
-        if 'OK' in text_mode_res:
-            sms_cmd = 'AT+CMGS="' + number + '"\r'
-            sms_cmd = bytes(sms_cmd, 'utf-8')
-            self.gsm_serial_port.write(sms_cmd)
-            time.sleep(3)
-            self.gsm_serial_port.reset_output_buffer()
-            time.sleep(1)
-            self.gsm_serial_port.write(str.encode(message + chr(26)))
-            time.sleep(10)
-            sms_res = self.gsm_serial_port.read_all()
-            sms_res = sms_res.decode('utf-8')
-            if 'OK' in sms_res:
-                return True, "Message sent", sms_res
+        text_mode_res = self.at.execute('AT+CMGF=1')
+        self.sms_text_mode = True if text_mode_res.ok else None
+        if text_mode_res.ok:
+            sms_res, message_reference = self.submit_sms(number, message)
+            if sms_res.ok:
+                return True, "Message sent", sms_res.raw
             else:
-                return False, "Message not sent", sms_res
+                return False, "Message not sent", sms_res.raw
         else:
-            return False, "Unable to activate sms text mode", text_mode_res
+            return False, "Unable to activate sms text mode", text_mode_res.raw
+
+    def set_sms_text_mode(self, enabled=True):
+        """
+        Switches the modem to sms text mode (AT+CMGF=1) or PDU mode (AT+CMGF=0).
+        The command is sent only if the modem is not known to be in that mode already.
+        :param enabled: True for text mode, False for PDU mode
+        :return: True if the modem is in the requested mode
+        """
+        with self.at.lock:
+            if self.sms_text_mode == enabled:
+                return True
+            res = self.at.execute('AT+CMGF=1' if enabled else 'AT+CMGF=0')
+            self.sms_text_mode = enabled if res.ok else None
+            return res.ok
+
+    def submit_sms(self, number, message):
+        """
+        Sends the sms without switching the modem to text mode, i.e. when many sms are sent back to back.
+        AT+CMGF=1 must have been sent before.
+        :param number: phone number on which sms will be sent
+        :param message: sms content
+        :return: tuple of (ATResponse, message reference as int or None)
+        """
+        with self.at.lock:
+            prompt_res = self.at.execute('AT+CMGS="' + number + '"', prompt=True)
+            if not prompt_res.ok:
+                if prompt_res.timed_out:
+                    # leave the message input mode in case the prompt arrives late
+                    self.at.send_data(chr(27), timeout=1)
+                return prompt_res, None
+            sms_res = self.at.send_data(message + chr(26), command=message + chr(26))
+        message_reference = sms_res.get_line('+CMGS:')
+        if sms_res.ok and message_reference is not None and message_reference.isdigit():
+            return sms_res, int(message_reference)
+        return sms_res, None
 
     def read_all_sms(self):
         """
         This read all sms
         :return:
         """
-        read_sms_cmd = 'AT+CMGL="ALL"\r'
-        read_sms_cmd = bytes(read_sms_cmd, 'utf-8')
-        self.gsm_serial_port.write(read_sms_cmd)
-        time.sleep(5)
-        read_sms_res = self.gsm_serial_port.read_all()
-        read_sms_res = read_sms_res.decode('utf-8')
-        if 'OK' in read_sms_res:
-            return True, read_sms_res
+        read_sms_res = self.at.execute('AT+CMGL="ALL"')
+        if read_sms_res.ok:
+            return True, read_sms_res.raw
         else:
-            return False, read_sms_res
+            return False, read_sms_res.raw
 
     def read_sms_by_msg_id(self, msg_id):
         """
@@ -271,16 +350,23 @@ class GSM:
         :param msg_id: which msg to read i.e. 1 being the 1st msg in memory
         :return: tuple of the sms content
         """
-        read_msg = "AT+CMGR=" + str(msg_id) + "\r"
-        read_msg = bytes(read_msg, 'utf-8')
-        self.gsm_serial_port.write(read_msg)
-        time.sleep(5)
-        msg_res = self.gsm_serial_port.read_all()
-        msg_res = msg_res.decode('utf-8')
-        if 'OK' in msg_res:
-            return True, msg_res
+        msg_res = self.at.execute("AT+CMGR=" + str(msg_id))
+        if msg_res.ok:
+            return True, msg_res.raw
         else:
-            return False, msg_res
+            return False, msg_res.raw
+
+    def close(self):
+        """
+        Closes the serial port. A port opened by GSM is opened again on next use.
+        """
+        self.gsm_serial_port.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 if __name__ == '__main__':
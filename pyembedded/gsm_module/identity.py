@@ -0,0 +1,105 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module probes the identity of a gsm modem (manufacturer, model, revision, IMEI, IMSI).
+All the fields are queried with one chained command line, AT+CGMI;+CGMM;+CGMR;+CGSN;+CIMI,
+and can be kept in a small json file keyed by port, so they are not queried again at every start.
+"""
+
+import os
+import threading
+import time
+
+# field name, AT command
+IDENTITY_FIELDS = (
+    ('manufacturer', '+CGMI'),
+    ('model', '+CGMM'),
+    ('revision', '+CGMR'),
+    ('serial_number', '+CGSN'),
+    ('imsi', '+CIMI'),
+)
+
+IDENTITY_COMMAND = 'AT' + ';'.join(command for _, command in IDENTITY_FIELDS)
+
+
+def clean_identity_line(line):
+    """
+    Removes the prefix some modems put before the value i.e. '+CGMR: ', 'Revision: '
+    :param line: information line
+    :return: str value
+    """
+    prefix, colon, value = line.partition(':')
+    if colon and prefix.lstrip('+').isalpha():
+        return value.strip()
+    return line.strip()
+
+
+def parse_identity(lines):
+    """
+    :param lines: information lines of the response of IDENTITY_COMMAND
+    :return: dict of field name: value or None if the no of lines does not match
+    """
+    if len(lines) != len(IDENTITY_FIELDS):
+        return None
+    return {name: clean_identity_line(line) for (name, _), line in zip(IDENTITY_FIELDS, lines)}
+
+
+class IdentityCache:
+    def __init__(self, path, max_age=None):
+        """
+        Json file keeping the identity of the modems, keyed by port
+        :param path: path of the json file
+        :param max_age: entries older than these many secs are not used, None to use them forever
+        """
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _load(self):
+        import json
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        # write to a temp file and rename, so a power cut never leaves a half written file
+        import json
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def get(self, port):
+        """
+        :param port: port of the modem i.e. /dev/ttyUSB0
+        :return: dict of identity fields or None if not cached
+        """
+        with self._lock:
+            entry = self._load().get(port)
+        if entry is None:
+            return None
+        if self.max_age is not None and time.time() - entry.get('probed_at', 0) > self.max_age:
+            return None
+        return entry.get('identity')
+
+    def put(self, port, identity):
+        with self._lock:
+            entries = self._load()
+            entries[port] = {'identity': identity, 'probed_at': time.time()}
+            self._save(entries)
+
+    def invalidate(self, port):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(port, None) is not None:
+                self._save(entries)
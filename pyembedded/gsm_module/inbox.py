@@ -0,0 +1,516 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module reads the received sms incrementally.
++CMGL & +CMGR responses are parsed into SMSMessage objects, in text mode or in PDU mode.
+PDU mode also gives the user data header, so multi part sms are joined back into one message.
+Ingested messages are kept in a sqlite index keyed by storage slot and content hash, and only
+new slots are read, either the ones announced with +CMTI or the unread ones. Parts waiting for the rest
+of their message are kept in the index too, so they survive a restart once the SIM marked them read.
+"""
+
+import collections
+import csv
+import datetime
+import hashlib
+import sqlite3
+import threading
+import time
+
+from pyembedded.gsm_module.urc import parse_urc
+
+# GSM 03.38 default alphabet
+GSM7_ALPHABET = ('@£$¥èéùìòÇ\nØø\rÅå'
+                 'Δ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ'
+                 ' !"#¤%&\'()*+,-./0123456789:;<=>?'
+                 '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§'
+                 '¿abcdefghijklmnopqrstuvwxyzäöñüà')
+# chars sent as escape (0x1B) followed by the code
+GSM7_EXTENSION = {0x0A: '\f', 0x14: '^', 0x28: '{', 0x29: '}', 0x2F: '\\', 0x3C: '[', 0x3D: '~', 0x3E: ']',
+                  0x40: '|', 0x65: '€'}
+
+# <stat> values of PDU mode and the matching text mode strings
+PDU_STATUS = {0: 'REC UNREAD', 1: 'REC READ', 2: 'STO UNSENT', 3: 'STO SENT'}
+
+ALPHABET_GSM7 = 0
+ALPHABET_8BIT = 1
+ALPHABET_UCS2 = 2
+
+
+class PDUError(ValueError):
+    pass
+
+
+class SMSMessage:
+    """
+    One received sms, or all the parts of a multi part sms joined together
+    """
+    __slots__ = ('indexes', 'status', 'sender', 'timestamp', 'text', 'reference', 'part', 'parts')
+
+    def __init__(self, indexes, status, sender, timestamp, text, reference=None, part=1, parts=1):
+        """
+        :param indexes: list of storage slots holding the message
+        :param status: 'REC UNREAD', 'REC READ', 'STO UNSENT' or 'STO SENT'
+        :param sender: phone number or alphanumeric name of the sender
+        :param timestamp: service centre timestamp as timezone aware datetime or None
+        :param text: message content
+        :param reference: concatenated sms reference no, None for a single part sms
+        :param part: part no of this part, starting from 1
+        :param parts: total no of parts
+        """
+        self.indexes = indexes
+        self.status = status
+        self.sender = sender
+        self.timestamp = timestamp
+        self.text = text
+        self.reference = reference
+        self.part = part
+        self.parts = parts
+
+    @property
+    def index(self):
+        """
+        :return: storage slot of the first part
+        """
+        return self.indexes[0] if self.indexes else None
+
+    @property
+    def complete(self):
+        return self.reference is None or len(self.indexes) == self.parts
+
+    @property
+    def content_hash(self):
+        """
+        :return: hex digest identifying the message content, same for the same sms stored in another slot
+        """
+        stamp = self.timestamp.isoformat() if self.timestamp is not None else ''
+        content = '\0'.join((self.sender or '', stamp, self.text))
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        return 'SMSMessage(indexes=%r, sender=%r, timestamp=%r, text=%r)' % (self.indexes, self.sender,
+                                                                           self.timestamp, self.text)
+
+
+def decode_gsm7(data, septets, skip=0):
+    """
+    Unpacks 7 bit packed text
+    :param data: packed bytes
+    :param septets: no of septets in data
+    :param skip: no of septets to be skipped at the start, i.e. the ones holding the user data header
+    :return: str
+    """
+    packed = int.from_bytes(data, 'little')
+    chars = []
+    escape = False
+    for i in range(skip, septets):
+        code = (packed >> (7 * i)) & 0x7F
+        if escape:
+            chars.append(GSM7_EXTENSION.get(code, ' '))
+            escape = False
+        elif code == 0x1B:
+            escape = True
+        else:
+            chars.append(GSM7_ALPHABET[code])
+    return ''.join(chars)
+
+
+def _semi_octets(data):
+    """
+    :param data: bytes of swapped BCD digits
+    :return: str of digits, the F filler is dropped
+    """
+    digits = []
+    for b in data:
+        digits.append('%X' % (b & 0x0F))
+        digits.append('%X' % (b >> 4))
+    return ''.join(digits).rstrip('F')
+
+
+def _scts(data):
+    """
+    :param data: 7 bytes of service centre timestamp
+    :return: timezone aware datetime or None if invalid
+    """
+    values = [(b & 0x0F) * 10 + (b >> 4) for b in data[:6]]
+    quarters = (data[6] & 0x07) * 10 + (data[6] >> 4)
+    if data[6] & 0x08:
+        quarters = -quarters
+    year = values[0] + (1900 if values[0] >= 90 else 2000)
+    try:
+        return datetime.datetime(year, values[1], values[2], values[3], values[4], values[5],
+                                 tzinfo=datetime.timezone(datetime.timedelta(minutes=15 * quarters)))
+    except ValueError:
+        return None
+
+
+def _address(data, pos):
+    """
+    :param data: pdu bytes
+    :param pos: offset of the address length octet
+    :return: tuple of (address str, offset after the address)
+    """
+    length, toa = data[pos], data[pos + 1]
+    pos += 2
+    size = (length + 1) // 2
+    value = data[pos:pos + size]
+    if toa & 0x70 == 0x50:
+        # alphanumeric, length is in semi octets
+        address = decode_gsm7(value, length * 4 // 7)
+    else:
+        address = _semi_octets(value)[:length]
+        if toa & 0x70 == 0x10:
+            address = '+' + address
+    return address, pos + size
+
+
+def _alphabet(dcs):
+    if dcs & 0xC0 == 0:
+        alphabet = (dcs >> 2) & 0x03
+        return ALPHABET_GSM7 if alphabet == 3 else alphabet
+    if dcs & 0xF0 == 0xF0:
+        return ALPHABET_8BIT if dcs & 0x04 else ALPHABET_GSM7
+    if dcs & 0xF0 == 0xE0:
+        return ALPHABET_UCS2
+    return ALPHABET_GSM7
+
+
+def _concat_info(header):
+    """
+    :param header: user data header without its length octet
+    :return: tuple of (reference, part, parts) or None if the sms is not a part of a concatenated sms
+    """
+    pos = 0
+    while pos + 1 < len(header):
+        iei, length = header[pos], header[pos + 1]
+        value = header[pos + 2:pos + 2 + length]
+        if iei == 0x00 and length == 3:
+            return value[0], value[2], value[1]
+        if iei == 0x08 and length == 4:
+            return value[0] << 8 | value[1], value[3], value[2]
+        pos += 2 + length
+    return None
+
+
+def decode_pdu(pdu, index=None, status=None):
+    """
+    Decodes an SMS-DELIVER or SMS-SUBMIT pdu, as listed by +CMGL & +CMGR in PDU mode
+    :param pdu: hex string of the pdu, starting with the service centre address
+    :param index: storage slot of the sms
+    :param status: status of the sms
+    :return: SMSMessage
+    """
+    try:
+        data = bytes.fromhex(pdu)
+        pos = data[0] + 1
+        first_octet = data[pos]
+        pos += 1
+        message_type = first_octet & 0x03
+        if message_type == 0:
+            sender, pos = _address(data, pos)
+            dcs = data[pos + 1]
+            timestamp = _scts(data[pos + 2:pos + 9])
+            pos += 9
+        elif message_type == 1:
+            # message reference, destination address, pid & dcs, then validity period
+            sender, pos = _address(data, pos + 1)
+            dcs = data[pos + 1]
+            pos += 2
+            validity_format = (first_octet >> 3) & 0x03
+            pos += {0: 0, 2: 1}.get(validity_format, 7)
+            timestamp = None
+        else:
+            raise PDUError('unsupported message type %d' % message_type)
+        length = data[pos]
+        user_data = data[pos + 1:]
+    except IndexError:
+        raise PDUError('truncated pdu')
+    except ValueError:
+        raise PDUError('invalid pdu %r' % pdu)
+
+    concat = None
+    header_length = 0
+    if first_octet & 0x40 and user_data:
+        header_length = user_data[0] + 1
+        concat = _concat_info(user_data[1:header_length])
+    alphabet = _alphabet(dcs)
+    if alphabet == ALPHABET_GSM7:
+        text = decode_gsm7(user_data, length, (header_length * 8 + 6) // 7)
+    else:
+        body = user_data[header_length:length]
+        if alphabet == ALPHABET_UCS2:
+            text = body.decode('utf-16-be', errors='replace')
+        else:
+            text = body.decode('latin-1')
+    indexes = [] if index is None else [index]
+    if concat is None:
+        return SMSMessage(indexes, status, sender, timestamp, text)
+    reference, part, parts = concat
+    return SMSMessage(indexes, status, sender, timestamp, text, reference, part, parts)
+
+
+def _text_timestamp(value):
+    """
+    :param value: text mode timestamp i.e. '21/10/18,10:20:30+22'
+    :return: timezone aware datetime or None if invalid
+    """
+    try:
+        stamp = datetime.datetime.strptime(value[:17], '%y/%m/%d,%H:%M:%S')
+        quarters = int(value[17:]) if len(value) > 17 else 0
+    except ValueError:
+        return None
+    return stamp.replace(tzinfo=datetime.timezone(datetime.timedelta(minutes=15 * quarters)))
+
+
+def _fields(header):
+    return next(csv.reader([header], skipinitialspace=True))
+
+
+def parse_messages(lines, pdu_mode, index=None):
+    """
+    Parses the lines of a +CMGL or +CMGR response
+    :param lines: ATResponse.lines
+    :param pdu_mode: True if the modem is in PDU mode (AT+CMGF=0)
+    :param index: storage slot of a +CMGR response, +CMGL lines carry their own
+    :return: list of SMSMessage, pdus which could not be decoded are skipped
+    """
+    messages = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if not line.startswith(('+CMGL:', '+CMGR:')):
+            continue
+        fields = _fields(line[6:].strip())
+        slot = index
+        if line.startswith('+CMGL:'):
+            slot = int(fields[0])
+            fields = fields[1:]
+        body = []
+        while i < len(lines) and not lines[i].startswith(('+CMGL:', '+CMGR:')):
+            body.append(lines[i])
+            i += 1
+        if pdu_mode:
+            status = PDU_STATUS.get(int(fields[0])) if fields[0].isdigit() else fields[0]
+            try:
+                messages.append(decode_pdu(''.join(body), slot, status))
+            except PDUError:
+                pass
+        else:
+            timestamp = _text_timestamp(fields[3]) if len(fields) > 3 else None
+            messages.append(SMSMessage([] if slot is None else [slot], fields[0], fields[1], timestamp,
+                                       '\n'.join(body)))
+    return messages
+
+
+class SMSInbox:
+    def __init__(self, gsm, index_path=':memory:', pdu_mode=True, delete_after_read=False):
+        """
+        :param gsm: GSM object
+        :param index_path: path of the sqlite database keeping the ingested messages
+        :param pdu_mode: read the sms in PDU mode, needed to join multi part sms
+        :param delete_after_read: delete the slots of a message from the SIM once it is ingested
+        """
+        self.gsm = gsm
+        self.pdu_mode = pdu_mode
+        self.delete_after_read = delete_after_read
+        self._lock = threading.Lock()
+        self._parts = {}
+        self._new_slots = collections.deque()
+        self._dispatcher = None
+        self._db = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS messages (
+            content_hash TEXT PRIMARY KEY,
+            sender TEXT,
+            timestamp TEXT,
+            text TEXT NOT NULL,
+            slots TEXT NOT NULL,
+            received REAL NOT NULL)''')
+        # content hash of the sms or of the part stored in every slot
+        self._db.execute('''CREATE TABLE IF NOT EXISTS slots (
+            slot INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL)''')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS parts (
+            sender TEXT,
+            reference INTEGER NOT NULL,
+            parts INTEGER NOT NULL,
+            part INTEGER NOT NULL,
+            slot INTEGER,
+            status TEXT,
+            timestamp TEXT,
+            text TEXT NOT NULL,
+            PRIMARY KEY (sender, reference, parts, part))''')
+        for row in self._db.execute('SELECT sender, reference, parts, part, slot, status, timestamp, text FROM parts'):
+            sender, reference, parts, part, slot, status, stamp, text = row
+            timestamp = datetime.datetime.fromisoformat(stamp) if stamp is not None else None
+            self._parts.setdefault((sender, reference, parts), {})[part] = SMSMessage(
+                [] if slot is None else [slot], status, sender, timestamp, text, reference, part, parts)
+
+    def enable_notifications(self):
+        """
+        Asks the modem to send +CMTI with the slot of every new sms
+        :return: True if the modem accepted it
+        """
+        return self.gsm.at.execute('AT+CNMI=2,1,0,0,0').ok
+
+    def sync(self, unread_only=True):
+        """
+        Lists the messages on the SIM and ingests the ones not in the index
+        :param unread_only: list only the unread messages, reading them marks them read
+        :return: list of new complete SMSMessage
+        """
+        if self.pdu_mode:
+            command = 'AT+CMGL=0' if unread_only else 'AT+CMGL=4'
+        else:
+            command = 'AT+CMGL="REC UNREAD"' if unread_only else 'AT+CMGL="ALL"'
+        with self.gsm.at.lock:
+            if not self.gsm.set_sms_text_mode(not self.pdu_mode):
+                return []
+            res = self.gsm.at.execute(command)
+            if not res.ok:
+                return []
+            messages = parse_messages(res.lines, self.pdu_mode)
+            return self._ingest([message for message in messages if not self._is_known(message)])
+
+    def attach(self, dispatcher):
+        """
+        Takes the +CMTI notifications from a URCDispatcher instead of reading them in poll()
+        :param dispatcher: URCDispatcher of the same GSM object
+        """
+        self._dispatcher = dispatcher
+        dispatcher.on('+CMTI', self._on_new_message)
+
+    def _on_new_message(self, event):
+        if event.fields and event.fields[-1].isdigit():
+            self._new_slots.append(int(event.fields[-1]))
+
+    def poll(self):
+        """
+        Reads the slots announced with +CMTI since the last call
+        :return: list of new complete SMSMessage
+        """
+        if self._dispatcher is None:
+            for line in self.gsm.at.poll_unsolicited():
+                if line.startswith('+CMTI:'):
+                    self._on_new_message(parse_urc(line))
+        messages = []
+        while self._new_slots:
+            messages.extend(self.read_slot(self._new_slots.popleft()))
+        return messages
+
+    def read_slot(self, slot):
+        """
+        Reads one storage slot and ingests its message
+        :param slot: storage slot i.e. 1 being the 1st msg in memory
+        :return: list of new complete SMSMessage, empty if the sms is one part of an incomplete multi part sms
+        """
+        with self.gsm.at.lock:
+            if not self.gsm.set_sms_text_mode(not self.pdu_mode):
+                return []
+            res = self.gsm.at.execute('AT+CMGR=' + str(slot))
+            if not res.ok:
+                return []
+            return self._ingest(parse_messages(res.lines, self.pdu_mode, slot))
+
+    def messages(self, limit=100):
+        """
+        :param limit: max no of messages returned
+        :return: list of (sender, timestamp iso string, text) of the ingested messages, latest first
+        """
+        with self._lock:
+            return self._db.execute('SELECT sender, timestamp, text FROM messages ORDER BY received DESC LIMIT ?',
+                                    (limit,)).fetchall()
+
+    @property
+    def pending_parts(self):
+        """
+        :return: no of parts waiting for the rest of their multi part sms
+        """
+        return sum(len(parts) for parts in self._parts.values())
+
+    def _is_known(self, message):
+        with self._lock:
+            row = self._db.execute('SELECT content_hash FROM slots WHERE slot = ?', (message.index,)).fetchone()
+        return row is not None and row[0] == message.content_hash
+
+    def _ingest(self, messages):
+        """
+        Joins the parts of multi part sms and stores the complete messages in the index
+        :return: list of complete messages not seen before
+        """
+        complete = []
+        # (complete message or None, list of its parts), every slot is known by the hash of the part it holds
+        ingested = []
+        for message in messages:
+            if message.reference is None:
+                complete.append(message)
+                ingested.append((message, [message]))
+                continue
+            key = (message.sender, message.reference, message.parts)
+            parts = self._parts.setdefault(key, {})
+            parts[message.part] = message
+            if len(parts) < message.parts:
+                ingested.append((None, [message]))
+                continue
+            del self._parts[key]
+            ordered = [parts[i] for i in sorted(parts)]
+            joined = SMSMessage([slot for part in ordered for slot in part.indexes], ordered[0].status,
+                                message.sender, ordered[0].timestamp, ''.join(p.text for p in ordered),
+                                message.reference, 1, message.parts)
+            complete.append(joined)
+            ingested.append((joined, ordered))
+
+        new_messages = []
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                for message, parts in ingested:
+                    self._db.executemany('INSERT OR REPLACE INTO slots (slot, content_hash) VALUES (?, ?)',
+                                         [(slot, part.content_hash) for part in parts for slot in part.indexes])
+                    if message is None:
+                        part = parts[0]
+                        self._db.execute(
+                            'INSERT OR REPLACE INTO parts (sender, reference, parts, part, slot, status, timestamp, '
+                            'text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (part.sender, part.reference, part.parts, part.part, part.index, part.status,
+                             part.timestamp.isoformat() if part.timestamp is not None else None, part.text))
+                        continue
+                    if message.reference is not None:
+                        self._db.execute('DELETE FROM parts WHERE sender IS ? AND reference = ? AND parts = ?',
+                                         (message.sender, message.reference, message.parts))
+                    content_hash = message.content_hash
+                    stamp = message.timestamp.isoformat() if message.timestamp is not None else None
+                    cursor = self._db.execute(
+                        'INSERT OR IGNORE INTO messages (content_hash, sender, timestamp, text, slots, received) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (content_hash, message.sender, stamp, message.text, ','.join(map(str, message.indexes)), now))
+                    if cursor.rowcount:
+                        new_messages.append(message)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        if self.delete_after_read:
+            # parts of an incomplete sms stay on the SIM until the rest of the sms arrived
+            for message in complete:
+                self._delete(message.indexes)
+        return new_messages
+
+    def _delete(self, slots):
+        for slot in slots:
+            if self.gsm.at.execute('AT+CMGD=' + str(slot)).ok:
+                with self._lock:
+                    self._db.execute('DELETE FROM slots WHERE slot = ?', (slot,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
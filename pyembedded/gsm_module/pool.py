@@ -0,0 +1,308 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module spreads the work over many gsm modems.
+Every modem has its own worker thread and task queue, so the modems work in parallel.
+A task goes to the healthy modem with the least pending tasks, weighted by its signal strength (CSQ),
+and modems are taken out of & back into rotation by periodic AT / AT+CSQ probes.
+"""
+
+import concurrent.futures
+import queue
+import threading
+import time
+
+from pyembedded.gsm_module.gsm import GSM
+
+# CSQ 0-31 is the signal strength, 99 means unknown
+MAX_CSQ = 31
+# used until the first probe, and for CSQ 99
+DEFAULT_CSQ = 15
+
+
+class NoModemAvailable(RuntimeError):
+    pass
+
+
+class PooledModem:
+    """
+    One modem of the pool with its worker thread
+    """
+
+    def __init__(self, name, gsm):
+        """
+        :param name: name of the modem in the pool
+        :param gsm: GSM object
+        """
+        self.name = name
+        self.gsm = gsm
+        self.healthy = True
+        self.signal = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.last_probe = None
+        self.tasks = queue.Queue()
+        self.thread = None
+
+    @property
+    def weight(self):
+        """
+        :return: 1 to MAX_CSQ, higher for a better signal
+        """
+        if self.signal is None or self.signal == 99:
+            return DEFAULT_CSQ
+        return min(max(self.signal, 1), MAX_CSQ)
+
+    def stats(self):
+        return {'healthy': self.healthy, 'signal': self.signal, 'pending': self.pending, 'completed': self.completed,
+                'failed': self.failed, 'last_probe': self.last_probe}
+
+
+class GSMPool:
+    def __init__(self, health_interval=30, max_failures=3):
+        """
+        :param health_interval: time in secs between two health probes of every modem
+        :param max_failures: a modem is taken out of rotation after these many tasks failed in a row
+        """
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self._modems = {}
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    @property
+    def modems(self):
+        """
+        :return: dict of modem name: PooledModem
+        """
+        with self._lock:
+            return dict(self._modems)
+
+    def add_port(self, port, baud_rate, name=None):
+        """
+        Opens the modem and adds it to the pool
+        :param port: port of the modem i.e. /dev/ttyUSB0
+        :param baud_rate: Set the appropriate baud rate.
+        :param name: name of the modem, defaults to port
+        :return: GSM
+        """
+        gsm = GSM(port, baud_rate)
+        self.add_modem(gsm, port if name is None else name)
+        return gsm
+
+    def add_modem(self, gsm, name):
+        """
+        Adds an opened modem to the pool and starts its worker
+        :param gsm: GSM object
+        :param name: name of the modem
+        """
+        modem = PooledModem(name, gsm)
+        with self._lock:
+            if name in self._modems:
+                raise ValueError('modem %s is already added' % name)
+            self._modems[name] = modem
+        modem.thread = threading.Thread(target=self._work, args=(modem,), name='gsm-pool-' + name, daemon=True)
+        modem.thread.start()
+
+    def remove_modem(self, name, close=True):
+        """
+        Removes the modem after the tasks already queued on it are done
+        :param name: name of the modem
+        :param close: close the serial port of the modem
+        :return: GSM or None if there is no such modem
+        """
+        with self._lock:
+            modem = self._modems.pop(name, None)
+        if modem is None:
+            return None
+        modem.tasks.put(None)
+        modem.thread.join()
+        if close:
+            modem.gsm.gsm_serial_port.close()
+        return modem.gsm
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Runs the task on the least loaded healthy modem
+        :param func: function called with the GSM object followed by args & kwargs, i.e. GSM.get_signal_strength
+        :return: concurrent.futures.Future of the result of func
+        """
+        with self._lock:
+            modem = self._select()
+            modem.pending += 1
+        return self._enqueue(modem, func, args, kwargs)
+
+    def submit_to(self, name, func, *args, **kwargs):
+        """
+        Runs the task on the given modem, even if it is out of rotation
+        :return: concurrent.futures.Future of the result of func
+        """
+        with self._lock:
+            modem = self._modems[name]
+            modem.pending += 1
+        return self._enqueue(modem, func, args, kwargs)
+
+    def _enqueue(self, modem, func, args, kwargs, counted=True):
+        """
+        :param counted: count the result in the completed & failed stats of the modem
+        """
+        future = concurrent.futures.Future()
+        modem.tasks.put((future, func, args, kwargs, counted))
+        return future
+
+    def send_sms(self, number, message):
+        """
+        :return: Future of the tuple returned by GSM.send_sms
+        """
+        return self.submit(lambda gsm: gsm.send_sms(number, message))
+
+    def make_miss_call(self, number, timeout=3):
+        """
+        :return: Future of the tuple returned by GSM.make_miss_call
+        """
+        return self.submit(lambda gsm: gsm.make_miss_call(number, timeout))
+
+    def execute(self, command, timeout=None):
+        """
+        :param command: AT command
+        :return: Future of the ATResponse
+        """
+        return self.submit(lambda gsm: gsm.at.execute(command, timeout))
+
+    def _select(self):
+        """
+        Must be called with the lock held
+        :return: PooledModem with the lowest pending tasks per signal weight
+        """
+        healthy = [modem for modem in self._modems.values() if modem.healthy]
+        if not healthy:
+            raise NoModemAvailable('no healthy modem in the pool')
+        return min(healthy, key=lambda modem: (modem.pending + 1) / modem.weight)
+
+    def _work(self, modem):
+        while True:
+            task = modem.tasks.get()
+            if task is None:
+                return
+            future, func, args, kwargs, counted = task
+            if not future.set_running_or_notify_cancel():
+                with self._lock:
+                    modem.pending -= 1
+                continue
+            try:
+                result = func(modem.gsm, *args, **kwargs)
+            except Exception as e:
+                failed = True
+                future.set_exception(e)
+            else:
+                # the GSM methods return False or a (False, reason, ...) tuple on failure
+                failed = result is False or (isinstance(result, tuple) and result[:1] == (False,))
+                future.set_result(result)
+            with self._lock:
+                modem.pending -= 1
+                if not counted:
+                    continue
+                if failed:
+                    modem.failed += 1
+                    modem.consecutive_failures += 1
+                    if modem.consecutive_failures >= self.max_failures:
+                        modem.healthy = False
+                else:
+                    modem.completed += 1
+                    modem.consecutive_failures = 0
+
+    def probe(self, name):
+        """
+        Checks the modem with AT & AT+CSQ on its worker, and puts it in or out of rotation
+        :param name: name of the modem
+        :return: Future of True if the modem is healthy
+        """
+        with self._lock:
+            modem = self._modems[name]
+            modem.pending += 1
+        return self._enqueue(modem, self._probe, (modem,), {}, counted=False)
+
+    def probe_all(self):
+        """
+        Probes every modem in parallel and waits for the results
+        :return: dict of modem name: True if healthy
+        """
+        futures = {name: self.probe(name) for name in self.modems}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _probe(self, gsm, modem):
+        try:
+            active = gsm.modem_active()
+            signal = gsm.get_signal_strength() if active else None
+        except (OSError, ValueError):
+            active, signal = False, None
+        with self._lock:
+            modem.last_probe = time.time()
+            modem.signal = signal[1] if signal else None
+            # no signal, the modem can not send sms or make calls
+            modem.healthy = active and modem.signal not in (0, 99)
+            if modem.healthy:
+                modem.consecutive_failures = 0
+        return modem.healthy
+
+    def start(self):
+        """
+        Starts the thread probing the health of every modem every health_interval secs
+        """
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=self._monitor, name='gsm-pool-health', daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        """
+        Stops the health probes, the workers keep running
+        """
+        if self._health_thread is None:
+            return
+        self._stop.set()
+        self._health_thread.join()
+        self._health_thread = None
+
+    def _monitor(self):
+        while not self._stop.is_set():
+            for name in self.modems:
+                try:
+                    self.probe(name)
+                except KeyError:
+                    # removed meanwhile
+                    pass
+            self._stop.wait(self.health_interval)
+
+    def stats(self):
+        """
+        :return: dict of modem name: dict with keys healthy, signal, pending, completed, failed and last_probe
+        """
+        with self._lock:
+            return {name: modem.stats() for name, modem in self._modems.items()}
+
+    def close(self):
+        """
+        Stops the health probes and removes every modem, closing its port
+        """
+        self.stop()
+        for name in list(self.modems):
+            self.remove_modem(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,267 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module sends sms in bulk.
+Outgoing sms are kept in a sqlite database so they survive restarts. The sender switches the
+modem to text mode once and then sends the queued sms back to back, waiting only for the
+> prompt and the +CMGS message reference. Failed sms are retried with exponential backoff.
+"""
+
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class QueuedSMS:
+    """
+    One sms of the queue
+    """
+    __slots__ = ('id', 'number', 'message', 'status', 'attempts', 'next_attempt', 'message_reference',
+                 'last_error', 'created', 'sent_at')
+
+    def __init__(self, id, number, message, status, attempts, next_attempt, message_reference, last_error,
+                 created, sent_at):
+        self.id = id
+        self.number = number
+        self.message = message
+        self.status = status
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.message_reference = message_reference
+        self.last_error = last_error
+        self.created = created
+        self.sent_at = sent_at
+
+    def __repr__(self):
+        return 'QueuedSMS(id=%r, number=%r, status=%r, attempts=%r)' % (self.id, self.number, self.status,
+                                                                      self.attempts)
+
+
+_COLUMNS = 'id, number, message, status, attempts, next_attempt, message_reference, last_error, created, sent_at'
+
+
+class SMSQueue:
+    def __init__(self, path):
+        """
+        Disk backed queue of outgoing sms
+        :param path: path of the sqlite database file, ':memory:' for a queue which is not persisted
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS sms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            number TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            message_reference INTEGER,
+            last_error TEXT,
+            created REAL NOT NULL,
+            sent_at REAL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sms_due ON sms (status, next_attempt)')
+
+    def put(self, number, message):
+        """
+        :param number: phone number on which sms will be sent
+        :param message: sms content
+        :return: id of the queued sms
+        """
+        return self.put_many([(number, message)])[0]
+
+    def put_many(self, messages):
+        """
+        Queues many sms in one transaction
+        :param messages: iterable of (number, message)
+        :return: list of ids of the queued sms
+        """
+        now = time.time()
+        ids = []
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                for number, message in messages:
+                    cursor = self._db.execute(
+                        'INSERT INTO sms (number, message, status, next_attempt, created) VALUES (?, ?, ?, ?, ?)',
+                        (number, message, PENDING, now, now))
+                    ids.append(cursor.lastrowid)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return ids
+
+    def due(self, limit=100, now=None):
+        """
+        :param limit: max no of sms returned
+        :param now: time.time() value, defaults to now
+        :return: list of pending QueuedSMS whose next attempt is due, oldest first
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute('SELECT ' + _COLUMNS + ' FROM sms WHERE status = ? AND next_attempt <= ? '
+                                    'ORDER BY next_attempt, id LIMIT ?', (PENDING, now, limit)).fetchall()
+        return [QueuedSMS(*row) for row in rows]
+
+    def get(self, sms_id):
+        """
+        :param sms_id: id returned by put()
+        :return: QueuedSMS or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT ' + _COLUMNS + ' FROM sms WHERE id = ?', (sms_id,)).fetchone()
+        return QueuedSMS(*row) if row else None
+
+    def mark_sent(self, sms_id, message_reference):
+        with self._lock:
+            self._db.execute('UPDATE sms SET status = ?, attempts = attempts + 1, message_reference = ?, '
+                             'sent_at = ? WHERE id = ?', (SENT, message_reference, time.time(), sms_id))
+
+    def mark_retry(self, sms_id, error, next_attempt):
+        with self._lock:
+            self._db.execute('UPDATE sms SET attempts = attempts + 1, last_error = ?, next_attempt = ? WHERE id = ?',
+                             (error, next_attempt, sms_id))
+
+    def mark_failed(self, sms_id, error):
+        with self._lock:
+            self._db.execute('UPDATE sms SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?',
+                             (FAILED, error, sms_id))
+
+    def count(self, status=PENDING):
+        """
+        :param status: 'pending', 'sent' or 'failed'
+        :return: no of sms with the status
+        """
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM sms WHERE status = ?', (status,)).fetchone()[0]
+
+    def purge_sent(self, older_than=0):
+        """
+        Deletes the sent sms
+        :param older_than: only sms sent more than these many secs ago
+        :return: no of deleted sms
+        """
+        with self._lock:
+            return self._db.execute('DELETE FROM sms WHERE status = ? AND sent_at <= ?',
+                                    (SENT, time.time() - older_than)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SMSBatchSender:
+    def __init__(self, gsm, sms_queue, max_attempts=5, retry_delay=30, max_retry_delay=3600):
+        """
+        :param gsm: GSM object used to send the sms
+        :param sms_queue: SMSQueue with the outgoing sms
+        :param max_attempts: sms still failing after these many attempts are marked failed
+        :param retry_delay: delay in secs before the first retry, doubled for every next retry
+        :param max_retry_delay: max delay in secs between two retries
+        """
+        self.gsm = gsm
+        self.queue = sms_queue
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.sent = 0
+        self.failed = 0
+        self._prepared = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def prepare(self):
+        """
+        Sets the modem state needed for sending, done once instead of before every sms
+        :return: True if modem is ready
+        """
+        self._prepared = self.gsm.set_sms_text_mode(True)
+        return self._prepared
+
+    def put(self, number, message):
+        """
+        Queues the sms and wakes up the sender thread
+        :return: id of the queued sms
+        """
+        sms_id = self.queue.put(number, message)
+        self._wakeup.set()
+        return sms_id
+
+    def send_due(self, limit=100):
+        """
+        Sends the due sms back to back
+        :param limit: max no of sms sent in this call
+        :return: no of sms processed
+        """
+        batch = self.queue.due(limit)
+        if batch and not self._prepared and not self.prepare():
+            return 0
+        for sms in batch:
+            with self.gsm.at.lock:
+                # other users of the modem, i.e. SMSInbox, may switch it to PDU mode in between
+                if not self.gsm.set_sms_text_mode(True):
+                    self._prepared = False
+                    break
+                sms_res, message_reference = self.gsm.submit_sms(sms.number, sms.message)
+            if sms_res.ok:
+                self.queue.mark_sent(sms.id, message_reference)
+                self.sent += 1
+                continue
+            error = 'timeout' if sms_res.timed_out else sms_res.final
+            if sms_res.timed_out:
+                # modem may have been reset, set text mode again before the next sms
+                self.gsm.sms_text_mode = None
+                self._prepared = False
+            if sms.attempts + 1 >= self.max_attempts:
+                self.queue.mark_failed(sms.id, error)
+                self.failed += 1
+            else:
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** sms.attempts)
+                self.queue.mark_retry(sms.id, error, time.time() + delay)
+            if not self._prepared:
+                break
+        return len(batch)
+
+    def start(self, idle_interval=5):
+        """
+        Starts a background thread sending the queued sms
+        :param idle_interval: time in secs to wait when there is no due sms
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(idle_interval,), name='sms-sender', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread after the sms being sent
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, idle_interval):
+        while not self._stop.is_set():
+            if not self.send_due():
+                self._wakeup.wait(idle_interval)
+                self._wakeup.clear()
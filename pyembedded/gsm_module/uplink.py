@@ -0,0 +1,420 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module ships records to a server over the GPRS data connection of SIMCom modems (AT+CIPSTART / AT+CIPSEND),
+without PPP. Records are kept in a sqlite queue until the server acknowledged them, so nothing is lost when the
+connection drops or the device restarts. Queued records are sent in batches as one zlib compressed HTTP POST
+of json lines, over a TCP connection which is kept open between batches. Every batch carries the ids of its
+records in the X-Batch-Id header, so the server can drop a batch which is resent after a lost response.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# overflow policies of RecordQueue
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+
+# max no of bytes of one AT+CIPSEND on SIMCom modems
+MAX_SEND = 1460
+
+_CONNECT_RESULTS = ('CONNECT OK', 'ALREADY CONNECT', 'CONNECT FAIL', 'ERROR', '+CME ERROR')
+_SEND_RESULTS = ('SEND OK', 'SEND FAIL', 'ERROR', '+CME ERROR')
+# AT+CIFSR answers with the IP address only, without a final result code
+_IP_RESULTS = tuple('0123456789') + ('ERROR', '+CME ERROR')
+# unsolicited result codes sent when the server closed the connection & when the network dropped the bearer
+_CLOSED = 'CLOSED'
+_DEACT = '+PDP: DEACT'
+
+
+class UplinkError(OSError):
+    pass
+
+
+class RecordQueue:
+    def __init__(self, path, max_records=100000, overflow=BLOCK):
+        """
+        Disk backed queue of outgoing records
+        :param path: path of the sqlite database file, ':memory:' for a queue which is not persisted
+        :param max_records: max no of queued records
+        :param overflow: BLOCK makes put() wait for the uplink, DROP_OLDEST deletes the oldest records instead
+        """
+        self.path = path
+        self.max_records = max_records
+        self.overflow = overflow
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL)''')
+        self._count = self._db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def put(self, record, timeout=None):
+        """
+        :param record: json serializable record i.e. dict
+        :param timeout: max time in secs to wait for space with the BLOCK policy, None waits forever
+        :return: True if queued, False if the queue stayed full
+        """
+        return self.put_many([record], timeout)
+
+    def put_many(self, records, timeout=None):
+        """
+        Queues the records in one transaction
+        :return: True if queued, False if the queue stayed full
+        """
+        rows = [(json.dumps(record, separators=(',', ':')), time.time()) for record in records]
+        with self._lock:
+            if self.overflow == BLOCK:
+                if not self._space.wait_for(lambda: self._count + len(rows) <= self.max_records, timeout):
+                    return False
+            else:
+                excess = self._count + len(rows) - self.max_records
+                if excess > 0:
+                    self._db.execute('DELETE FROM records WHERE id IN (SELECT id FROM records ORDER BY id LIMIT ?)',
+                                     (excess,))
+                    self._count -= min(excess, self._count)
+                    self.dropped += excess
+            with self._db:
+                self._db.executemany('INSERT INTO records (payload, created) VALUES (?, ?)', rows)
+            self._count += len(rows)
+        return True
+
+    def peek(self, limit):
+        """
+        :param limit: max no of records
+        :return: list of (id, json payload, created) of the oldest records, they stay queued
+        """
+        with self._lock:
+            return self._db.execute('SELECT id, payload, created FROM records ORDER BY id LIMIT ?',
+                                    (limit,)).fetchall()
+
+    def ack(self, first_id, last_id):
+        """
+        Deletes the records sent with a batch
+        """
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM records WHERE id BETWEEN ? AND ?', (first_id, last_id)).rowcount
+            self._count -= deleted
+            self._space.notify_all()
+
+    def oldest(self):
+        """
+        :return: time.time() value when the oldest record was queued or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT created FROM records ORDER BY id LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Uplink:
+    def __init__(self, gsm, host, port, queue, path='/', apn='internet', user='', password='', batch_records=1000,
+                 max_delay=60, compress_level=6, headers=None, max_send=MAX_SEND, response_timeout=30,
+                 retry_delay=5, max_retry_delay=300):
+        """
+        :param gsm: GSM object of a SIMCom modem i.e. SIM800, SIM900
+        :param host: host name or IP address of the HTTP server
+        :param port: port of the HTTP server
+        :param queue: RecordQueue of the records to be sent
+        :param path: path the batches are POSTed to
+        :param apn: access point name of the sim operator
+        :param batch_records: max no of records per batch
+        :param max_delay: a partial batch is sent once its oldest record is this many secs old
+        :param compress_level: zlib level, 0 sends the batch uncompressed
+        :param headers: dict of extra HTTP headers i.e. {'Authorization': 'Bearer ...'}
+        :param max_send: max no of bytes per AT+CIPSEND
+        :param response_timeout: max time in secs to wait for the HTTP response
+        :param retry_delay: time in secs before the first retry after a failure, doubled on every failure
+        :param max_retry_delay: max time in secs between retries
+        """
+        self.gsm = gsm
+        self.host = host
+        self.port = port
+        self.queue = queue
+        self.path = path
+        self.apn = apn
+        self.user = user
+        self.password = password
+        self.batch_records = batch_records
+        self.max_delay = max_delay
+        self.compress_level = compress_level
+        self.headers = dict(headers or {})
+        self.max_send = max_send
+        self.response_timeout = response_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.bearer_open = False
+        self.connected = False
+        self.last_error = None
+        self.stats = {'batches': 0, 'records': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'failures': 0, 'connects': 0}
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def put(self, record, timeout=None):
+        """
+        Queues a record, see RecordQueue.put()
+        """
+        queued = self.queue.put(record, timeout)
+        if len(self.queue) >= self.batch_records:
+            self._wakeup.set()
+        return queued
+
+    def open_bearer(self):
+        """
+        Brings up the GPRS bearer, a bearer left over from before is shut first
+        :raises UplinkError: if a step fails
+        """
+        at = self.gsm.at
+        with at.lock:
+            self.bearer_open = self.connected = False
+            at.execute('AT+CIPSHUT', results=('SHUT OK', 'ERROR'))
+            for command in ('AT+CIPMUX=0', 'AT+CIPHEAD=1',
+                            'AT+CSTT="%s","%s","%s"' % (self.apn, self.user, self.password), 'AT+CIICR'):
+                res = at.execute(command)
+                if not res.ok:
+                    raise UplinkError('%s failed: %s' % (command, res.final))
+            res = at.execute('AT+CIFSR', results=_IP_RESULTS)
+            if res.final is None or 'ERROR' in res.final:
+                raise UplinkError('no IP address: %s' % res.final)
+            self.bearer_open = True
+
+    def connect(self):
+        """
+        Opens the TCP connection to the server, and the bearer if needed
+        :raises UplinkError: if the connection fails
+        """
+        at = self.gsm.at
+        with at.lock:
+            if self.connected:
+                return
+            reused = self.bearer_open
+            if not reused:
+                self.open_bearer()
+            final = self._start()
+            if not final.startswith(('CONNECT OK', 'ALREADY CONNECT')) and reused:
+                # the bearer was lost since it was opened
+                self.open_bearer()
+                final = self._start()
+            if not final.startswith(('CONNECT OK', 'ALREADY CONNECT')):
+                self.bearer_open = False
+                raise UplinkError('connect to %s:%d failed: %s' % (self.host, self.port, final))
+            self.connected = True
+            self.stats['connects'] += 1
+
+    def _check_connection(self):
+        """
+        Reads the unsolicited result codes, the connection is closed on CLOSED and the bearer on +PDP: DEACT.
+        The other codes are left for their readers, i.e. URCDispatcher or SMSInbox.poll()
+        """
+        at = self.gsm.at
+        with at.lock:
+            others = []
+            for line in at.poll_unsolicited():
+                if line.startswith(_CLOSED):
+                    self.connected = False
+                elif line.startswith(_DEACT):
+                    self.connected = self.bearer_open = False
+                else:
+                    others.append(line)
+            at.unsolicited.extend(others)
+
+    def _start(self):
+        """
+        :return: result line of AT+CIPSTART, empty on timeout
+        """
+        at = self.gsm.at
+        res = at.execute('AT+CIPSTART="TCP","%s",%d' % (self.host, self.port), results=('OK',) + _CONNECT_RESULTS)
+        if res.final == 'OK':
+            res = at.wait_for_result(_CONNECT_RESULTS, 75)
+        return res.final or ''
+
+    def close(self):
+        """
+        Closes the TCP connection and the bearer
+        """
+        at = self.gsm.at
+        with at.lock:
+            if self.connected:
+                at.execute('AT+CIPCLOSE', results=('CLOSE OK', 'ERROR'))
+            if self.bearer_open:
+                at.execute('AT+CIPSHUT', results=('SHUT OK', 'ERROR'))
+            self.connected = self.bearer_open = False
+
+    def _write(self, data):
+        at = self.gsm.at
+        for start in range(0, len(data), self.max_send):
+            part = data[start:start + self.max_send]
+            res = at.execute('AT+CIPSEND=%d' % len(part), prompt=True)
+            if not res.ok:
+                raise UplinkError('AT+CIPSEND failed: %s' % res.final)
+            res = at.send_data(part, timeout=self.response_timeout, results=_SEND_RESULTS)
+            if res.final is None or not res.final.startswith('SEND OK'):
+                raise UplinkError('send failed: %s' % res.final)
+
+    def _read_response(self):
+        """
+        :return: tuple of HTTP status & dict of lower case header name: value
+        """
+        at = self.gsm.at
+        data = b''
+        deadline = time.monotonic() + self.response_timeout
+        while True:
+            end = data.find(b'\r\n\r\n')
+            if end != -1:
+                lines = data[:end].decode('latin-1').split('\r\n')
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if len(data) >= end + 4 + int(headers.get('content-length', 0)):
+                    try:
+                        return int(lines[0].split()[1]), headers
+                    except (IndexError, ValueError):
+                        raise UplinkError('invalid response %r' % lines[0])
+            block = at.read_data(b'+IPD,', max(0.0, deadline - time.monotonic()))
+            if block is None:
+                raise UplinkError('no response from server')
+            data += block
+
+    def build_request(self, rows):
+        """
+        :param rows: list of (id, json payload, created) from RecordQueue.peek()
+        :return: tuple of bytes of the HTTP request & size of the uncompressed body
+        """
+        body = '\n'.join(row[1] for row in rows).encode('utf-8')
+        raw_size = len(body)
+        headers = {'Host': '%s:%d' % (self.host, self.port), 'Content-Type': 'application/x-ndjson',
+                   'X-Batch-Id': '%d-%d' % (rows[0][0], rows[-1][0]), 'Connection': 'keep-alive'}
+        if self.compress_level:
+            body = zlib.compress(body, self.compress_level)
+            headers['Content-Encoding'] = 'deflate'
+        headers['Content-Length'] = str(len(body))
+        headers.update(self.headers)
+        head = 'POST %s HTTP/1.1\r\n' % self.path + ''.join('%s: %s\r\n' % item for item in headers.items()) + '\r\n'
+        return head.encode('latin-1') + body, raw_size
+
+    def send_batch(self):
+        """
+        Sends the oldest queued records as one batch, they are removed from the queue once the server answers 2xx
+        :return: no of records sent, 0 if the queue is empty
+        :raises UplinkError: on failure, the records stay queued
+        """
+        rows = self.queue.peek(self.batch_records)
+        if not rows:
+            return 0
+        request, raw_size = self.build_request(rows)
+        with self.gsm.at.lock:
+            self._check_connection()
+            self.connect()
+            try:
+                try:
+                    self._write(request)
+                except UplinkError:
+                    # the connection may have been closed without a CLOSED being received, send once more on a new one
+                    self.gsm.at.execute('AT+CIPCLOSE', results=('CLOSE OK', 'ERROR'))
+                    self.connected = False
+                    self.connect()
+                    self._write(request)
+                status, headers = self._read_response()
+            except UplinkError:
+                # resume on a new connection
+                self.connected = False
+                raise
+            if headers.get('connection', '').lower() == 'close':
+                self.connected = False
+        if not 200 <= status < 300:
+            raise UplinkError('server answered %d' % status)
+        self.queue.ack(rows[0][0], rows[-1][0])
+        self.stats['batches'] += 1
+        self.stats['records'] += len(rows)
+        self.stats['raw_bytes'] += raw_size
+        self.stats['sent_bytes'] += len(request)
+        return len(rows)
+
+    def flush(self):
+        """
+        Sends batches until the queue is empty
+        :return: no of records sent
+        :raises UplinkError: on failure
+        """
+        sent = 0
+        while True:
+            count = self.send_batch()
+            if not count:
+                return sent
+            sent += count
+
+    def _due(self):
+        if len(self.queue) >= self.batch_records:
+            return True
+        oldest = self.queue.oldest()
+        return oldest is not None and time.time() - oldest >= self.max_delay
+
+    def start(self):
+        """
+        Starts the thread sending full batches, and partial batches after max_delay
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='gsm-uplink', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the thread, the queued records stay in the queue
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stop.is_set():
+            if not self._due():
+                self._wakeup.wait(min(1.0, self.max_delay))
+                self._wakeup.clear()
+                continue
+            try:
+                self.send_batch()
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                self.stats['failures'] += 1
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            else:
+                delay = self.retry_delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        self.close()
@@ -0,0 +1,214 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module dispatches the unsolicited result codes (RING, +CLIP, +CMTI, NO CARRIER, +CLCC etc) of a gsm modem.
+The AT command engine keeps them apart from the command responses, a background thread picks them
+up as soon as they arrive and hands them to the registered callbacks and to an event queue.
+The call state of the GSM object is kept up to date from the same codes.
+"""
+
+import csv
+import queue
+import threading
+import time
+
+# <stat> of +CLCC
+CALL_ACTIVE = 0
+CALL_HELD = 1
+CALL_DIALING = 2
+CALL_ALERTING = 3
+CALL_INCOMING = 4
+CALL_WAITING = 5
+CALL_DISCONNECTED = 6
+
+
+class URCEvent:
+    """
+    One unsolicited result code
+    """
+    __slots__ = ('name', 'fields', 'line', 'timestamp')
+
+    def __init__(self, name, fields, line, timestamp=None):
+        """
+        :param name: code without the colon i.e. '+CMTI', 'RING', 'NO CARRIER'
+        :param fields: list of str values after the colon, quotes removed
+        :param line: line as received
+        :param timestamp: time.time() value when it was picked up
+        """
+        self.name = name
+        self.fields = fields
+        self.line = line
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return 'URCEvent(name=%r, fields=%r)' % (self.name, self.fields)
+
+
+def parse_urc(line):
+    """
+    :param line: unsolicited result code line i.e. '+CMTI: "SM",3'
+    :return: URCEvent
+    """
+    name, colon, value = line.partition(':')
+    if not colon:
+        return URCEvent(line, [], line)
+    fields = next(csv.reader([value.strip()], skipinitialspace=True)) if value.strip() else []
+    return URCEvent(name, fields, line)
+
+
+def parse_clcc(fields):
+    """
+    :param fields: fields of a +CLCC line, <id>,<dir>,<stat>,<mode>,<mpty>[,<number>,<type>]
+    :return: dict with keys id, direction ('MO' or 'MT'), state and number or None if invalid
+    """
+    try:
+        return {'id': int(fields[0]), 'direction': 'MT' if fields[1] == '1' else 'MO', 'state': int(fields[2]),
+                'number': fields[5] if len(fields) > 5 else None}
+    except (IndexError, ValueError):
+        return None
+
+
+class URCDispatcher:
+    def __init__(self, gsm, max_events=256):
+        """
+        :param gsm: GSM object
+        :param max_events: max no of events kept in queue, 0 for no limit. When full, the oldest event is dropped
+        """
+        self.gsm = gsm
+        self.events = queue.Queue(max_events)
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def enable(self):
+        """
+        Asks the modem to report the caller id (+CLIP), call state changes (+CLCC) and new sms (+CMTI)
+        :return: True if the caller id & sms notifications were enabled, +CLCC is not supported by every modem
+        """
+        at = self.gsm.at
+        clip = at.execute('AT+CLIP=1').ok
+        at.execute('AT+CLCC=1')
+        cnmi = at.execute('AT+CNMI=2,1,0,0,0').ok
+        return clip and cnmi
+
+    def on(self, name, callback):
+        """
+        Registers a callback, called from the dispatcher thread with the URCEvent
+        :param name: code i.e. '+CMTI', 'RING', 'NO CARRIER' or '*' for every code
+        :param callback: function taking URCEvent
+        """
+        with self._lock:
+            self._callbacks.setdefault(name, []).append(callback)
+
+    def off(self, name, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(name, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def dispatch(self, lines):
+        """
+        Updates the call state, runs the callbacks and queues the events
+        :param lines: unsolicited result code lines
+        :return: list of URCEvent
+        """
+        events = [parse_urc(line) for line in lines]
+        for event in events:
+            if event.name == '+CPIN' and event.fields[:1] != ['READY']:
+                # SIM removed or being changed, the cached IMSI may be stale
+                self.gsm.invalidate_identity()
+            self._track_call(event)
+            with self._lock:
+                callbacks = self._callbacks.get(event.name, []) + self._callbacks.get('*', [])
+            for callback in callbacks:
+                callback(event)
+            self._put(event)
+        return events
+
+    def poll(self):
+        """
+        Picks up the codes received so far and dispatches them, used when the thread is not running
+        :return: list of URCEvent
+        """
+        return self.dispatch(self.gsm.at.poll_unsolicited())
+
+    def get_event(self, timeout=None):
+        """
+        :param timeout: max time in secs to wait, None waits forever
+        :return: next URCEvent or None on timeout
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def start(self, poll_interval=0.005):
+        """
+        Starts the dispatcher thread
+        :param poll_interval: time in secs to wait when nothing was received
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(poll_interval,), name='gsm-urc', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the dispatcher thread, waits for the command being executed by other threads
+        """
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, poll_interval):
+        while not self._stop.is_set():
+            # poll_unsolicited waits for a running command, whose response collects the codes received meanwhile
+            if not self.poll():
+                self._stop.wait(poll_interval)
+
+    def _put(self, event):
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _track_call(self, event):
+        gsm = self.gsm
+        if event.name in ('RING', '+CRING'):
+            gsm.incoming_call = True
+        elif event.name == '+CLIP':
+            gsm.incoming_call = True
+            gsm.caller = event.fields[0] if event.fields else None
+        elif event.name in ('NO CARRIER', 'BUSY', 'NO ANSWER'):
+            gsm.ongoing_call = False
+            gsm.incoming_call = False
+            gsm.calls.clear()
+        elif event.name == '+CLCC':
+            call = parse_clcc(event.fields)
+            if call is not None:
+                if call['state'] == CALL_DISCONNECTED:
+                    gsm.calls.pop(call['id'], None)
+                else:
+                    gsm.calls[call['id']] = call
+                gsm.update_call_state()
@@ -0,0 +1,184 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module collects raspberry pi metrics straight from /proc, /sys, os.statvfs and socket ioctls.
+Unlike PI, no process is started for any metric, the files are kept open and re-read with seek(0),
+and numeric values are returned instead of strings. Works on linux based devices only.
+"""
+
+import array
+import fcntl
+import os
+import socket
+import struct
+
+SIOCGIFADDR = 0x8915
+SIOCGIWESSID = 0x8B1B
+IW_ESSID_MAX_SIZE = 32
+IWREQ_SIZE = 32
+
+
+class PICollector:
+    def __init__(self, thermal_zone=0):
+        """
+        :param thermal_zone: thermal zone of the cpu in /sys/class/thermal
+        """
+        self.thermal_path = '/sys/class/thermal/thermal_zone%d/temp' % thermal_zone
+        self._files = {}
+        self._socket = None
+        self._cpu_times = None
+
+    def _read(self, path):
+        """
+        Reads the whole file, keeping it open for the next call
+        :param path: path of the file in /proc or /sys
+        :return: bytes content of the file
+        """
+        f = self._files.get(path)
+        if f is None:
+            f = open(path, 'rb', buffering=0)
+            self._files[path] = f
+        else:
+            f.seek(0)
+        chunks = []
+        while True:
+            chunk = f.read(8192)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def _ioctl_socket(self):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        return self._socket
+
+    def get_ram_info(self):
+        """
+        :return: dict of RAM information (unit=kb) with keys total, used, free, available
+        """
+        values = {}
+        for line in self._read('/proc/meminfo').splitlines():
+            name, _, value = line.partition(b':')
+            values[name] = int(value.split()[0])
+        total = values[b'MemTotal']
+        free = values[b'MemFree']
+        available = values.get(b'MemAvailable', free)
+        return {'total': total, 'used': total - available, 'free': free, 'available': available}
+
+    def get_disk_space(self, path='/'):
+        """
+        :param path: any path on the file system to be checked
+        :return: dict of disk space (unit=bytes) with keys total, used, free and percent (float) used
+        """
+        st = os.statvfs(path)
+        total = st.f_blocks * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        # same as df, reserved blocks are neither used nor available
+        percent = 100.0 * used / (used + free) if used + free else 0.0
+        return {'total': total, 'used': used, 'free': free, 'percent': percent}
+
+    def get_cpu_usage(self):
+        """
+        CPU usage between the previous call and this call, the first call returns the usage since boot
+        :return: float % of CPU used
+        """
+        fields = self._read('/proc/stat').split(b'\n', 1)[0].split()[1:]
+        times = [int(value) for value in fields]
+        # idle + iowait
+        idle = times[3] + (times[4] if len(times) > 4 else 0)
+        total = sum(times[:8])
+        previous = self._cpu_times
+        self._cpu_times = (idle, total)
+        if previous is not None:
+            idle, total = idle - previous[0], total - previous[1]
+        if total <= 0:
+            return 0.0
+        return 100.0 * (total - idle) / total
+
+    def get_cpu_temp(self):
+        """
+        :return: float of cpu temp in degree celsius
+        """
+        return int(self._read(self.thermal_path)) / 1000
+
+    def get_connected_ip_addr(self, network):
+        """
+        :param network: which network interface i.e. 'wlan0', 'eth0'
+        :return: string of ip or None if the interface has no ip
+        """
+        request = struct.pack('256s', network[:15].encode('utf-8'))
+        try:
+            response = fcntl.ioctl(self._ioctl_socket().fileno(), SIOCGIFADDR, request)
+        except OSError:
+            return None
+        return socket.inet_ntoa(response[20:24])
+
+    def get_ssid(self, network='wlan0'):
+        """
+        :param network: wireless interface
+        :return: string of ssid or None if not connected
+        """
+        essid = array.array('B', bytes(IW_ESSID_MAX_SIZE + 1))
+        address, length = essid.buffer_info()
+        # struct iwreq: interface name followed by struct iw_point {pointer, length, flags}
+        request = struct.pack('16sPHH', network[:15].encode('utf-8'), address, length, 0).ljust(IWREQ_SIZE, b'\0')
+        try:
+            fcntl.ioctl(self._ioctl_socket().fileno(), SIOCGIWESSID, request)
+        except OSError:
+            return None
+        ssid = essid.tobytes().rstrip(b'\0').decode('utf-8', errors='replace')
+        return ssid or None
+
+    def get_wifi_status(self, network='wlan0', max_quality=70):
+        """
+        :param network: wireless interface
+        :param max_quality: max link quality reported by the driver, 70 for the raspberry pi
+        :return: dict with keys ssid, quality, level (dBm), noise and percentage or None if not found
+        """
+        try:
+            wireless = self._read('/proc/net/wireless')
+        except OSError:
+            # no wireless extensions on this host
+            return None
+        for line in wireless.splitlines()[2:]:
+            name, _, values = line.partition(b':')
+            if name.strip().decode('utf-8') != network:
+                continue
+            values = values.split()
+            quality = float(values[1].rstrip(b'.'))
+            level = float(values[2].rstrip(b'.'))
+            noise = float(values[3].rstrip(b'.'))
+            return {
+                'ssid': self.get_ssid(network),
+                'quality': quality,
+                'level': level,
+                'noise': noise,
+                'percentage': int(quality / max_quality * 100),
+            }
+        return None
+
+    def close(self):
+        """
+        Closes all the files kept open
+        """
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
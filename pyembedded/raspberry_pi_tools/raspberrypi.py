@@ -9,17 +9,79 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 """
-This module is used to get some useful data about raspberry pi
+This module is used to get some useful data about raspberry pi.
+The values are read by a PICollector, without starting a process. The commands (free, df, ifconfig, iwconfig)
+and psutil are only used where the collector can not read a value, i.e. not on linux.
+The collector, psutil, subprocess & re are imported by the methods using them, so importing this module is cheap.
 """
 
 import os
-import psutil
-import re
-import subprocess
+
+
+def _timed(method):
+    """
+    Records the latency of the method in the metrics of the PI, if any
+    """
+    def wrapper(self, *args, **kwargs):
+        if self.metrics is None:
+            return method(self, *args, **kwargs)
+        with self.metrics.time(method.__name__):
+            return method(self, *args, **kwargs)
+    # not functools.wraps, functools is not loaded yet when this module is imported by a small tool
+    wrapper.__name__ = method.__name__
+    wrapper.__qualname__ = method.__qualname__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def _human_size(size):
+    """
+    :param size: bytes
+    :return: size like df -h prints it i.e. '29G' or '5.1G'
+    """
+    size = float(size)
+    unit = ''
+    for unit in ('', 'K', 'M', 'G', 'T', 'P'):
+        if size < 1024:
+            break
+        size /= 1024
+    # rounded up like df, with one decimal below 10
+    tenths = -(-size * 10 // 1)
+    if unit and tenths < 100:
+        return '%.1f%s' % (tenths / 10, unit)
+    return '%d%s' % (-(-size // 1), unit)
 
 
 class PI:
+    metrics = None
+    collector = None
+
+    def __init__(self, metrics=None, name='pi'):
+        """
+        :param metrics: telemetry.metrics.Metrics recording the latency & failures of every query
+        :param name: device name in the metrics
+        """
+        if metrics is not None:
+            self.metrics = metrics.device('pi', name)
 
+    def _collect(self, name, *args):
+        """
+        :param name: name of the PICollector method
+        :return: value read by the collector, None if it can not be read that way
+        """
+        if self.collector is None:
+            try:
+                from pyembedded.raspberry_pi_tools.collector import PICollector
+            except ImportError:
+                # no fcntl, not a linux based device
+                return None
+            self.collector = PICollector()
+        try:
+            return getattr(self.collector, name)(*args)
+        except (OSError, KeyError, ValueError, IndexError):
+            return None
+
+    @_timed
     def get_ram_info(self):
         """
         :return: Return RAM information (unit=kb) in a list
@@ -27,6 +89,9 @@ class PI:
                  Index 1: used RAM
                  Index 2: free RAM
         """
+        info = self._collect('get_ram_info')
+        if info is not None:
+            return [str(info['total']), str(info['used']), str(info['free'])]
         p = os.popen('free')
         i = 0
         while True:
@@ -35,6 +100,7 @@ class PI:
             if i == 2:
                 return line.split()[1:4]
 
+    @_timed
     def get_disk_space(self):
         """
         :return: # Return information about disk space as a list (unit included)
@@ -43,6 +109,10 @@ class PI:
                 # Index 2: remaining disk space
                 # Index 3: percentage of disk used
         """
+        space = self._collect('get_disk_space')
+        if space is not None:
+            return [_human_size(space['total']), _human_size(space['used']), _human_size(space['free']),
+                    '%d%%' % -(-space['percent'] // 1)]
         p = os.popen("df -h /")
         i = 0
         while 1:
@@ -51,35 +121,56 @@ class PI:
             if i == 2:
                 return line.split()[1:5]
 
+    @_timed
     def get_cpu_usage(self):
         """
         :return: Return % of CPU used by user as a character string
         """
+        usage = self._collect('get_cpu_usage')
+        if usage is not None:
+            return str(round(usage, 1))
+        import psutil
         return str(psutil.cpu_percent())
 
+    @_timed
     def get_connected_ip_addr(self, network):
         """
         :param network: which network interface i.e. 'wlan0', 'eth0'
         :return: string of ip
         """
+        ip = self._collect('get_connected_ip_addr', network)
+        if ip is not None:
+            return ip
+        import re
+        import subprocess
         cmd = "/sbin/ifconfig " + str(network) + " | grep 'inet '"
         resp = (subprocess.check_output(cmd, shell=True)).decode("utf-8")
         ip = re.search('inet (.+) netmask', resp).group(1)
         return ip
 
+    @_timed
     def get_cpu_temp(self):
         """
         :return: float of cpu temp
         """
+        cpu_temp = self._collect('get_cpu_temp')
+        if cpu_temp is not None:
+            return cpu_temp
         tFile = open('/sys/class/thermal/thermal_zone0/temp')
         temp = float(tFile.read())
         cpu_temp = temp / 1000
         return cpu_temp
 
+    @_timed
     def get_wifi_status(self):
         """
         :return: return list of [ssid, signal quality, signal level, signal percentage]
         """
+        status = self._collect('get_wifi_status', 'wlan0')
+        if status is not None:
+            return [status['ssid'] or '', '%d dBm' % status['level'], '%d/70' % status['quality'],
+                    status['percentage']]
+        import subprocess
         ssid = os.popen("iwgetid -r").read()
         ssid = ssid.rstrip("\n")
 
@@ -103,6 +194,14 @@ class PI:
         signal_quality = level.replace("Signal level=", "")
         return [ssid, signal_quality.strip(), signal_level.strip(), wifi_percentage]
 
+    def close(self):
+        """
+        Closes the files kept open by the collector
+        """
+        if self.collector is not None:
+            self.collector.close()
+            self.collector = None
+
 
 if __name__ == '__main__':
     PI()
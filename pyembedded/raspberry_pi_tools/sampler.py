@@ -0,0 +1,238 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module samples raspberry pi metrics periodically and keeps their history.
+Every metric has its own interval, all of them are sampled from one background thread
+and the samples are kept in fixed size ring buffers, so memory use does not grow over time.
+"""
+
+import array
+import bisect
+import heapq
+import threading
+import time
+
+from pyembedded.raspberry_pi_tools.collector import PICollector
+
+
+def _wifi_percentage(collector):
+    status = collector.get_wifi_status()
+    return None if status is None else status['percentage']
+
+
+# metric name: function returning the value from PICollector
+METRICS = {
+    'cpu_usage': lambda collector: collector.get_cpu_usage(),
+    'cpu_temp': lambda collector: collector.get_cpu_temp(),
+    'ram_used': lambda collector: collector.get_ram_info()['used'],
+    'ram_available': lambda collector: collector.get_ram_info()['available'],
+    'disk_used_percent': lambda collector: collector.get_disk_space()['percent'],
+    'wifi_quality': _wifi_percentage,
+}
+
+
+def _percentile(values, percent):
+    """
+    :param values: sorted list of values
+    :param percent: 0 to 100
+    :return: linearly interpolated percentile
+    """
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        """
+        Fixed size history of (timestamp, value) samples backed by arrays of doubles
+        :param capacity: max no of samples kept, the oldest sample is overwritten when full
+        """
+        self.capacity = capacity
+        self._timestamps = array.array('d', bytes(8 * capacity))
+        self._values = array.array('d', bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value, timestamp=None):
+        """
+        :param value: sample value
+        :param timestamp: time.time() value of the sample, defaults to now
+        """
+        with self._lock:
+            self._timestamps[self._next] = time.time() if timestamp is None else timestamp
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def samples(self, window=None, last=None):
+        """
+        Returns the samples in chronological order
+        :param window: only samples of the last these many secs
+        :param last: only the last these many samples
+        :return: tuple of (list of timestamps, list of values)
+        """
+        with self._lock:
+            start = (self._next - self._count) % self.capacity
+            if start + self._count <= self.capacity:
+                timestamps = self._timestamps[start:start + self._count].tolist()
+                values = self._values[start:start + self._count].tolist()
+            else:
+                timestamps = (self._timestamps[start:] + self._timestamps[:self._next]).tolist()
+                values = (self._values[start:] + self._values[:self._next]).tolist()
+        first = 0
+        if window is not None:
+            first = bisect.bisect_left(timestamps, time.time() - window)
+        if last is not None:
+            first = max(first, len(values) - last)
+        return timestamps[first:], values[first:]
+
+    def latest(self):
+        """
+        :return: tuple of (timestamp, value) of the latest sample or None
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            i = (self._next - 1) % self.capacity
+            return self._timestamps[i], self._values[i]
+
+    def min(self, window=None, last=None):
+        values = self.samples(window, last)[1]
+        return min(values) if values else None
+
+    def max(self, window=None, last=None):
+        values = self.samples(window, last)[1]
+        return max(values) if values else None
+
+    def mean(self, window=None, last=None):
+        values = self.samples(window, last)[1]
+        return sum(values) / len(values) if values else None
+
+    def percentile(self, percent, window=None, last=None):
+        """
+        :param percent: 0 to 100 i.e. 95 for the 95th percentile
+        :param window: only samples of the last these many secs
+        :param last: only the last these many samples
+        :return: linearly interpolated percentile or None if there are no samples
+        """
+        values = sorted(self.samples(window, last)[1])
+        return _percentile(values, percent) if values else None
+
+    def summary(self, window=None, last=None):
+        """
+        :return: dict with keys count, min, max, mean, p50, p95 for the selected samples
+        """
+        values = sorted(self.samples(window, last)[1])
+        if not values:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'p50': None, 'p95': None}
+        return {'count': len(values), 'min': values[0], 'max': values[-1], 'mean': sum(values) / len(values),
+                'p50': _percentile(values, 50), 'p95': _percentile(values, 95)}
+
+
+class MetricSampler:
+    def __init__(self, intervals=None, capacity=3600, collector=None):
+        """
+        :param intervals: dict of metric name: sampling interval in secs, see METRICS for the names.
+                          Defaults to every metric once per second
+        :param capacity: no of samples kept per metric
+        :param collector: PICollector to be used, a new one is created if None
+        """
+        if intervals is None:
+            intervals = {name: 1.0 for name in METRICS}
+        for name in intervals:
+            if name not in METRICS:
+                raise ValueError('unknown metric %s' % name)
+        self.intervals = dict(intervals)
+        self.collector = PICollector() if collector is None else collector
+        self.history = {name: RingBuffer(capacity) for name in self.intervals}
+        self.errors = {name: 0 for name in self.intervals}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def sample(self, name):
+        """
+        Takes one sample of the metric now and stores it in history
+        :param name: metric name
+        :return: sampled value or None if the metric is not available
+        """
+        try:
+            value = METRICS[name](self.collector)
+        except (OSError, ValueError, KeyError, IndexError):
+            value = None
+        if value is None:
+            self.errors[name] += 1
+            return None
+        self.history[name].append(value)
+        return value
+
+    def start(self):
+        """
+        Starts the sampling thread, no thread is started without metrics to sample
+        """
+        if self.running or not self.intervals:
+            return
+        if 'cpu_usage' in self.intervals:
+            # cpu usage is a delta between two reads, the first read only sets the starting point
+            self.collector.get_cpu_usage()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='pi-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the sampling thread
+        """
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        now = time.monotonic()
+        schedule = [(now + interval, name) for name, interval in self.intervals.items()]
+        heapq.heapify(schedule)
+        while not self._stop.is_set():
+            due, name = schedule[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                if self._stop.wait(wait):
+                    break
+                continue
+            self.sample(name)
+            # keep the schedule fixed instead of drifting with the time taken by sampling
+            next_due = due + self.intervals[name]
+            if next_due <= time.monotonic():
+                next_due = time.monotonic() + self.intervals[name]
+            heapq.heapreplace(schedule, (next_due, name))
+
+    def close(self):
+        """
+        Stops the sampling thread and closes the collector
+        """
+        self.stop()
+        self.collector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,87 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module is the asyncio interface of the rfid module.
+Tag reads are delivered as an async stream:
+
+    async for tag in rfid.tags(dedupe_window=1.0):
+        print(tag.tag_id, tag.timestamp)
+"""
+
+import asyncio
+import time
+
+from pyembedded.rfid_module.framing import RFIDFrameParser, TagDeduplicator, TagEvent
+from pyembedded.serial_tools.async_serial import AsyncSerial
+from pyembedded.serial_tools.link import SerialLink
+
+
+class AsyncRFID:
+    def __init__(self, port, baud_rate, name=None, serial_port=None):
+        """
+        Initialize the serial communication port to access rfid module.
+        Must be created from a running event loop.
+        :param port: port to be used for serial communication.
+                    Use COM1, COM2, COM3 etc in case of windows
+                    Use /dev/ttyUSB0 etc in case of linux based devices
+        :param baud_rate: Set the appropriate baud rate.
+        :param name: name of the reader, set in every TagEvent. Defaults to port
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        """
+        # timeouts of the protocol, the port is opened again by AsyncSerial from the executor
+        self.rfid_serial_port = AsyncSerial(SerialLink(port, baud_rate, 'rfid', reopen_timeout=0)
+                                           if serial_port is None else serial_port)
+        self.name = port if name is None else name
+        self.parser = RFIDFrameParser()
+        self._pending = []
+
+    async def _next_event(self):
+        while not self._pending:
+            data = await self.rfid_serial_port.read()
+            now = time.time()
+            self._pending.extend(TagEvent(tag_id, now, self.name) for tag_id in self.parser.feed(data))
+        return self._pending.pop(0)
+
+    async def tags(self, dedupe_window=1.0):
+        """
+        Async stream of tag reads
+        :param dedupe_window: a tag read again within these many secs is suppressed, None to get every read
+        :return: async generator of TagEvent
+        """
+        dedupe = TagDeduplicator(dedupe_window) if dedupe_window else None
+        while True:
+            event = await self._next_event()
+            if dedupe is None or dedupe.accept(event.tag_id, event.timestamp):
+                yield event
+
+    async def get_id(self, timeout=None):
+        """
+        Waits for the next rfid id
+        :param timeout: max time in secs to wait, None waits forever
+        :return: rfid id or None on timeout
+        """
+        try:
+            return (await asyncio.wait_for(self._next_event(), timeout)).tag_id
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        """
+        Closes the serial port
+        """
+        self.rfid_serial_port.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,134 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module frames the data sent by EM4100 style 125KHz rfid readers (EM-18, RDM6300 etc).
+A tag is sent as 12 ascii hex chars, 10 chars of data followed by 2 chars of checksum
+(XOR of the 5 data bytes). Readers like RDM6300 wrap it in STX (0x02) & ETX (0x03).
+Any non hex byte ends a frame, and frames failing the checksum are skipped one char at a time
+until the stream is in sync again, so a dropped byte only loses the tag it belongs to.
+"""
+
+import time
+
+FRAME_LENGTH = 12
+DATA_LENGTH = 10
+
+# compiled on first use, importing re is slow on small boards
+_HEX_RUN = None
+
+
+def _hex_run():
+    global _HEX_RUN
+    if _HEX_RUN is None:
+        import re
+        _HEX_RUN = re.compile(rb'[0-9A-Fa-f]+')
+    return _HEX_RUN
+
+
+class TagEvent:
+    """
+    One tag read
+    """
+    __slots__ = ('tag_id', 'timestamp', 'reader')
+
+    def __init__(self, tag_id, timestamp=None, reader=None):
+        """
+        :param tag_id: 12 char id as sent by the reader (10 chars data + 2 chars checksum)
+        :param timestamp: time.time() value when the tag was read
+        :param reader: name of the reader which read the tag
+        """
+        self.tag_id = tag_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.reader = reader
+
+    @property
+    def data(self):
+        """
+        :return: 10 char data part of the tag id
+        """
+        return self.tag_id[:DATA_LENGTH]
+
+    def __repr__(self):
+        return 'TagEvent(tag_id=%r, timestamp=%r, reader=%r)' % (self.tag_id, self.timestamp, self.reader)
+
+
+def is_valid_frame(frame):
+    """
+    Verifies the checksum of a 12 char frame
+    :param frame: bytes of 12 ascii hex chars
+    :return: True if XOR of the 5 data bytes matches the checksum byte
+    """
+    value = bytes.fromhex(frame.decode('ascii'))
+    return value[0] ^ value[1] ^ value[2] ^ value[3] ^ value[4] == value[5]
+
+
+class RFIDFrameParser:
+    def __init__(self, verify_checksum=True):
+        """
+        Incremental parser, feed it with the bytes read from port and it returns the tag ids
+        :param verify_checksum: skip frames with wrong checksum
+        """
+        self.verify_checksum = verify_checksum
+        self.checksum_errors = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        :param data: bytes read from the port
+        :return: list of 12 char tag ids (str) of every complete frame
+        """
+        buffer = self._buffer
+        buffer += data
+        tags = []
+        keep_from = len(buffer)
+        for run in _hex_run().finditer(buffer):
+            start, end = run.span()
+            while end - start >= FRAME_LENGTH:
+                frame = bytes(buffer[start:start + FRAME_LENGTH]).upper()
+                if not self.verify_checksum or is_valid_frame(frame):
+                    tags.append(frame.decode('ascii'))
+                    start += FRAME_LENGTH
+                else:
+                    self.checksum_errors += 1
+                    start += 1
+            if end == len(buffer):
+                # a run touching the end of buffer may continue with the next read
+                keep_from = start
+        del buffer[:keep_from]
+        return tags
+
+
+class TagDeduplicator:
+    def __init__(self, window=1.0):
+        """
+        Suppresses repeated reads of a tag which keeps sitting on the antenna
+        :param window: a tag read again within window secs of its previous read is suppressed
+        """
+        self.window = window
+        self._last_seen = {}
+        self._last_purge = 0
+
+    def accept(self, tag_id, timestamp):
+        """
+        :param tag_id: tag id
+        :param timestamp: time.time() value of the read
+        :return: True if the read should be delivered
+        """
+        last_seen = self._last_seen.get(tag_id)
+        self._last_seen[tag_id] = timestamp
+        if timestamp - self._last_purge > 10 * self.window:
+            self._purge(timestamp)
+        return last_seen is None or timestamp - last_seen >= self.window
+
+    def _purge(self, now):
+        self._last_purge = now
+        for tag_id in [t for t, seen in self._last_seen.items() if now - seen >= self.window]:
+            del self._last_seen[tag_id]
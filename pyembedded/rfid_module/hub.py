@@ -0,0 +1,231 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module watches many rfid readers from a single thread.
+All the ports are waited on with selectors (epoll on linux) and the tag reads of every
+reader are put in one queue. Readers can be added & removed while the hub is running.
+Works on linux based devices only, as serial ports on windows can not be used with selectors.
+"""
+
+import queue
+import selectors
+import socket
+import threading
+
+from pyembedded.rfid_module.framing import TagDeduplicator
+from pyembedded.rfid_module.rfid import RFID
+from pyembedded.serial_tools.link import SerialLink
+
+
+class RFIDHub:
+    def __init__(self, dedupe_window=1.0, max_events=0):
+        """
+        :param dedupe_window: a tag read again by the same reader within these many secs is suppressed,
+                              None to get every read
+        :param max_events: max no of events kept in queue, 0 for no limit. When full, the oldest event is dropped
+        """
+        self.dedupe_window = dedupe_window
+        self.events = queue.Queue(max_events)
+        self.errors = {}
+        self._readers = {}
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._changes = []
+        # RFID: fd registered with the selector, unregistered without touching the port which may be closed
+        self._fds = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+    @property
+    def readers(self):
+        """
+        :return: dict of reader name: RFID
+        """
+        with self._lock:
+            return {name: reader[0] for name, reader in self._readers.items()}
+
+    def add_port(self, port, baud_rate, name=None):
+        """
+        Opens the port and adds it to the hub
+        :param port: port of the rfid reader i.e. /dev/ttyUSB0
+        :param baud_rate: Set the appropriate baud rate.
+        :param name: name of the reader, defaults to port
+        :return: RFID
+        """
+        # the hub thread serves every reader, so a read never waits for more data and an unplugged
+        # reader is removed (see errors) instead of being opened again
+        rfid = RFID(port, baud_rate, name,
+                    serial_port=SerialLink(port, baud_rate, 'rfid', reopen_timeout=0, target_latency=0))
+        self.add_reader(rfid)
+        return rfid
+
+    def add_reader(self, rfid, name=None):
+        """
+        Adds an opened reader to the hub, can be called while the hub is running
+        :param rfid: RFID object
+        :param name: name of the reader, defaults to rfid.name
+        """
+        if name is not None:
+            rfid.name = name
+        with self._lock:
+            if rfid.name in self._readers:
+                raise ValueError('reader %s is already added' % rfid.name)
+            dedupe = TagDeduplicator(self.dedupe_window) if self.dedupe_window else None
+            self._readers[rfid.name] = (rfid, dedupe)
+            self._changes.append(('add', rfid))
+        self._notify()
+
+    def remove_reader(self, name, close=True):
+        """
+        Removes the reader from the hub, can be called while the hub is running
+        :param name: name of the reader
+        :param close: close the serial port of the reader
+        :return: removed RFID or None if there is no such reader
+        """
+        with self._lock:
+            reader = self._readers.pop(name, None)
+            if reader is None:
+                return None
+            self._changes.append(('remove', reader[0]))
+            if close:
+                self._changes.append(('close', reader[0]))
+        self._notify()
+        return reader[0]
+
+    def start(self):
+        """
+        Starts the hub thread
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rfid-hub', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the hub thread, the readers are kept open
+        """
+        if not self.running:
+            return
+        self._stop.set()
+        self._wakeup()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        """
+        Stops the hub and closes all the readers
+        """
+        self.stop()
+        for name in list(self.readers):
+            self.remove_reader(name)
+        self._selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+    @property
+    def running(self):
+        """
+        :return: True if the hub thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_event(self, timeout=None):
+        """
+        :param timeout: max time in secs to wait, None waits forever
+        :return: next TagEvent or None on timeout
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while True:
+            yield self.events.get()
+
+    def _notify(self):
+        """
+        Lets the hub thread apply the added & removed readers, or applies them now if it is not running
+        """
+        if self.running:
+            self._wakeup()
+        else:
+            self._apply_changes()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for action, rfid in changes:
+            if action == 'add':
+                fd = rfid.rfid_serial_port.fileno()
+                self._selector.register(fd, selectors.EVENT_READ, rfid)
+                self._fds[rfid] = fd
+            elif action == 'remove':
+                fd = self._fds.pop(rfid, None)
+                if fd is None:
+                    continue
+                try:
+                    self._selector.unregister(fd)
+                except (KeyError, ValueError, OSError):
+                    pass
+            else:
+                rfid.rfid_serial_port.close()
+
+    def _put(self, event):
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._apply_changes()
+            for key, _ in self._selector.select():
+                rfid = key.data
+                if rfid is None:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                with self._lock:
+                    reader = self._readers.get(rfid.name)
+                if reader is None or reader[0] is not rfid:
+                    continue
+                try:
+                    events = rfid.read_tags()
+                except (OSError, IOError) as e:
+                    # i.e. usb serial adapter unplugged
+                    self.errors[rfid.name] = e
+                    self.remove_reader(rfid.name)
+                    continue
+                dedupe = reader[1]
+                for event in events:
+                    if dedupe is None or dedupe.accept(event.tag_id, event.timestamp):
+                        self._put(event)
+        self._apply_changes()
@@ -12,19 +12,54 @@
 This module read and process the serial data and returns the RFID ID
 """
 
-import serial
+import threading
+import time
+
+from pyembedded.rfid_module.framing import RFIDFrameParser, TagDeduplicator, TagEvent
+from pyembedded.serial_tools.link import SerialLink
 
 
 class RFID:
-    def __init__(self, port, baud_rate):
+    def __init__(self, port, baud_rate, name=None, serial_port=None, metrics=None):
         """
         Initialize the serial communication port to access rfid module
         :param port: port to be used for serial communication.
                     Use COM1, COM2, COM3 etc in case of windows
                     Use /dev/ttyUSB0 etc in case of linux based devices
         :param baud_rate: Set the appropriate baud rate.
+        :param name: name of the reader, set in every TagEvent. Defaults to port
+        :param serial_port: opened serial port to be used instead of opening port, i.e. a simulator transport.
+                            Any object with the serial.Serial read, write, in_waiting, timeout & close
+        :param metrics: telemetry.metrics.Metrics recording bytes, tags & checksum errors
         """
-        self.rfid_serial_port = serial.Serial(port, baud_rate)
+        self.rfid_serial_port = SerialLink(port, baud_rate, 'rfid') if serial_port is None else serial_port
+        self.name = port if name is None else name
+        self.parser = RFIDFrameParser()
+        self.metrics = None if metrics is None else metrics.device('rfid', self.name)
+        if self.metrics is not None:
+            self.metrics.track(self.parser)
+            if hasattr(self.rfid_serial_port, 'on_reopen'):
+                self.rfid_serial_port.on_reopen.append(lambda port: self.metrics.count('reopens'))
+        self._pending = []
+        self._listen_thread = None
+        self._listen_stop = threading.Event()
+        self._port_timeout = None
+
+    def read_tags(self):
+        """
+        Reads whatever is available on the port (waits for at least 1 byte, up to the port timeout) and frames it
+        :return: list of TagEvent, can be empty if no frame was completed
+        """
+        port = self.rfid_serial_port
+        # SerialLink sizes the reads to the data rate
+        data = port.read_chunk() if hasattr(port, 'read_chunk') else port.read(port.in_waiting or 1)
+        now = time.time()
+        events = [TagEvent(tag_id, now, self.name) for tag_id in self.parser.feed(data)]
+        if self.metrics is not None:
+            self.metrics.bytes_in += len(data)
+            if events:
+                self.metrics.count('tags', len(events))
+        return events
 
     def get_id(self):
         """
@@ -32,18 +67,72 @@ class RFID:
         and returns the 12char of the rfid id
         :return: rfid id
         """
-        id_num = []
-        i = 0
+        while not self._pending:
+            self._pending.extend(self.read_tags())
+        return self._pending.pop(0).tag_id
+
+    def stream(self, dedupe_window=1.0):
+        """
+        Generator of tag reads
+        :param dedupe_window: a tag read again within these many secs is suppressed, None to get every read
+        :return: generator of TagEvent
+        """
+        dedupe = TagDeduplicator(dedupe_window) if dedupe_window else None
         while True:
-            serial_data = self.rfid_serial_port.read()
-            data = serial_data.decode('utf-8')
-            i = i + 1
-            if i == 12:
-                i = 0
-                ID = "".join(map(str, id_num))
-                return ID
+            if self._pending:
+                events, self._pending = self._pending, []
             else:
-                id_num.append(data)
+                events = self.read_tags()
+            for event in events:
+                if dedupe is None or dedupe.accept(event.tag_id, event.timestamp):
+                    yield event
+
+    def listen(self, callback, dedupe_window=1.0, read_timeout=0.5):
+        """
+        Starts a background thread which calls callback(TagEvent) for every tag read
+        :param callback: function to be called with the TagEvent
+        :param dedupe_window: a tag read again within these many secs is suppressed, None to get every read
+        :param read_timeout: max time in secs a single read may block, used to stop the thread in time
+        """
+        if self._listen_thread is not None and self._listen_thread.is_alive():
+            return
+        self._listen_stop.clear()
+        self._port_timeout = self.rfid_serial_port.timeout
+        self.rfid_serial_port.timeout = read_timeout
+        self._listen_thread = threading.Thread(target=self._listen_worker, args=(callback, dedupe_window),
+                                               name='rfid-listen', daemon=True)
+        self._listen_thread.start()
+
+    def stop_listening(self):
+        """
+        Stops the background thread started by listen()
+        """
+        if self._listen_thread is None:
+            return
+        self._listen_stop.set()
+        self._listen_thread.join()
+        self._listen_thread = None
+        self.rfid_serial_port.timeout = self._port_timeout
+
+    def _listen_worker(self, callback, dedupe_window):
+        dedupe = TagDeduplicator(dedupe_window) if dedupe_window else None
+        while not self._listen_stop.is_set():
+            for event in self.read_tags():
+                if dedupe is None or dedupe.accept(event.tag_id, event.timestamp):
+                    callback(event)
+
+    def close(self):
+        """
+        Stops the listener and closes the serial port. A port opened by RFID is opened again on next use.
+        """
+        self.stop_listening()
+        self.rfid_serial_port.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 if __name__ == '__main__':
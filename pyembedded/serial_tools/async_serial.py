@@ -0,0 +1,159 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module drives a serial port from the asyncio event loop.
+On linux the file descriptor of the port is watched by the event loop, so no thread is used.
+On windows (no file descriptor) the port is polled from the default executor.
+A SerialLink which fails, i.e. the usb serial adapter was unplugged, is opened again from the executor,
+so the event loop and the other devices on it keep running meanwhile.
+"""
+
+import asyncio
+
+from pyembedded.serial_tools.link import SerialLink
+
+
+class AsyncSerial:
+    def __init__(self, serial_port, poll_interval=0.05, reopen_timeout=10.0):
+        """
+        Wraps a serial port. Must be created from a running event loop. The port is watched from the first read
+        or write, so a LazySerial is opened only then.
+        :param serial_port: serial.Serial, SerialLink or any object with read, write, in_waiting. A SerialLink
+                            should have reopen_timeout=0, it is opened again by AsyncSerial
+        :param poll_interval: read timeout in secs used when the port has no file descriptor
+        :param reopen_timeout: max time in secs spent opening a failed SerialLink again, 0 to raise the error
+        """
+        self.serial_port = serial_port
+        self.poll_interval = poll_interval
+        self.reopen_timeout = reopen_timeout
+        self.loop = asyncio.get_running_loop()
+        self.buffer = bytearray()
+        self._data_received = asyncio.Event()
+        self._closed = False
+        self._error = None
+        self._poll_task = None
+        self._reopen_task = None
+        self._fd = None
+        self._watching = False
+
+    def _watch(self):
+        # the port is watched from the first read or write, so a LazySerial is opened on first use only
+        if self._watching or self._closed:
+            return
+        self._watching = True
+        try:
+            self._fd = self.serial_port.fileno()
+        except (AttributeError, OSError, ValueError):
+            pass
+        if self._fd is not None:
+            self.serial_port.timeout = 0
+            self.loop.add_reader(self._fd, self._on_readable)
+        else:
+            self.serial_port.timeout = self.poll_interval
+            self._poll_task = self.loop.create_task(self._poll())
+
+    def _on_readable(self):
+        try:
+            data = self.serial_port.read(self.serial_port.in_waiting or 1)
+        except Exception as e:
+            self.loop.remove_reader(self._fd)
+            self._reopen_task = self.loop.create_task(self._rewatch(e))
+            return
+        if data:
+            self.buffer += data
+            self._data_received.set()
+
+    async def _poll(self):
+        while not self._closed:
+            try:
+                data = await self.loop.run_in_executor(
+                    None, lambda: self.serial_port.read(self.serial_port.in_waiting or 1))
+            except Exception as e:
+                if await self._reopen(e):
+                    continue
+                return
+            if data:
+                self.buffer += data
+                self._data_received.set()
+
+    async def _reopen(self, error):
+        """
+        Opens a SerialLink again from the executor after a read raised error
+        :return: True if it was opened again, else error is raised by the next read
+        """
+        if isinstance(self.serial_port, SerialLink) and self.reopen_timeout and not self._closed:
+            try:
+                await self.loop.run_in_executor(None, self.serial_port.reopen, self.reopen_timeout)
+                return not self._closed
+            except OSError:
+                pass
+        self._error = error
+        self._data_received.set()
+        return False
+
+    async def _rewatch(self, error):
+        # the file descriptor of the port opened again is a new one
+        if await self._reopen(error):
+            self._fd = None
+            self._watching = False
+            self._watch()
+
+    async def wait_for_data(self):
+        """
+        Waits until there is unread data in buffer. Safe to cancel, no received data is lost.
+        """
+        self._watch()
+        while not self.buffer:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise EOFError('serial port closed')
+            self._data_received.clear()
+            await self._data_received.wait()
+
+    async def read(self):
+        """
+        Waits for data and returns everything received so far
+        :return: bytes
+        """
+        await self.wait_for_data()
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    def write(self, data):
+        """
+        :param data: bytes to be written to the port
+        """
+        self._watch()
+        self.serial_port.write(data)
+
+    def discard(self):
+        """
+        Drops all the unread data
+        """
+        self.buffer.clear()
+
+    def close(self):
+        """
+        Stops watching the port and closes it
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+        if self._reopen_task is not None:
+            self._reopen_task.cancel()
+        self._data_received.set()
+        self.serial_port.close()
@@ -0,0 +1,114 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module frames the bytes received from a serial port into lines, shared by the GSM & GPS parsers.
+The received data is kept in one reusable bytearray, delimiters are found with bytearray.find
+from a read offset, and the consumed part is dropped once per batch instead of once per line.
+Lines are returned as bytes, decoding is left to the caller and never raises on line noise.
+"""
+
+
+def to_text(data):
+    """
+    Decodes bytes received from a device, invalid bytes i.e. line noise are replaced instead of raising
+    :param data: bytes, bytearray or memoryview
+    :return: str
+    """
+    return str(data, 'utf-8', 'replace')
+
+
+def get_field(line, index, separator=b','):
+    """
+    Returns one field of a separated line without splitting the whole line
+    :param line: bytes of the line
+    :param index: 0 based field index
+    :param separator: field separator
+    :return: bytes of the field or None if the line has less fields
+    """
+    start = 0
+    for _ in range(index):
+        start = line.find(separator, start) + 1
+        if not start:
+            return None
+    end = line.find(separator, start)
+    return line[start:] if end == -1 else line[start:end]
+
+
+class LineFramer:
+    def __init__(self, delimiter=b'\n', max_length=None, buffer=None):
+        """
+        :param delimiter: bytes ending a line, it is not part of the returned line
+        :param max_length: partial data longer than this without a delimiter is dropped, None for no limit
+        :param buffer: bytearray to be used, i.e. shared with a reader which keeps the data between commands
+        """
+        self.delimiter = delimiter
+        self.max_length = max_length
+        self.buffer = bytearray() if buffer is None else buffer
+        self.dropped = 0
+        self._start = 0
+
+    def feed(self, data=b''):
+        """
+        :param data: bytes read from the port
+        :return: list of complete lines as bytes
+        """
+        self.buffer += data
+        buffer = self.buffer
+        delimiter = self.delimiter
+        step = len(delimiter)
+        start = self._start
+        lines = []
+        end = buffer.find(delimiter, start)
+        if end != -1:
+            with memoryview(buffer) as view:
+                while end != -1:
+                    lines.append(view[start:end].tobytes())
+                    start = end + step
+                    end = buffer.find(delimiter, start)
+        self._start = start
+        self.compact()
+        return lines
+
+    def next_line(self):
+        """
+        Returns one line, for readers which may stop before the end of the buffer i.e. at a final result code.
+        compact() must be called once done.
+        :return: bytes of the line or None if there is no complete line
+        """
+        end = self.buffer.find(self.delimiter, self._start)
+        if end == -1:
+            return None
+        with memoryview(self.buffer) as view:
+            line = view[self._start:end].tobytes()
+        self._start = end + len(self.delimiter)
+        return line
+
+    @property
+    def pending(self):
+        """
+        :return: bytes received after the last complete line
+        """
+        return bytes(self.buffer[self._start:])
+
+    def compact(self):
+        """
+        Drops the consumed data from the buffer, and the partial line if it is longer than max_length
+        """
+        if self._start:
+            del self.buffer[:self._start]
+            self._start = 0
+        if self.max_length is not None and len(self.buffer) > self.max_length:
+            self.dropped += len(self.buffer)
+            self.buffer.clear()
+
+    def clear(self):
+        self.buffer.clear()
+        self._start = 0
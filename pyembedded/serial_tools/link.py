@@ -0,0 +1,307 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module manages the serial link of a device: it is a LazySerial which
+ - uses read, write & inter byte timeouts suited to the protocol (PROFILES), scaled to the baud rate,
+   so a silent device never blocks a read forever
+ - detects the baud rate of the device when none is given, by probing the candidates (BAUD_RATES)
+ - sizes its reads to the incoming data rate with read_chunk(), few large reads instead of one per byte
+ - opens the port again after a usb serial adapter was unplugged, and tells the device through on_reopen
+The baud rate itself is raised by the devices, GSM.set_baud_rate() with AT+IPR & GPS.set_baud_rate() with CFG-PRT.
+"""
+
+import threading
+import time
+
+from pyembedded.serial_tools.port import LazySerial
+
+# most likely first, modems autobaud from 115200 & receivers default to 9600
+BAUD_RATES = (115200, 9600, 57600, 38400, 19200, 230400, 460800, 4800)
+
+# protocol: dict of timeout & write_timeout in secs, and the inter byte gap in chars ending a burst,
+# timeouts are never shorter than the time to send max_line chars at the baud rate
+PROFILES = {
+    # the AT engine reads in_waiting only, timeout just bounds a read of a dead port
+    'at': {'timeout': 1.0, 'write_timeout': 2.0, 'inter_byte_chars': None, 'max_line': 560},
+    # a receiver sends at least once a sec, no byte for 1.5 secs means it is not sending
+    'gnss': {'timeout': 1.5, 'write_timeout': 1.0, 'inter_byte_chars': 50, 'max_line': 100},
+    # readers only send, a 16 byte frame per tag
+    'rfid': {'timeout': 0.5, 'write_timeout': None, 'inter_byte_chars': 20, 'max_line': 16},
+}
+
+
+class LinkError(OSError):
+    pass
+
+
+def link_settings(protocol, baud_rate):
+    """
+    :param protocol: key of PROFILES
+    :param baud_rate: baud rate
+    :return: dict of the serial.Serial timeout, write_timeout & inter_byte_timeout for the protocol
+    """
+    profile = PROFILES[protocol]
+    # 10 bits per char, 8N1
+    char_time = 10.0 / baud_rate
+    line_time = profile['max_line'] * char_time
+    write_timeout = profile['write_timeout']
+    inter_byte_chars = profile['inter_byte_chars']
+    return {'timeout': max(profile['timeout'], line_time),
+            'write_timeout': None if write_timeout is None else max(write_timeout, line_time),
+            'inter_byte_timeout': None if inter_byte_chars is None else max(0.01, inter_byte_chars * char_time)}
+
+
+def _read_for(link, timeout, done):
+    """
+    Reads what arrives for up to timeout secs, polling in_waiting so a long port timeout does not delay the probe
+    :param done: function called with every chunk of bytes read, True to stop
+    :return: True if done() returned True
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        waiting = link.in_waiting
+        if waiting:
+            if done(link.read(waiting)):
+                return True
+        else:
+            time.sleep(0.01)
+    return False
+
+
+def probe_at(link, timeout=0.3):
+    """
+    :param link: SerialLink
+    :param timeout: max time in secs to wait for the OK
+    :return: True if the modem answered AT with OK at the current baud rate
+    """
+    received = bytearray()
+
+    def answered(data):
+        received.extend(data)
+        return b'OK' in received
+
+    link.reset_input_buffer()
+    # the first AT may only be used by the modem to detect the baud rate
+    for _ in range(2):
+        link.write(b'AT\r')
+        if _read_for(link, timeout, answered):
+            return True
+    return False
+
+
+def probe_gnss(link, timeout=1.2):
+    """
+    :param link: SerialLink
+    :param timeout: max time in secs to listen, receivers send at least once a sec
+    :return: True if a NMEA sentence or UBX frame with a valid checksum was received at the current baud rate
+    """
+    from pyembedded.gps_module.ubx import UBXParser
+    parser = UBXParser()
+    link.reset_input_buffer()
+    return _read_for(link, timeout, lambda data: bool(parser.feed(data)))
+
+
+PROBES = {'at': probe_at, 'gnss': probe_gnss}
+
+
+class SerialLink(LazySerial):
+    def __init__(self, port, baud_rate=None, protocol='at', candidates=BAUD_RATES, reopen_timeout=10.0,
+                 target_latency=0.05, max_read=4096, **settings):
+        """
+        Serial port tuned to the protocol, opened on first use like LazySerial
+        :param port: port to be used for serial communication i.e. COM1 or /dev/ttyUSB0
+        :param baud_rate: baud rate, None to detect it on open with the probe of the protocol
+        :param protocol: 'at', 'gnss' or 'rfid', see PROFILES
+        :param candidates: baud rates tried to detect the baud rate
+        :param reopen_timeout: max time in secs spent opening the port again after it failed, 0 to raise the error
+        :param target_latency: max time in secs read_chunk() waits for more data to arrive
+        :param max_read: max bytes read by read_chunk()
+        :param settings: other serial.Serial keyword arguments, they override the protocol timeouts
+        """
+        detect = baud_rate is None
+        if detect and protocol not in PROBES:
+            raise ValueError('the baud rate of a %s device can not be detected, give baud_rate' % protocol)
+        baud_rate = candidates[0] if detect else baud_rate
+        LazySerial.__init__(self, port, baud_rate, **dict(link_settings(protocol, baud_rate), **settings))
+        self.__dict__.update({
+            'protocol': protocol,
+            'candidates': tuple(candidates),
+            'reopen_timeout': reopen_timeout,
+            'target_latency': target_latency,
+            'max_read': max_read,
+            # settings given by the caller, kept when the baud rate changes
+            '_explicit': set(settings),
+            # functions called with the link after it was opened again, i.e. to drop the state kept about the device
+            'on_reopen': [],
+            'reopens': 0,
+            # baud rate detected on first open & on every reopen, the device may have been reset meanwhile
+            'detect': detect,
+            '_detect_pending': detect,
+            # bytes/sec seen by read_chunk()
+            'rate': 0.0,
+            'chunk_size': 1,
+            '_last_read': None,
+            '_reopen_lock': threading.RLock(),
+        })
+
+    def open(self):
+        """
+        Opens the port, detecting the baud rate first if needed
+        :return: opened serial.Serial
+        """
+        if self._serial is None:
+            LazySerial.open(self)
+            if self._detect_pending:
+                self._detect_pending = False
+                if self.detect_baud_rate() is None:
+                    self.close()
+                    self._detect_pending = True
+                    raise LinkError('no reply from %s at any of the baud rates %s' % (self.port, self.candidates))
+        return self._serial
+
+    @property
+    def baudrate(self):
+        return self._settings['baudrate'] if self._serial is None else self._serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baud_rate):
+        # the timeouts follow the baud rate as long as they hold the protocol value, a timeout given
+        # explicitly or set on the port since, i.e. by GPS.start_stream(), is kept
+        current = link_settings(self.protocol, self.baudrate)
+        settings = {'baudrate': baud_rate}
+        for name, value in link_settings(self.protocol, baud_rate).items():
+            if name not in self._explicit and getattr(self, name) == current[name]:
+                settings[name] = value
+        for name, value in settings.items():
+            if self._serial is None:
+                self._settings[name] = value
+            else:
+                setattr(self._serial, name, value)
+
+    def detect_baud_rate(self, probe=None):
+        """
+        Tries the candidate baud rates until the device answers the probe
+        :param probe: function called with the link, True if the device was understood. Defaults to the
+                      probe of the protocol, see PROBES
+        :return: detected baud rate, the link is left at it, or None and the link is left at the previous one
+        """
+        probe = PROBES[self.protocol] if probe is None else probe
+        previous = self.baudrate
+        for baud_rate in (previous,) + tuple(b for b in self.candidates if b != previous):
+            self.baudrate = baud_rate
+            if probe(self):
+                return baud_rate
+        self.baudrate = previous
+        return None
+
+    @property
+    def in_waiting(self):
+        port = self.open()
+        try:
+            return port.in_waiting
+        except OSError as e:
+            self._reopen(port, e)
+            return 0
+
+    def read(self, size=1):
+        """
+        Like serial.Serial.read(), an unplugged port is opened again and b'' is returned
+        """
+        port = self.open()
+        try:
+            return port.read(size)
+        except OSError as e:
+            self._reopen(port, e)
+            return b''
+
+    def write(self, data):
+        """
+        Like serial.Serial.write(), an unplugged port is opened again and data is written once more
+        """
+        port = self.open()
+        try:
+            return port.write(data)
+        except OSError as e:
+            self._reopen(port, e)
+            return self.open().write(data)
+
+    def read_chunk(self):
+        """
+        Waits up to timeout for data, then lets it accumulate for up to target_latency as long as
+        less than the bytes expected in that time at the current data rate arrived
+        :return: bytes, b'' on timeout
+        """
+        data = self.read(min(self.in_waiting, self.max_read) or 1)
+        if data and len(data) < self.chunk_size:
+            time.sleep(min(self.target_latency, (self.chunk_size - len(data)) / self.rate))
+            waiting = self.in_waiting
+            if waiting:
+                data += self.read(min(waiting, self.max_read - len(data)))
+        now = time.monotonic()
+        if self._last_read is not None and now > self._last_read:
+            # moving average of the data rate, over roughly the last 8 reads
+            self.rate += (len(data) / (now - self._last_read) - self.rate) / 8
+            self.chunk_size = max(1, min(self.max_read, int(self.rate * self.target_latency)))
+        self._last_read = now
+        return data
+
+    def reopen(self, timeout=None):
+        """
+        Opens the port again, i.e. after the usb serial adapter was unplugged, and calls the on_reopen functions.
+        Used by AsyncSerial, which reopens from the executor instead of blocking the event loop.
+        :param timeout: max time in secs spent opening the port, defaults to reopen_timeout
+        :raises LinkError: if the port can not be opened within timeout
+        """
+        self._reopen(self._serial, LinkError('%s can not be opened' % self.port),
+                     self.reopen_timeout if timeout is None else timeout)
+
+    def _reopen(self, port, error, timeout=None):
+        """
+        Opens the port again after it raised error, i.e. the usb serial adapter was unplugged
+        :param port: serial.Serial which raised the error
+        :param error: OSError raised, raised again if the port can not be opened within timeout
+        :param timeout: max time in secs, None for reopen_timeout & to raise a write timeout as is
+        """
+        if timeout is None:
+            import serial
+            if isinstance(error, serial.SerialTimeoutException) or not self.reopen_timeout:
+                raise error
+            timeout = self.reopen_timeout
+        with self._reopen_lock:
+            if self._serial is not port and self._serial is not None:
+                # opened again meanwhile by another thread
+                return
+            try:
+                # keeps the settings changed while open, i.e. the read timeout of a stream
+                self.close()
+            except OSError:
+                pass
+            self._detect_pending = self.detect
+            deadline = time.monotonic() + timeout
+            delay = 0.1
+            while True:
+                try:
+                    self.open()
+                    break
+                except OSError:
+                    if time.monotonic() + delay > deadline:
+                        raise error
+                    # the adapter takes a moment to come back after it is plugged in
+                    time.sleep(delay)
+                    delay = min(2 * delay, 1.0)
+            self.reopens += 1
+            self._last_read = None
+        for callback in list(self.on_reopen):
+            callback(self)
+
+    def __repr__(self):
+        return 'SerialLink(port=%r, baudrate=%r, protocol=%r, open=%r)' % (
+            self.port, self.baudrate, self.protocol, self.is_open)
@@ -0,0 +1,87 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module opens serial ports on first use.
+pyserial is imported and the port is opened only when it is read or written for the first time,
+so creating a device object is free and a tool that never talks to the device never opens its port.
+"""
+
+# keyword arguments of serial.Serial, kept until the port is opened
+SETTINGS = ('baudrate', 'bytesize', 'parity', 'stopbits', 'timeout', 'xonxoff', 'rtscts', 'write_timeout', 'dsrdtr',
+            'inter_byte_timeout', 'exclusive')
+
+
+class LazySerial:
+    def __init__(self, port, baud_rate, **settings):
+        """
+        serial.Serial which is opened on first use. Settings like timeout set before opening are kept
+        and applied when the port is opened.
+        :param port: port to be used for serial communication i.e. COM1 or /dev/ttyUSB0
+        :param baud_rate: baud rate
+        :param settings: other serial.Serial keyword arguments i.e. timeout, see SETTINGS
+        """
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise TypeError('unknown serial settings %s' % ', '.join(sorted(unknown)))
+        self.__dict__['port'] = port
+        self.__dict__['_settings'] = dict(settings, baudrate=baud_rate)
+        self.__dict__['_serial'] = None
+
+    @property
+    def is_open(self):
+        return self._serial is not None and self._serial.is_open
+
+    def open(self):
+        """
+        Opens the port, does nothing if it is already open
+        :return: opened serial.Serial
+        """
+        if self._serial is None:
+            import serial
+            self.__dict__['_serial'] = serial.Serial(self.port, **self._settings)
+        return self._serial
+
+    def close(self):
+        """
+        Closes the port if it was opened. It is opened again on next use.
+        """
+        port, self.__dict__['_serial'] = self._serial, None
+        if port is not None:
+            # keep the settings changed while open, i.e. baudrate & timeout, for the next open
+            for name in self._settings:
+                self._settings[name] = getattr(port, name)
+            port.close()
+
+    def __getattr__(self, name):
+        # called for the serial.Serial attributes only
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._serial is None and name in self._settings:
+            return self._settings[name]
+        return getattr(self.open(), name)
+
+    def __setattr__(self, name, value):
+        if name not in SETTINGS or hasattr(type(self), name):
+            # own attribute or property of a subclass
+            object.__setattr__(self, name, value)
+        elif self._serial is None:
+            self._settings[name] = value
+        else:
+            setattr(self._serial, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return 'LazySerial(port=%r, open=%r)' % (self.port, self.is_open)
@@ -0,0 +1,270 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module benchmarks GSM, GPS and RFID against the simulated devices, no hardware is needed.
+It reports the latency percentiles of every operation and the throughput (sms/min, fixes/sec, tags/sec).
+The startup benchmark measures importing the device modules & creating the device objects in a fresh interpreter,
+use --max-startup-ms to fail when it gets slower.
+Run it with:
+    python -m pyembedded.simulator.benchmark --transport pty --iterations 200 --json
+    python -m pyembedded.simulator.benchmark --only startup --max-startup-ms 50
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from pyembedded.gps_module.gps import GPS
+from pyembedded.gsm_module.gsm import GSM
+from pyembedded.rfid_module.rfid import RFID
+from pyembedded.simulator.devices import ModemSimulator, NMEASimulator, RFIDSimulator
+from pyembedded.simulator.transport import LoopbackSerial, NoiseModel, PtyBridge
+
+
+def summarize(samples):
+    """
+    :param samples: list of latencies in secs
+    :return: dict with keys count, mean, p50, p95, p99 and max in milli secs
+    """
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = sorted(samples)
+
+    def percentile(percent):
+        return values[min(len(values) - 1, int(round((len(values) - 1) * percent / 100)))] * 1000
+
+    return {'count': len(values), 'mean': sum(values) / len(values) * 1000, 'p50': percentile(50),
+            'p95': percentile(95), 'p99': percentile(99), 'max': values[-1] * 1000}
+
+
+def measure(func, iterations):
+    """
+    :param func: operation to be measured
+    :param iterations: no of calls
+    :return: list of latencies in secs
+    """
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+class Connection:
+    def __init__(self, device, transport='loopback', noise=None):
+        """
+        Connects the device to the host side serial port
+        :param device: simulated device
+        :param transport: 'loopback' for LoopbackSerial, 'pty' to go through a pseudo terminal and pyserial
+        :param noise: NoiseModel or None
+        """
+        self.bridge = None
+        if transport == 'pty':
+            import serial
+            self.bridge = PtyBridge(device, noise)
+            self.port = serial.Serial(self.bridge.port, 115200)
+        else:
+            self.port = LoopbackSerial(device, noise)
+
+    def close(self):
+        self.port.close()
+        if self.bridge is not None:
+            self.bridge.close()
+
+
+def bench_gsm(transport, iterations):
+    modem = ModemSimulator()
+    connection = Connection(modem, transport)
+    gsm = GSM('simulator', 115200, serial_port=connection.port)
+    try:
+        operations = {
+            'gsm.modem_active': measure(gsm.modem_active, iterations),
+            'gsm.get_signal_strength': measure(gsm.get_signal_strength, iterations),
+            'gsm.probe_identity': measure(lambda: gsm.probe_identity(refresh=True), iterations),
+            'gsm.send_sms': measure(lambda: gsm.send_sms('+10000000000', 'benchmark'), iterations),
+        }
+    finally:
+        connection.close()
+    sms_time = sum(operations['gsm.send_sms'])
+    throughput = {'sms/min': 60 * iterations / sms_time if sms_time else None}
+    return operations, throughput
+
+
+def bench_gps(transport, iterations, duration, noise=None, ubx_output=False):
+    name = 'gps_ubx' if ubx_output else 'gps'
+    device = NMEASimulator(rate=1000, ubx_output=ubx_output)
+    connection = Connection(device, transport, noise)
+    gps = GPS('simulator', 115200, serial_port=connection.port)
+    gps.start_stream(read_timeout=0.1)
+    try:
+        # latency from the sentence being sent to the fix being available
+        samples = []
+        for _ in range(iterations):
+            fix = gps.latest_fix
+            data = device.next_fix()
+            started = time.perf_counter()
+            device.emit(data)
+            if gps.wait_for_fix(1, newer_than=fix) is not None:
+                samples.append(time.perf_counter() - started)
+        count = gps.fix_count
+        device.start()
+        time.sleep(duration)
+        device.stop()
+        fixes = gps.fix_count - count
+    finally:
+        gps.stop_stream()
+        connection.close()
+    return {name + '.fix_latency': samples}, {name + ' fixes/sec': fixes / duration}
+
+
+def bench_rfid(transport, iterations, duration, noise=None):
+    device = RFIDSimulator(burst=1, interval=0)
+    connection = Connection(device, transport, noise)
+    rfid = RFID('simulator', 115200, serial_port=connection.port)
+    connection.port.timeout = 0.1
+    try:
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            device.emit(device.next_burst())
+            # a frame damaged by noise never arrives
+            while time.perf_counter() - started < 1:
+                if rfid.read_tags():
+                    samples.append(time.perf_counter() - started)
+                    break
+        tags = 0
+        device.start()
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            tags += len(rfid.read_tags())
+        elapsed = time.perf_counter() - started
+        device.stop()
+    finally:
+        connection.close()
+    return {'rfid.tag_latency': samples}, {'tags/sec': tags / elapsed}
+
+
+# name: statement run in a fresh interpreter, no port may be opened and no serial imported by it
+STARTUP = {
+    'pyembedded': 'import pyembedded',
+    'gsm': 'from pyembedded.gsm_module.gsm import GSM; GSM("/dev/pyembedded-none", 9600)',
+    'gps': 'from pyembedded.gps_module.gps import GPS; GPS("/dev/pyembedded-none", 9600)',
+    'rfid': 'from pyembedded.rfid_module.rfid import RFID; RFID("/dev/pyembedded-none", 9600)',
+    'pi': 'from pyembedded.raspberry_pi_tools.raspberrypi import PI; PI()',
+}
+
+_STARTUP_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(elapsed, ' '.join(name for name in ('serial', 'psutil', 'subprocess', 're') if name in sys.modules))
+"""
+
+
+def bench_startup(iterations):
+    """
+    Every statement of STARTUP is timed in a new interpreter, the interpreter start itself is not counted
+    :param iterations: no of runs of every statement, at most 20
+    :return: tuple of operations & dict of name: space separated heavy modules loaded by the statement
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+    operations = {}
+    loaded = {}
+    for name, statement in STARTUP.items():
+        samples = []
+        for _ in range(max(1, min(iterations, 20))):
+            output = subprocess.check_output([sys.executable, '-c', _STARTUP_SCRIPT, statement], env=env)
+            elapsed, _, modules = output.decode('ascii').strip().partition(' ')
+            samples.append(float(elapsed))
+        operations['startup.' + name] = samples
+        loaded['startup.' + name + ' loads'] = modules or '-'
+    return operations, loaded
+
+
+BENCHMARKS = ('gsm', 'gps', 'gps_ubx', 'rfid', 'startup')
+
+
+def run(benchmarks=BENCHMARKS, transport='loopback', iterations=100, duration=2.0, drop_rate=0.0,
+        corrupt_rate=0.0, seed=0):
+    """
+    Runs the benchmarks
+    :return: dict with keys operations (name: latency summary) and throughput (name: value)
+    """
+    results = {'transport': transport, 'operations': {}, 'throughput': {}}
+    for name in benchmarks:
+        noise = NoiseModel(drop_rate, corrupt_rate, seed) if drop_rate or corrupt_rate else None
+        if name == 'gsm':
+            # a modem can not work with a damaged line, noise is used for the streams only
+            operations, throughput = bench_gsm(transport, iterations)
+        elif name == 'gps':
+            operations, throughput = bench_gps(transport, iterations, duration, noise)
+        elif name == 'gps_ubx':
+            operations, throughput = bench_gps(transport, iterations, duration, noise, ubx_output=True)
+        elif name == 'rfid':
+            operations, throughput = bench_rfid(transport, iterations, duration, noise)
+        elif name == 'startup':
+            operations, throughput = bench_startup(iterations)
+        else:
+            raise ValueError('unknown benchmark %s' % name)
+        for operation, samples in operations.items():
+            results['operations'][operation] = summarize(samples)
+        results['throughput'].update(throughput)
+    return results
+
+
+def format_results(results):
+    lines = ['transport: %s' % results['transport'], '',
+             '%-26s %7s %9s %9s %9s %9s %9s' % ('operation (ms)', 'count', 'mean', 'p50', 'p95', 'p99', 'max')]
+    for name, summary in results['operations'].items():
+        if not summary['count']:
+            lines.append('%-26s %7d' % (name, 0))
+            continue
+        lines.append('%-26s %7d %9.3f %9.3f %9.3f %9.3f %9.3f' % (
+            name, summary['count'], summary['mean'], summary['p50'], summary['p95'], summary['p99'], summary['max']))
+    lines.append('')
+    for name, value in results['throughput'].items():
+        lines.append('%-26s %12s' % (name, value) if isinstance(value, str) else '%-26s %12.1f' % (name, value))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark pyembedded against simulated devices')
+    parser.add_argument('--transport', choices=('loopback', 'pty'), default='loopback')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='comma separated list of gsm, gps, gps_ubx, rfid, startup')
+    parser.add_argument('--iterations', type=int, default=100, help='no of calls of every operation')
+    parser.add_argument('--duration', type=float, default=2.0, help='time in secs of every throughput run')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of a byte being dropped')
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='probability of a byte being corrupted')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    parser.add_argument('--max-startup-ms', type=float, default=None,
+                        help='exit with status 1 if the p50 of a startup operation is above this')
+    args = parser.parse_args(argv)
+    results = run(args.only.split(','), args.transport, args.iterations, args.duration, args.drop_rate,
+                  args.corrupt_rate, args.seed)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+    if args.max_startup_ms is not None:
+        slow = [name for name, summary in results['operations'].items()
+                if name.startswith('startup.') and summary['p50'] > args.max_startup_ms]
+        if slow:
+            print('startup over %.1f ms: %s' % (args.max_startup_ms, ', '.join(slow)), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,586 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module simulates the serial devices used by this library: an AT command gsm modem,
+an NMEA / UBX gps receiver and an EM4100 rfid reader. The devices are deterministic, the same seed
+gives the same data, and are connected to the host with LoopbackSerial or PtyBridge.
+"""
+
+import csv
+import datetime
+import math
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+
+from pyembedded.gps_module import ubx
+from pyembedded.gps_module.nmea import checksum
+from pyembedded.gsm_module.inbox import GSM7_ALPHABET
+
+
+class SimulatedDevice:
+    """
+    Base of the simulated devices. The transport calls attach() with the function sending data
+    to the host, and receive() with the data written by the host
+    """
+
+    def __init__(self):
+        self._emit = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def attach(self, emit):
+        self._emit = emit
+
+    def detach(self):
+        self.stop()
+        self._emit = None
+
+    def emit(self, data):
+        """
+        :param data: bytes sent to the host
+        """
+        if self._emit is not None:
+            self._emit(data)
+
+    def receive(self, data):
+        """
+        :param data: bytes written by the host
+        """
+
+    def start(self):
+        """
+        Starts the thread running self.run(), for devices sending data on their own
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        pass
+
+
+def encode_gsm7(text):
+    """
+    :param text: text using the GSM 03.38 default alphabet only
+    :return: packed bytes
+    """
+    packed = 0
+    for i, char in enumerate(text):
+        packed |= GSM7_ALPHABET.index(char) << (7 * i)
+    return packed.to_bytes((len(text) * 7 + 7) // 8, 'little')
+
+
+def _swap_digits(digits):
+    if len(digits) % 2:
+        digits += 'F'
+    return ''.join(digits[i + 1] + digits[i] for i in range(0, len(digits), 2))
+
+
+def encode_deliver_pdu(sender, text, timestamp):
+    """
+    Builds an SMS-DELIVER pdu with the 7 bit default alphabet
+    :param sender: phone number of the sender i.e. '+919876543210'
+    :param text: message content, max 160 chars
+    :param timestamp: datetime of the service centre timestamp, taken as UTC
+    :return: hex string of the pdu without service centre address
+    """
+    number = sender.lstrip('+')
+    address = '%02X%02X%s' % (len(number), 0x91 if sender.startswith('+') else 0x81, _swap_digits(number))
+    scts = _swap_digits(timestamp.strftime('%y%m%d%H%M%S') + '00')
+    return ('00' + '04' + address + '0000' + scts + '%02X' % len(text) + encode_gsm7(text).hex()).upper()
+
+
+class ModemSimulator(SimulatedDevice):
+    def __init__(self, latency=0.0, responses=None, csq=20, seed=0):
+        """
+        Scripted AT command modem. Answers the commands used by GSM, SMSInbox & SMSBatchSender,
+        including the > prompt of AT+CMGS, the sms storage and chained command lines.
+        The SIMCom TCP commands (AT+CSTT, AT+CIICR, AT+CIPSTART, AT+CIPSEND etc) open a real
+        socket, so the data uplink can be tested against a local server
+        :param latency: time in secs between a command and its response
+        :param responses: dict of command prefix: response str or function(command) returning the response,
+                          checked before the built in commands
+        :param csq: signal strength returned by AT+CSQ
+        :param seed: seed of the random generator used for the identity
+        """
+        SimulatedDevice.__init__(self)
+        self.latency = latency
+        self.responses = responses or {}
+        self.csq = csq
+        self.echo = True
+        self.text_mode = True
+        self.in_call = False
+        self.storage = {}
+        self.sent = []
+        self.commands = []
+        rng = random.Random(seed)
+        self.identity = {
+            '+CGMI': 'SIMCOM_Ltd',
+            '+CGMM': 'SIMCOM_SIM800L',
+            '+CGMR': 'Revision:1418B05SIM800L24',
+            '+CGSN': '86%013d' % rng.randrange(10 ** 13),
+            '+CIMI': '40445%010d' % rng.randrange(10 ** 10),
+        }
+        self._line = bytearray()
+        self._sms_number = None
+        self._message_reference = 0
+        self._lines = queue.Queue()
+        # TCP stack
+        self.bearer = False
+        self.ip_head = False
+        self.tcp_sent = 0
+        self._socket = None
+        self._data_length = None
+
+    def attach(self, emit):
+        SimulatedDevice.attach(self, emit)
+        self.start()
+
+    def receive(self, data):
+        for b in data:
+            if self._data_length is not None:
+                # AT+CIPSEND data of a fixed length after the > prompt
+                self._line.append(b)
+                if len(self._line) == self._data_length:
+                    self._lines.put((bytes(self._line), 'data'))
+                    self._line.clear()
+                    self._data_length = None
+                continue
+            if self._sms_number is not None:
+                # sms body after the > prompt, ended by ctrl-z or cancelled by esc
+                if b in (26, 27):
+                    self._lines.put((bytes(self._line), b))
+                    self._line.clear()
+                else:
+                    self._line.append(b)
+                continue
+            if b == 13:
+                self._lines.put((bytes(self._line), None))
+                self._line.clear()
+            elif b != 10:
+                self._line.append(b)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                line, terminator = self._lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if self.echo:
+                self.emit(line + (bytes([terminator]) if isinstance(terminator, int) else b'\r'))
+            if self.latency:
+                time.sleep(self.latency)
+            if terminator == 'data':
+                self.emit(self._tcp_send(line))
+            elif terminator is not None:
+                self.emit(self._sms_body(line.decode('utf-8', errors='replace'), terminator))
+            else:
+                command = line.decode('utf-8', errors='replace').strip()
+                if command:
+                    self.commands.append(command)
+                    self.emit(self.respond(command).encode('utf-8'))
+
+    def _sms_body(self, body, terminator):
+        number, self._sms_number = self._sms_number, None
+        if terminator == 27:
+            return b'\r\nOK\r\n'
+        self._message_reference = (self._message_reference + 1) % 256
+        self.sent.append((number, body))
+        return ('\r\n+CMGS: %d\r\n\r\nOK\r\n' % self._message_reference).encode('utf-8')
+
+    def respond(self, command):
+        """
+        :param command: command line without the carriage return
+        :return: str response including the final result code
+        """
+        for prefix, response in self.responses.items():
+            if command.upper().startswith(prefix.upper()):
+                return response(command) if callable(response) else response
+        upper = command.upper()
+        if not upper.startswith('AT'):
+            return '\r\nERROR\r\n'
+        if upper.startswith('ATD'):
+            self.in_call = True
+            return '\r\nOK\r\n'
+        if upper in ('ATH', 'ATA'):
+            self.in_call = upper == 'ATA'
+            return '\r\nOK\r\n'
+        if upper in ('ATE0', 'ATE1'):
+            self.echo = upper == 'ATE1'
+            return '\r\nOK\r\n'
+        lines = []
+        # chained command line i.e. AT+CGMI;+CGMM, answered with one final result code
+        for part in command[2:].split(';'):
+            result = self._respond_one(part.strip())
+            if result is None:
+                return '\r\nERROR\r\n'
+            if result == '>':
+                return '\r\n> '
+            if isinstance(result, str):
+                return '\r\n%s\r\n' % result
+            lines.extend(result)
+        return ''.join('\r\n%s\r\n' % line for line in lines) + '\r\nOK\r\n'
+
+    def _respond_one(self, command):
+        """
+        :param command: one command without the AT prefix i.e. '+CSQ'
+        :return: list of information lines, '>' for the sms prompt or None for ERROR
+        """
+        upper = command.upper()
+        name = upper.split('=')[0].rstrip('?')
+        if upper == '':
+            return []
+        if upper in self.identity:
+            return [self.identity[upper]]
+        if upper == '+CSQ':
+            return ['+CSQ: %d,0' % self.csq]
+        if upper.startswith('+CMGF='):
+            self.text_mode = upper.endswith('1')
+            return []
+        if name in ('+CNMI', '+CLIP', '+IPR', '+CMEE'):
+            return []
+        if upper == '+CLCC':
+            return ['+CLCC: 1,0,0,0,0,"+10000000000",145'] if self.in_call else []
+        if upper.startswith('+CMGS='):
+            self._sms_number = command.split('=', 1)[1].strip('"')
+            return '>'
+        if upper.startswith('+CMGR='):
+            slot = int(upper.split('=')[1])
+            if slot not in self.storage:
+                return None
+            return self._sms_lines(slot, listing=False)
+        if upper.startswith('+CMGL'):
+            lines = []
+            for slot in sorted(self.storage):
+                status = self.storage[slot][0]
+                wanted = upper.split('=')[1].strip('"') if '=' in upper else 'REC UNREAD'
+                if wanted in ('4', 'ALL') or wanted in (str(status), ('REC UNREAD', 'REC READ')[status]):
+                    lines.extend(self._sms_lines(slot, listing=True))
+            return lines
+        if upper.startswith('+CMGD='):
+            self.storage.pop(int(upper.split('=')[1].split(',')[0]), None)
+            return []
+        if upper.startswith('+CIP') or name in ('+CSTT', '+CIICR', '+CIFSR'):
+            return self._respond_tcp(command, upper)
+        return None
+
+    def _respond_tcp(self, command, upper):
+        """
+        SIMCom single connection TCP commands. Responses which are not followed by OK are returned as a
+        str to be sent as is, like SIMCom modems do
+        """
+        if upper == '+CIPSHUT':
+            self.bearer = False
+            self._close_socket()
+            return 'SHUT OK'
+        if upper.startswith(('+CIPMUX=', '+CSTT', '+CIPQSEND=0')):
+            return []
+        if upper.startswith('+CIPHEAD='):
+            self.ip_head = upper.endswith('1')
+            return []
+        if upper == '+CIICR':
+            self.bearer = True
+            return []
+        if upper == '+CIFSR':
+            return '10.0.0.2' if self.bearer else None
+        if upper.startswith('+CIPSTART='):
+            if not self.bearer:
+                return None
+            if self._socket is not None:
+                return 'ALREADY CONNECT'
+            _, host, port = next(csv.reader([command.split('=', 1)[1]]))
+            try:
+                self._socket = socket.create_connection((host, int(port)), timeout=5)
+            except OSError:
+                return 'OK\r\n\r\nCONNECT FAIL'
+            self._socket.settimeout(None)
+            threading.Thread(target=self._tcp_reader, args=(self._socket,), name='modem-tcp', daemon=True).start()
+            return 'OK\r\n\r\nCONNECT OK'
+        if upper.startswith('+CIPSEND='):
+            if self._socket is None:
+                return None
+            self._data_length = int(upper.split('=')[1])
+            return '>'
+        if upper == '+CIPCLOSE':
+            if self._socket is None:
+                return None
+            self._close_socket()
+            return 'CLOSE OK'
+        if upper == '+CIPSTATUS':
+            state = 'CONNECT OK' if self._socket is not None else ('IP STATUS' if self.bearer else 'IP INITIAL')
+            return 'OK\r\n\r\nSTATE: ' + state
+        return None
+
+    def _tcp_send(self, data):
+        sock = self._socket
+        if sock is None:
+            return b'\r\nSEND FAIL\r\n'
+        try:
+            sock.sendall(data)
+        except OSError:
+            self._close_socket()
+            return b'\r\nSEND FAIL\r\n'
+        self.tcp_sent += len(data)
+        return b'\r\nSEND OK\r\n'
+
+    def _tcp_reader(self, sock):
+        while True:
+            try:
+                data = sock.recv(1460)
+            except OSError:
+                data = b''
+            if sock is not self._socket:
+                return
+            if not data:
+                self._close_socket()
+                self.send_urc('CLOSED')
+                return
+            self.emit((b'\r\n+IPD,%d:' % len(data) if self.ip_head else b'') + data)
+
+    def _close_socket(self):
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def drop_connection(self):
+        """
+        Simulates the network dropping the TCP connection & the bearer
+        """
+        self.bearer = False
+        self._close_socket()
+        self.send_urc('+PDP: DEACT')
+
+    def _sms_lines(self, slot, listing):
+        status, sender, text, timestamp = self.storage[slot]
+        self.storage[slot] = (1, sender, text, timestamp)
+        prefix = '+CMGL: %d,' % slot if listing else '+CMGR: '
+        if self.text_mode:
+            stamp = timestamp.strftime('%y/%m/%d,%H:%M:%S') + '+00'
+            return ['%s"%s","%s","","%s"' % (prefix, ('REC UNREAD', 'REC READ')[status], sender, stamp), text]
+        pdu = encode_deliver_pdu(sender, text, timestamp)
+        return ['%s%d,,%d' % (prefix, status, len(pdu) // 2 - 1), pdu]
+
+    def deliver_sms(self, sender, text, timestamp=None):
+        """
+        Stores an incoming sms in the first free slot and sends +CMTI
+        :return: slot of the sms
+        """
+        slot = 1
+        while slot in self.storage:
+            slot += 1
+        if timestamp is None:
+            timestamp = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0, tzinfo=None)
+        self.storage[slot] = (0, sender, text, timestamp)
+        self.send_urc('+CMTI: "SM",%d' % slot)
+        return slot
+
+    def ring(self, number):
+        """
+        Simulates an incoming call
+        """
+        self.send_urc('RING')
+        self.send_urc('+CLIP: "%s",145,"",,"",0' % number)
+
+    def hang_up(self):
+        """
+        Simulates the far end ending the call
+        """
+        self.in_call = False
+        self.send_urc('NO CARRIER')
+
+    def send_urc(self, line):
+        self.emit(('\r\n%s\r\n' % line).encode('utf-8'))
+
+
+def _nmea(body):
+    return ('$%s*%02X\r\n' % (body, checksum(body.encode('ascii')))).encode('ascii')
+
+
+def _nmea_angle(value, degree_digits):
+    value = abs(value)
+    degrees = int(value)
+    return '%0*d%07.4f' % (degree_digits, degrees, (value - degrees) * 60)
+
+
+_NAV_PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH6xihH')
+
+
+def encode_nav_pvt(when, lat, long, altitude, speed, course, satellites):
+    """
+    :param when: UTC datetime of the solution
+    :param speed: speed in knots
+    :return: bytes of a 3D fix UBX NAV-PVT frame
+    """
+    itow = ((when.weekday() + 1) % 7 * 86400 + when.hour * 3600 + when.minute * 60 + when.second) * 1000 + \
+        when.microsecond // 1000
+    speed = int(round(speed * 1852 / 3.6))
+    north = int(round(speed * math.cos(math.radians(course))))
+    east = int(round(speed * math.sin(math.radians(course))))
+    payload = _NAV_PVT.pack(itow, when.year, when.month, when.day, when.hour, when.minute, when.second, 0x07, 50,
+                            when.microsecond * 1000, ubx.FIX_3D, 0x01, 0, satellites, int(round(long * 1e7)),
+                            int(round(lat * 1e7)), int(round((altitude - 34.0) * 1000)), int(round(altitude * 1000)),
+                            2500, 3500, north, east, 0, speed, int(round(course * 1e5)) % 36000000, 400, 500000,
+                            150, 0, 0, 0)
+    return ubx.build_message(ubx.NAV, 0x07, payload)
+
+
+class NMEASimulator(SimulatedDevice):
+    def __init__(self, rate=1.0, lat=28.6139, long=77.2090, speed=10.0, course=45.0, satellites=8,
+                 start_time=None, seed=0, ubx_output=False):
+        """
+        GPS receiver moving on a straight line, sending GGA & RMC at the given rate.
+        Like a u-blox receiver it acknowledges UBX CFG messages, and follows CFG-RATE & CFG-MSG
+        :param rate: no of fixes per sec
+        :param lat: start latitude in decimal degrees
+        :param long: start longitude in decimal degrees
+        :param speed: speed in knots
+        :param course: course over ground in degrees
+        :param satellites: no of satellites in GGA
+        :param start_time: datetime of the first fix, simulated time advances by 1 / rate per fix
+        :param seed: seed of the random generator adding position jitter
+        :param ubx_output: send NAV-PVT instead of GGA & RMC
+        """
+        SimulatedDevice.__init__(self)
+        self.rate = rate
+        # enabled outputs, NMEA sentence or UBX message names
+        self.outputs = {'NAV-PVT'} if ubx_output else {'GGA', 'RMC'}
+        self._parser = ubx.UBXParser()
+        self.lat = lat
+        self.long = long
+        self.speed = speed
+        self.course = course
+        self.satellites = satellites
+        self.time = start_time or datetime.datetime(2020, 1, 1, 0, 0, 0)
+        self.fixes_sent = 0
+        self._random = random.Random(seed)
+
+    def next_fix(self):
+        """
+        Advances the position by one fix
+        :return: bytes of the enabled GGA & RMC sentences and NAV-PVT message
+        """
+        stamp = self.time.strftime('%H%M%S.') + '%02d' % (self.time.microsecond // 10000)
+        jitter = self._random.uniform(-0.000005, 0.000005)
+        lat, long = self.lat + jitter, self.long + jitter
+        ns, ew = 'N' if lat >= 0 else 'S', 'E' if long >= 0 else 'W'
+        gga = 'GPGGA,%s,%s,%s,%s,%s,1,%02d,0.9,215.0,M,-34.0,M,,' % (
+            stamp, _nmea_angle(lat, 2), ns, _nmea_angle(long, 3), ew, self.satellites)
+        rmc = 'GPRMC,%s,A,%s,%s,%s,%s,%.1f,%.1f,%s,,,A' % (
+            stamp, _nmea_angle(lat, 2), ns, _nmea_angle(long, 3), ew, self.speed, self.course,
+            self.time.strftime('%d%m%y'))
+        data = b''
+        if 'RMC' in self.outputs:
+            data += _nmea(rmc)
+        if 'GGA' in self.outputs:
+            data += _nmea(gga)
+        if 'NAV-PVT' in self.outputs:
+            data += encode_nav_pvt(self.time, lat, long, 215.0, self.speed, self.course, self.satellites)
+        step = 1.0 / self.rate
+        distance = self.speed * 1852 / 3600 * step
+        self.lat += distance * math.cos(math.radians(self.course)) / 111320
+        self.long += distance * math.sin(math.radians(self.course)) / (111320 * math.cos(math.radians(self.lat)))
+        self.time += datetime.timedelta(seconds=step)
+        self.fixes_sent += 1
+        return data
+
+    def receive(self, data):
+        for frame, record in self._parser.feed(data):
+            if not isinstance(record, ubx.UBXMessage) or record.msg_class != ubx.CFG:
+                continue
+            payload = record.payload
+            if record.msg_id == 0x08 and len(payload) >= 2:
+                self.rate = 1000.0 / max(1, payload[0] | payload[1] << 8)
+            elif record.msg_id == 0x01 and len(payload) >= 3:
+                names = [name for name, key in ubx.MESSAGES.items() if key == (payload[0], payload[1])]
+                names += [name for name, msg_id in ubx.NMEA_MESSAGES.items()
+                          if payload[0] == ubx.NMEA_STD and msg_id == payload[1]]
+                for name in names:
+                    if payload[2]:
+                        self.outputs.add(name)
+                    else:
+                        self.outputs.discard(name)
+            self.emit(ubx.build_message(ubx.ACK, 0x01, bytes((record.msg_class, record.msg_id))))
+
+    def run(self):
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            self.emit(self.next_fix())
+            next_due += 1.0 / self.rate
+            wait = next_due - time.monotonic()
+            if wait > 0:
+                self._stop.wait(wait)
+
+
+def make_tag(data):
+    """
+    :param data: 10 hex chars of tag data
+    :return: 12 char tag id with the XOR checksum
+    """
+    value = bytes.fromhex(data)
+    return data.upper() + '%02X' % (value[0] ^ value[1] ^ value[2] ^ value[3] ^ value[4])
+
+
+class RFIDSimulator(SimulatedDevice):
+    def __init__(self, tags=None, burst=3, interval=0.5, stx_etx=True, seed=0):
+        """
+        RFID reader sending a burst of repeated reads every time a tag is put on the antenna
+        :param tags: list of 12 char tag ids, 10 random tags if None
+        :param burst: no of times a tag is sent per burst, like a tag sitting on the antenna
+        :param interval: time in secs between two bursts
+        :param stx_etx: wrap frames in STX & ETX like RDM6300, else raw frames like EM-18
+        :param seed: seed of the random generator picking the tags
+        """
+        SimulatedDevice.__init__(self)
+        self._random = random.Random(seed)
+        self.tags = tags or [make_tag('%010X' % self._random.randrange(16 ** 10)) for _ in range(10)]
+        self.burst = burst
+        self.interval = interval
+        self.stx_etx = stx_etx
+        self.frames_sent = 0
+
+    def frame(self, tag_id):
+        return b'\x02' + tag_id.encode('ascii') + b'\x03' if self.stx_etx else tag_id.encode('ascii')
+
+    def next_burst(self):
+        """
+        :return: bytes of the next burst of a random tag
+        """
+        tag_id = self._random.choice(self.tags)
+        self.frames_sent += self.burst
+        return self.frame(tag_id) * self.burst
+
+    def run(self):
+        while not self._stop.is_set():
+            self.emit(self.next_burst())
+            if self.interval:
+                self._stop.wait(self.interval)
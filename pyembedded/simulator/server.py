@@ -0,0 +1,93 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module runs a local HTTP server receiving the batches of the gsm data uplink,
+so Uplink can be tested end to end through ModemSimulator without a network.
+"""
+
+import http.server
+import json
+import threading
+import zlib
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server.owner
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests += 1
+            status = 503 if server.fail_requests > 0 else 200
+            server.fail_requests = max(0, server.fail_requests - 1)
+        if status == 200:
+            try:
+                if self.headers.get('Content-Encoding') == 'deflate':
+                    body = zlib.decompress(body)
+                records = [json.loads(line) for line in body.decode('utf-8').splitlines() if line]
+            except (zlib.error, ValueError):
+                status = 400
+        if status == 200:
+            batch_id = self.headers.get('X-Batch-Id')
+            with server.lock:
+                # a batch resent after a lost response is acknowledged again but stored once
+                if batch_id is None or batch_id not in server.batches:
+                    server.batches[batch_id] = len(records)
+                    server.records.extend(records)
+        reply = b'{"status": %d}' % status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UplinkServer:
+    def __init__(self, host='127.0.0.1', port=0):
+        """
+        HTTP server storing the records of every POSTed batch
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port, see self.port
+        """
+        self.lock = threading.Lock()
+        self.records = []
+        # X-Batch-Id: no of records
+        self.batches = {}
+        self.requests = 0
+        self.fail_requests = 0
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='uplink-server', daemon=True)
+        self._thread.start()
+
+    def fail_next(self, count=1):
+        """
+        Answers the next count requests with 503
+        """
+        with self.lock:
+            self.fail_requests = count
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,209 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module connects the simulated devices to the GSM, GPS and RFID classes.
+LoopbackSerial is an in process replacement of serial.Serial, passed as serial_port to the classes.
+PtyBridge exposes the device on a pseudo terminal, so it is opened like real hardware with serial.Serial.
+The received data is kept in an os pipe / pty, so the file descriptor works with selectors & asyncio.
+Works on linux based devices only.
+"""
+
+import fcntl
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+
+class NoiseModel:
+    def __init__(self, drop_rate=0.0, corrupt_rate=0.0, seed=0):
+        """
+        Damages the data sent by a device, the same seed gives the same damage
+        :param drop_rate: probability of a byte being dropped
+        :param corrupt_rate: probability of a byte being replaced with a random byte
+        :param seed: seed of the random generator
+        """
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.dropped = 0
+        self.corrupted = 0
+        self._random = random.Random(seed)
+
+    def apply(self, data):
+        """
+        :param data: bytes sent by the device
+        :return: damaged bytes
+        """
+        if not self.drop_rate and not self.corrupt_rate:
+            return data
+        out = bytearray()
+        rand = self._random.random
+        for b in data:
+            r = rand()
+            if r < self.drop_rate:
+                self.dropped += 1
+            elif r < self.drop_rate + self.corrupt_rate:
+                self.corrupted += 1
+                out.append(self._random.randrange(256))
+            else:
+                out.append(b)
+        return bytes(out)
+
+
+def _bytes_waiting(fd):
+    return struct.unpack('i', fcntl.ioctl(fd, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+
+class LoopbackSerial:
+    def __init__(self, device, noise=None, baudrate=None, timeout=None):
+        """
+        Serial port connected to a simulated device, with the serial.Serial interface used by this library
+        :param device: simulated device i.e. ModemSimulator
+        :param noise: NoiseModel applied to the data sent by the device
+        :param baudrate: if set, the device output is paced to the speed of the line (10 bits per byte)
+        :param timeout: read timeout in secs like serial.Serial, None blocks until the requested bytes are read
+        """
+        self.device = device
+        self.noise = noise
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = False
+        self._write_lock = threading.Lock()
+        self._rx = None
+        self._tx = None
+        self.open()
+
+    def open(self):
+        if self.is_open:
+            return
+        self._rx, self._tx = os.pipe()
+        self.is_open = True
+        self.device.attach(self.emit)
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.device.detach()
+        # closing the read end first fails a write blocked on a full pipe
+        os.close(self._rx)
+        with self._write_lock:
+            os.close(self._tx)
+
+    def fileno(self):
+        return self._rx
+
+    @property
+    def in_waiting(self):
+        return _bytes_waiting(self._rx)
+
+    def read(self, size=1):
+        """
+        Reads size bytes, returns less if the timeout expires first
+        """
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < size:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not select.select([self._rx], [], [], wait)[0]:
+                break
+            data += os.read(self._rx, size - len(data))
+        return bytes(data)
+
+    def write(self, data):
+        data = bytes(data)
+        self.device.receive(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        waiting = self.in_waiting
+        if waiting:
+            os.read(self._rx, waiting)
+
+    def emit(self, data):
+        """
+        Called by the device to send data to the host
+        :param data: bytes
+        """
+        if self.noise is not None:
+            data = self.noise.apply(data)
+        if self.baudrate:
+            time.sleep(len(data) * 10 / self.baudrate)
+        with self._write_lock:
+            if not self.is_open:
+                return
+            try:
+                os.write(self._tx, data)
+            except BrokenPipeError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PtyBridge:
+    def __init__(self, device, noise=None):
+        """
+        Exposes the simulated device on a pseudo terminal, open port with serial.Serial like a real device
+        :param device: simulated device i.e. NMEASimulator
+        :param noise: NoiseModel applied to the data sent by the device
+        """
+        self.device = device
+        self.noise = noise
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='pty-bridge', daemon=True)
+        self._thread.start()
+        device.attach(self.emit)
+
+    def emit(self, data):
+        if self.noise is not None:
+            data = self.noise.apply(data)
+        with self._write_lock:
+            if not self._stop.is_set():
+                os.write(self._master, data)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not select.select([self._master], [], [], 0.1)[0]:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            self.device.receive(data)
+
+    def close(self):
+        self.device.detach()
+        with self._write_lock:
+            self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,412 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module instruments the devices: latency histogram of every command, bytes in & out, timeouts,
+checksum & parse errors, kept per device.
+GSM, GPS, RFID and PI take a Metrics object, without one they skip the instrumentation entirely, the hot paths
+only test an attribute for None. Parser errors are not counted twice: the parsers already count them
+and are read when a snapshot is taken.
+The data is available as an in process snapshot, as Prometheus text served on a local port and as a callback
+per operation for tracing:
+    metrics = Metrics(tracer=print)
+    gsm = GSM('/dev/ttyUSB0', 9600, metrics=metrics)
+    server = metrics.serve(port=9108)
+"""
+
+import bisect
+import threading
+import time
+
+# latency buckets in secs, AT commands take from a few milli secs up to minutes (AT+COPS, AT+CIICR)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+OK = 'ok'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        """
+        Fixed bucket histogram, Prometheus style
+        :param bounds: sorted upper bounds of the buckets, the +Inf bucket is added
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        :param q: 0 to 1
+        :return: upper bound of the bucket holding the quantile, inf if it is above the last bound, None if empty
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """
+        :return: dict with keys buckets (list of (upper bound, cumulative count)), sum & count
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class TraceEvent:
+    """
+    One timed operation, handed to the tracers
+    """
+    __slots__ = ('kind', 'device', 'operation', 'started', 'duration', 'status')
+
+    def __init__(self, kind, device, operation, started, duration, status):
+        """
+        :param kind: device kind i.e. 'gsm'
+        :param device: device name, the port by default
+        :param operation: i.e. 'AT+CSQ'
+        :param started: time.time() value when the operation started
+        :param duration: secs
+        :param status: OK, ERROR or TIMEOUT
+        """
+        self.kind = kind
+        self.device = device
+        self.operation = operation
+        self.started = started
+        self.duration = duration
+        self.status = status
+
+    def __repr__(self):
+        return 'TraceEvent(kind=%r, device=%r, operation=%r, duration=%.6f, status=%r)' % (
+            self.kind, self.device, self.operation, self.duration, self.status)
+
+
+def _parser_errors(parser):
+    """
+    :return: tuple of checksum & parse errors counted by the parser and its nested NMEA parser, if any
+    """
+    checksum = getattr(parser, 'checksum_errors', 0)
+    parse = getattr(parser, 'parse_errors', 0)
+    nested = getattr(parser, 'nmea', None)
+    if nested is not None:
+        checksum += nested.checksum_errors
+        parse += nested.parse_errors
+    return checksum, parse
+
+
+class DeviceMetrics:
+    def __init__(self, registry, kind, name):
+        """
+        Metrics of one device, get it from Metrics.device()
+        :param registry: Metrics the device belongs to
+        :param kind: i.e. 'gsm', 'gps', 'rfid', 'pi'
+        :param name: device name, the port by default
+        """
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        # plain counters, updated by the single thread using the port at a time
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # operation: Histogram
+        self.latency = {}
+        # operation: count
+        self.timeouts = {}
+        self.errors = {}
+        # event name i.e. 'fixes': count
+        self.events = {}
+        self._checksum_errors = 0
+        self._parse_errors = 0
+        self._parsers = []
+        self._lock = threading.Lock()
+
+    def observe(self, operation, duration, status=OK):
+        """
+        Records one timed operation and hands it to the tracers
+        :param operation: i.e. 'AT+CSQ'
+        :param duration: secs
+        :param status: OK, ERROR or TIMEOUT
+        """
+        with self._lock:
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram(self.registry.buckets)
+            histogram.observe(duration)
+            if status == TIMEOUT:
+                self.timeouts[operation] = self.timeouts.get(operation, 0) + 1
+            elif status == ERROR:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+        if self.registry.tracers:
+            event = TraceEvent(self.kind, self.name, operation, time.time() - duration, duration, status)
+            for tracer in self.registry.tracers:
+                tracer(event)
+
+    def time(self, operation):
+        """
+        Times a block of code, status is ERROR if it raises
+            with metrics.time('get_cpu_temp'):
+                ...
+        """
+        return _Timer(self, operation)
+
+    def count(self, event, value=1):
+        """
+        :param event: i.e. 'fixes' or 'tags'
+        :param value: increment
+        """
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + value
+
+    def track(self, parser):
+        """
+        Adds the checksum & parse errors counted by a long lived parser to the device, they are read on snapshot.
+        Untrack it once it is not used.
+        :param parser: NMEAParser, UBXParser or RFIDFrameParser
+        """
+        with self._lock:
+            self._parsers.append(parser)
+
+    def untrack(self, parser):
+        """
+        Keeps the errors counted by the parser so far and stops reading it
+        """
+        with self._lock:
+            if parser not in self._parsers:
+                return
+            self._parsers.remove(parser)
+        self.collect(parser)
+
+    def collect(self, parser):
+        """
+        Adds the errors counted by a parser which is not used anymore
+        """
+        checksum, parse = _parser_errors(parser)
+        with self._lock:
+            self._checksum_errors += checksum
+            self._parse_errors += parse
+
+    @property
+    def checksum_errors(self):
+        with self._lock:
+            return self._checksum_errors + sum(_parser_errors(parser)[0] for parser in self._parsers)
+
+    @property
+    def parse_errors(self):
+        with self._lock:
+            return self._parse_errors + sum(_parser_errors(parser)[1] for parser in self._parsers)
+
+    def snapshot(self):
+        """
+        :return: dict with keys kind, name, bytes_in, bytes_out, checksum_errors, parse_errors, events and
+                 operations (operation: dict with keys latency (Histogram.snapshot()), p50, p99, timeouts & errors)
+        """
+        checksum_errors, parse_errors = self.checksum_errors, self.parse_errors
+        with self._lock:
+            operations = {}
+            for operation, histogram in self.latency.items():
+                operations[operation] = {'latency': histogram.snapshot(), 'p50': histogram.quantile(0.5),
+                                         'p99': histogram.quantile(0.99),
+                                         'timeouts': self.timeouts.get(operation, 0),
+                                         'errors': self.errors.get(operation, 0)}
+            return {'kind': self.kind, 'name': self.name, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                    'checksum_errors': checksum_errors, 'parse_errors': parse_errors, 'events': dict(self.events),
+                    'operations': operations}
+
+
+class _Timer:
+    __slots__ = ('metrics', 'operation', 'started')
+
+    def __init__(self, metrics, operation):
+        self.metrics = metrics
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.observe(self.operation, time.perf_counter() - self.started, OK if exc_type is None else ERROR)
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS, tracer=None):
+        """
+        Registry of the metrics of every instrumented device
+        :param buckets: latency histogram bounds in secs
+        :param tracer: function called with a TraceEvent for every timed operation, see add_tracer()
+        """
+        self.buckets = tuple(buckets)
+        self.tracers = [] if tracer is None else [tracer]
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def device(self, kind, name):
+        """
+        :param kind: i.e. 'gsm'
+        :param name: device name, the port by default
+        :return: DeviceMetrics, the same one for the same kind & name
+        """
+        with self._lock:
+            metrics = self._devices.get((kind, name))
+            if metrics is None:
+                metrics = self._devices[kind, name] = DeviceMetrics(self, kind, name)
+            return metrics
+
+    def add_tracer(self, tracer):
+        """
+        :param tracer: function called with a TraceEvent, from the thread running the operation,
+                       so it must be quick i.e. put the event on a queue
+        """
+        self.tracers.append(tracer)
+
+    def remove_tracer(self, tracer):
+        if tracer in self.tracers:
+            self.tracers.remove(tracer)
+
+    def snapshot(self):
+        """
+        :return: list of DeviceMetrics.snapshot() of every device
+        """
+        with self._lock:
+            devices = list(self._devices.values())
+        return [device.snapshot() for device in devices]
+
+    def prometheus(self):
+        """
+        :return: str of every metric in the Prometheus text exposition format
+        """
+        return format_prometheus(self.snapshot())
+
+    def serve(self, host='127.0.0.1', port=9108):
+        """
+        Serves prometheus() over HTTP from a background thread
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        :return: MetricsServer, close it to stop serving
+        """
+        return MetricsServer(self, host, port)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def format_prometheus(snapshot):
+    """
+    :param snapshot: Metrics.snapshot()
+    :return: str in the Prometheus text exposition format
+    """
+    series = {
+        'pyembedded_bytes_received_total': ('counter', 'Bytes read from the device port', []),
+        'pyembedded_bytes_sent_total': ('counter', 'Bytes written to the device port', []),
+        'pyembedded_checksum_errors_total': ('counter', 'Frames or sentences dropped for a wrong checksum', []),
+        'pyembedded_parse_errors_total': ('counter', 'Frames or sentences which could not be decoded', []),
+        'pyembedded_events_total': ('counter', 'Device events i.e. fixes or tags', []),
+        'pyembedded_operation_seconds': ('histogram', 'Latency of the device operations', []),
+        'pyembedded_operation_timeouts_total': ('counter', 'Operations which timed out', []),
+        'pyembedded_operation_errors_total': ('counter', 'Operations which failed', []),
+    }
+    for device in snapshot:
+        labels = 'kind="%s",device="%s"' % (_escape(device['kind']), _escape(device['name']))
+        series['pyembedded_bytes_received_total'][2].append('{%s} %d' % (labels, device['bytes_in']))
+        series['pyembedded_bytes_sent_total'][2].append('{%s} %d' % (labels, device['bytes_out']))
+        series['pyembedded_checksum_errors_total'][2].append('{%s} %d' % (labels, device['checksum_errors']))
+        series['pyembedded_parse_errors_total'][2].append('{%s} %d' % (labels, device['parse_errors']))
+        for event, count in sorted(device['events'].items()):
+            series['pyembedded_events_total'][2].append('{%s,event="%s"} %d' % (labels, _escape(event), count))
+        for operation, values in sorted(device['operations'].items()):
+            operation_labels = '%s,operation="%s"' % (labels, _escape(operation))
+            histogram = series['pyembedded_operation_seconds'][2]
+            for bound, count in values['latency']['buckets']:
+                histogram.append('_bucket{%s,le="%s"} %d' % (operation_labels, _format_bound(bound), count))
+            histogram.append('_sum{%s} %r' % (operation_labels, values['latency']['sum']))
+            histogram.append('_count{%s} %d' % (operation_labels, values['latency']['count']))
+            series['pyembedded_operation_timeouts_total'][2].append(
+                '{%s} %d' % (operation_labels, values['timeouts']))
+            series['pyembedded_operation_errors_total'][2].append('{%s} %d' % (operation_labels, values['errors']))
+    lines = []
+    for name, (metric_type, help_text, samples) in series.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        lines.extend(name + sample for sample in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _handler_class():
+    # http.server is slow to import, it is loaded only when serving
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return http.server.ThreadingHTTPServer, Handler
+
+
+class MetricsServer:
+    def __init__(self, metrics, host='127.0.0.1', port=9108):
+        """
+        HTTP server answering GET /metrics with the Prometheus text of metrics
+        :param metrics: Metrics
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port, see self.port
+        """
+        server_class, handler_class = _handler_class()
+        self._server = server_class((host, port), handler_class)
+        self._server.daemon_threads = True
+        self._server.metrics = metrics
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
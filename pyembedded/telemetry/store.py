@@ -0,0 +1,664 @@
+"""
+# Copyright 2020 ABHINAV RAWAT
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+"""
+This module stores timestamped telemetry i.e. gps fixes, rfid tag reads and raspberry pi metrics on the device.
+Every series is a directory of chunk files. A chunk holds up to chunk_records records in columns of fixed width
+integers: timestamps are stored as deltas from the first timestamp of the chunk and values as fixed point deltas
+from the first value of the chunk, so a coordinate takes 4 bytes instead of 8. A chunk is written once, when it
+is full, and read back through mmap with a binary search on the timestamp column.
+Records of the open chunk are kept in memory and appended in batches to a small journal file, so at most the
+last unflushed batch is lost on a power cut. Chunk files are little endian, the byte order of the raspberry pi,
+so they are read in place through mmap on the device and still readable on a big endian host.
+A series keeps its records in time order: a timestamp earlier than the previous record, i.e. of a sample which
+arrived late, is stored with the timestamp of the previous record.
+
+Layout of a chunk file:
+    header:     magic, version, no of columns, no of records, base timestamp (us), time resolution (us)
+    bases:      int64 base value of every column
+    timestamps: uint32 deltas from the base timestamp in units of time resolution
+    columns:    delta of every value from the column base, the smallest value of the type marks a missing value
+"""
+
+import array
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b'PYTM'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIqI')
+# bits of the signed types used for columns
+_TYPE_BITS = {'b': 8, 'h': 16, 'i': 32, 'q': 64}
+_MAX_TIME_DELTA = 0xFFFFFFFF
+_NAN = float('nan')
+# chunk files are little endian, arrays are swapped on a big endian host
+_SWAP = sys.byteorder != 'little'
+
+# series created on first use by the record_* methods: column name, scale, type
+SCHEMAS = {
+    'gps': (('lat', 1e7, 'i'), ('long', 1e7, 'i'), ('altitude', 100, 'i'), ('speed_knots', 100, 'i'),
+            ('course', 100, 'i'), ('quality', 1, 'b'), ('satellites', 1, 'h')),
+    'rfid': (('tag', 1, 'q'),),
+    'pi': (('cpu_usage', 100, 'i'), ('cpu_temp', 100, 'i'), ('ram_used', 1, 'q'), ('ram_available', 1, 'q'),
+           ('disk_used_percent', 100, 'i'), ('wifi_quality', 100, 'i')),
+}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for numpy=True, install it with: pip3 install numpy')
+    return numpy
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+def _write_file(path, data):
+    """
+    Writes a chunk or schema file under a temp name and renames it, chunk files are mapped by readers
+    and must never be seen before all their records are on disk
+    :param path: path of the file
+    :param data: bytes content
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def tag_id(value):
+    """
+    :param value: tag column value of the rfid series
+    :return: 12 char tag id
+    """
+    return '%012X' % int(value)
+
+
+class Column:
+    __slots__ = ('name', 'scale', 'typecode', 'missing', 'low', 'high')
+
+    def __init__(self, name, scale=1, typecode='i'):
+        """
+        :param name: name of the column
+        :param scale: values are stored as round(value * scale) i.e. 1e7 for degrees, 100 for 2 decimals
+        :param typecode: b, h, i or q for an 8, 16, 32 or 64 bit delta from the chunk base
+        """
+        if typecode not in _TYPE_BITS:
+            raise ValueError('unsupported type %s' % typecode)
+        self.name = name
+        self.scale = scale
+        self.typecode = typecode
+        bits = _TYPE_BITS[typecode] - 1
+        self.missing = -(1 << bits)
+        self.low = self.missing + 1
+        self.high = (1 << bits) - 1
+
+    def encode(self, value):
+        """
+        :return: fixed point int or None for a missing value
+        """
+        if value is None or value != value:
+            return None
+        return int(round(value * self.scale))
+
+
+class _Chunk:
+    """
+    Index entry of a chunk file
+    """
+    __slots__ = ('seq', 'path', 'count', 'start', 'end', 'size')
+
+    def __init__(self, seq, path, count, start, end, size):
+        self.seq = seq
+        self.path = path
+        self.count = count
+        # first & last timestamp in us
+        self.start = start
+        self.end = end
+        self.size = size
+
+
+class _ActiveChunk:
+    """
+    Records of the chunk being filled, kept in memory until the chunk is full
+    """
+
+    def __init__(self, seq, columns, resolution):
+        self.seq = seq
+        self.resolution = resolution
+        self.base_time = None
+        self.last_time = None
+        self.bases = [None] * len(columns)
+        self.times = array.array('I')
+        self.values = [array.array(column.typecode) for column in columns]
+
+    def __len__(self):
+        return len(self.times)
+
+    def fits(self, columns, timestamp, encoded):
+        """
+        :return: True if the record can be stored as deltas of this chunk
+        """
+        if self.base_time is None:
+            return True
+        if (timestamp - self.base_time) // self.resolution > _MAX_TIME_DELTA:
+            return False
+        for column, base, value in zip(columns, self.bases, encoded):
+            if value is not None and base is not None and not column.low <= value - base <= column.high:
+                return False
+        return True
+
+    def append(self, columns, timestamp, encoded):
+        if self.base_time is None:
+            self.base_time = timestamp
+        self.last_time = timestamp
+        self.times.append((timestamp - self.base_time) // self.resolution)
+        for i, (column, value) in enumerate(zip(columns, encoded)):
+            if value is None:
+                self.values[i].append(column.missing)
+                continue
+            if self.bases[i] is None:
+                self.bases[i] = value
+            self.values[i].append(value - self.bases[i])
+
+    def to_bytes(self):
+        count = len(self.times)
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self.values), count, self.base_time, self.resolution),
+                 struct.pack('<%dq' % len(self.bases), *[0 if base is None else base for base in self.bases])]
+        for values in [self.times] + self.values:
+            if _SWAP:
+                values = array.array(values.typecode, values)
+                values.byteswap()
+            data = values.tobytes()
+            parts.append(data + bytes(_padded(len(data)) - len(data)))
+        return b''.join(parts)
+
+
+class Series:
+    def __init__(self, path, name, columns, resolution=0.001, chunk_records=4096):
+        """
+        One series of the store, use TelemetryStore.create_series()
+        :param path: directory of the series
+        :param columns: list of Column
+        :param resolution: time resolution in secs, a chunk spans at most 2^32 units
+        :param chunk_records: max no of records of a chunk
+        """
+        self.path = path
+        self.name = name
+        self.columns = list(columns)
+        self.resolution = max(1, int(round(resolution * 1e6)))
+        self.chunk_records = chunk_records
+        self.chunks = []
+        # timestamp of the latest record in us, earlier timestamps are raised to it
+        self.last_time = None
+        self._journal_row = struct.Struct('<q%dd' % len(self.columns))
+        self._pending = []
+        self._journal = None
+        self._load()
+
+    def _chunk_path(self, seq):
+        return os.path.join(self.path, '%08d.chunk' % seq)
+
+    def _journal_path(self, seq):
+        return os.path.join(self.path, 'journal-%08d.bin' % seq)
+
+    def _load(self):
+        journals = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith('.chunk'):
+                self.chunks.append(self._read_index(int(file_name[:-6]), os.path.join(self.path, file_name)))
+            elif file_name.startswith('journal-') and file_name.endswith('.bin'):
+                journals.append(int(file_name[8:-4]))
+        self.chunks.sort(key=lambda chunk: (chunk.start, chunk.seq))
+        if self.chunks:
+            self.last_time = max(chunk.end for chunk in self.chunks)
+        sealed = {chunk.seq for chunk in self.chunks}
+        next_seq = max(sealed | {0}) + 1
+        # a journal of a sealed chunk is left when the power was cut between writing the chunk & removing
+        # the journal, its records are in the chunk already
+        unsealed = [journal for journal in journals if journal not in sealed]
+        seq = max(unsealed) if unsealed and max(unsealed) >= next_seq else next_seq
+        self.active = _ActiveChunk(seq, self.columns, self.resolution)
+        for journal in journals:
+            if journal != seq:
+                os.remove(self._journal_path(journal))
+        self._replay()
+
+    def _read_index(self, seq, path):
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            magic, version, columns, count, base_time, resolution = _HEADER.unpack(header)
+            if magic != MAGIC or columns != len(self.columns):
+                raise ValueError('%s is not a chunk of series %s' % (path, self.name))
+            f.seek(_HEADER.size + 8 * columns + 4 * (count - 1))
+            last = struct.unpack('<I', f.read(4))[0]
+            size = os.fstat(f.fileno()).st_size
+        return _Chunk(seq, path, count, base_time, base_time + last * resolution, size)
+
+    def _replay(self):
+        path = self._journal_path(self.active.seq)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        row = self._journal_row
+        # a partial row at the end was cut by a power cut
+        for record in row.iter_unpack(data[:len(data) - len(data) % row.size]):
+            self._append(record[0], [column.encode(value) for column, value in zip(self.columns, record[1:])],
+                         journal=False)
+
+    def append(self, timestamp, values):
+        """
+        :param timestamp: time.time() value of the record, raised to the timestamp of the previous record if earlier
+        :param values: sequence of values in column order, None for a missing value
+        """
+        if len(values) != len(self.columns):
+            raise ValueError('%s has %d columns' % (self.name, len(self.columns)))
+        timestamp = int(round(timestamp * 1e6))
+        self._append(timestamp, [column.encode(value) for column, value in zip(self.columns, values)])
+
+    def _append(self, timestamp, encoded, journal=True):
+        if self.last_time is not None and timestamp < self.last_time:
+            # keeps the timestamps sorted for the binary search, without sealing a chunk per late sample
+            timestamp = self.last_time
+        self.last_time = timestamp
+        if len(self.active) >= self.chunk_records or not self.active.fits(self.columns, timestamp, encoded):
+            self.seal()
+        self.active.append(self.columns, timestamp, encoded)
+        if journal:
+            self._pending.append(self._journal_row.pack(
+                timestamp, *[_NAN if value is None else value / column.scale
+                             for column, value in zip(self.columns, encoded)]))
+
+    @property
+    def pending(self):
+        """
+        :return: no of records not written to the journal yet
+        """
+        return len(self._pending)
+
+    def flush(self, sync=False):
+        """
+        Appends the pending records to the journal of the open chunk in one write
+        :param sync: fsync the journal
+        """
+        if not self._pending:
+            return
+        if self._journal is None:
+            self._journal = open(self._journal_path(self.active.seq), 'ab', buffering=0)
+        self._journal.write(b''.join(self._pending))
+        self._pending = []
+        if sync:
+            os.fsync(self._journal.fileno())
+
+    def seal(self):
+        """
+        Writes the open chunk to its chunk file and starts a new chunk
+        :return: _Chunk written or None if the open chunk was empty
+        """
+        active = self.active
+        if not len(active):
+            return None
+        path = self._chunk_path(active.seq)
+        data = active.to_bytes()
+        _write_file(path, data)
+        self._close_journal()
+        journal = self._journal_path(active.seq)
+        if os.path.exists(journal):
+            os.remove(journal)
+        self._pending = []
+        chunk = _Chunk(active.seq, path, len(active), active.base_time, active.last_time, len(data))
+        self.chunks.append(chunk)
+        self.chunks.sort(key=lambda item: (item.start, item.seq))
+        self.active = _ActiveChunk(active.seq + 1, self.columns, self.resolution)
+        return chunk
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def remove_chunk(self, chunk):
+        self.chunks.remove(chunk)
+        os.remove(chunk.path)
+
+    def size(self):
+        """
+        :return: bytes used by the chunk files
+        """
+        return sum(chunk.size for chunk in self.chunks)
+
+    def close(self):
+        self.flush()
+        self._close_journal()
+
+    def column_indexes(self, names):
+        if names is None:
+            return list(range(len(self.columns)))
+        indexes = {column.name: i for i, column in enumerate(self.columns)}
+        try:
+            return [indexes[name] for name in names]
+        except KeyError as e:
+            raise ValueError('%s has no column %s' % (self.name, e.args[0]))
+
+    def read(self, start, end, indexes, numpy):
+        """
+        :param start: first timestamp in us
+        :param end: last timestamp in us
+        :param indexes: indexes of the columns to read
+        :return: list of (timestamps, list of column values) of every chunk with records in the range
+        """
+        parts = []
+        for chunk in self.chunks:
+            if chunk.end >= start and chunk.start <= end:
+                parts.append(self._read_chunk(chunk, start, end, indexes, numpy))
+        active = self.active
+        if len(active) and active.last_time >= start and active.base_time <= end:
+            parts.append(_decode(memoryview(active.times), [memoryview(active.values[i]) for i in indexes],
+                                 active.base_time, active.resolution, [active.bases[i] for i in indexes],
+                                 [self.columns[i] for i in indexes], start, end, numpy))
+        return parts
+
+    def _read_chunk(self, chunk, start, end, indexes, numpy):
+        with open(chunk.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, count, records, base_time, resolution = _HEADER.unpack_from(data)
+                bases = struct.unpack_from('<%dq' % count, data, _HEADER.size)
+                offset = _HEADER.size + 8 * count
+                offsets = [offset]
+                sizes = [4] + [struct.calcsize(column.typecode) for column in self.columns]
+                for size in sizes:
+                    offset += _padded(size * records)
+                    offsets.append(offset)
+                view = memoryview(data)
+                try:
+                    times = view[offsets[0]:offsets[0] + 4 * records].cast('I')
+                    values = [view[offsets[i + 1]:offsets[i + 1] + sizes[i + 1] * records].cast(
+                        self.columns[i].typecode) for i in indexes]
+                    views = [times] + values
+                    if _SWAP:
+                        # copied, the file can not be read in place on a big endian host
+                        times, values = _swapped(times), [_swapped(value) for value in values]
+                    try:
+                        return _decode(times, values, base_time, resolution, [bases[i] for i in indexes],
+                                       [self.columns[i] for i in indexes], start, end, numpy)
+                    finally:
+                        for value in views:
+                            value.release()
+                finally:
+                    view.release()
+
+
+def _swapped(view):
+    """
+    :param view: memoryview of little endian values
+    :return: array of the values in the byte order of the host
+    """
+    values = array.array(view.format, view)
+    values.byteswap()
+    return values
+
+
+def _decode(times, values, base_time, resolution, bases, columns, start, end, numpy):
+    """
+    Decodes the records of a chunk within start & end
+    :param times: memoryview of the timestamp deltas
+    :param values: list of memoryview of the value deltas
+    :return: tuple of timestamps in secs & list of column values, array('d') or numpy arrays
+    """
+    low = bisect.bisect_left(times, -(-(start - base_time) // resolution)) if start > base_time else 0
+    high = bisect.bisect_right(times, (end - base_time) // resolution) if end >= base_time else 0
+    if numpy:
+        np = _numpy()
+        timestamps = (np.asarray(times[low:high], dtype=np.float64) * resolution + base_time) / 1e6
+        decoded = []
+        for column, base, view in zip(columns, bases, values):
+            raw = np.asarray(view[low:high])
+            value = (raw.astype(np.float64) + base) / column.scale
+            value[raw == column.missing] = np.nan
+            decoded.append(value)
+        return timestamps, decoded
+    timestamps = array.array('d', [(base_time + delta * resolution) / 1e6 for delta in times[low:high]])
+    decoded = []
+    for column, base, view in zip(columns, bases, values):
+        missing, scale = column.missing, column.scale
+        decoded.append(array.array('d', [_NAN if delta == missing else (base + delta) / scale
+                                         for delta in view[low:high]]))
+    return timestamps, decoded
+
+
+class TelemetryStore:
+    def __init__(self, path, max_bytes=None, chunk_records=4096, flush_records=256, flush_interval=5.0,
+                 sync=False):
+        """
+        :param path: directory of the store, created if needed
+        :param max_bytes: the oldest chunks of any series are deleted when the chunk files use more than this
+        :param chunk_records: max no of records of a chunk file
+        :param flush_records: pending records are written to the journal once there are this many
+        :param flush_interval: or once the oldest pending record is this many secs old
+        :param sync: fsync the journal on every flush, safer but more writes to the sd card
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.chunk_records = chunk_records
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self._series = {}
+        self._first_pending = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            schema_path = os.path.join(path, name, 'schema.json')
+            if os.path.exists(schema_path):
+                self._open_series(name)
+
+    def _open_series(self, name):
+        with open(os.path.join(self.path, name, 'schema.json')) as f:
+            schema = json.load(f)
+        columns = [Column(column['name'], column['scale'], column['type']) for column in schema['columns']]
+        self._series[name] = Series(os.path.join(self.path, name), name, columns, schema['resolution'],
+                                    self.chunk_records)
+
+    @property
+    def series_names(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def create_series(self, name, columns, resolution=0.001):
+        """
+        Creates the series if it does not exist
+        :param name: name of the series, used as directory name
+        :param columns: list of (name, scale, type) or Column, see Column for scale & type
+        :param resolution: time resolution in secs
+        :return: Series
+        """
+        with self._lock:
+            if name in self._series:
+                return self._series[name]
+            columns = [column if isinstance(column, Column) else Column(*column) for column in columns]
+            directory = os.path.join(self.path, name)
+            os.makedirs(directory, exist_ok=True)
+            schema = {'columns': [{'name': column.name, 'scale': column.scale, 'type': column.typecode}
+                                  for column in columns], 'resolution': resolution}
+            _write_file(os.path.join(directory, 'schema.json'), json.dumps(schema, indent=2).encode('utf-8'))
+            series = Series(directory, name, columns, resolution, self.chunk_records)
+            self._series[name] = series
+            return series
+
+    def _get(self, name):
+        series = self._series.get(name)
+        if series is None:
+            if name not in SCHEMAS:
+                raise KeyError('no series %s' % name)
+            series = self.create_series(name, SCHEMAS[name])
+        return series
+
+    def append(self, series, values, timestamp=None):
+        """
+        :param series: name of the series
+        :param values: sequence of values in column order or dict of column name: value, None for missing
+        :param timestamp: time.time() value of the record, defaults to now
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            target = self._get(series)
+            if isinstance(values, dict):
+                values = [values.get(column.name) for column in target.columns]
+            chunks = len(target.chunks)
+            target.append(timestamp, values)
+            if len(target.chunks) != chunks:
+                self._first_pending.pop(series, None)
+                self._enforce_retention()
+            if target.pending:
+                first = self._first_pending.setdefault(series, time.monotonic())
+                if target.pending >= self.flush_records or time.monotonic() - first >= self.flush_interval:
+                    target.flush(self.sync)
+                    del self._first_pending[series]
+
+    def record_fix(self, fix, series='gps'):
+        """
+        :param fix: GPSFix
+        """
+        gga, rmc = fix.gga, fix.rmc
+        self.append(series, (gga.lat, gga.long, gga.altitude, None if rmc is None else rmc.speed_knots,
+                             None if rmc is None else rmc.course, gga.quality, gga.satellites), fix.received_at)
+
+    def record_tag(self, event, series='rfid'):
+        """
+        :param event: TagEvent, the tag id is stored as int, use tag_id() to get it back
+        """
+        self.append(series, (int(event.tag_id, 16),), event.timestamp)
+
+    def record_metrics(self, values, timestamp=None, series='pi'):
+        """
+        :param values: dict of metric name: value, see SCHEMAS['pi'] for the names
+        """
+        self.append(series, values, timestamp)
+
+    def flush(self):
+        """
+        Writes the pending records of every series to their journal
+        """
+        with self._lock:
+            for series in self._series.values():
+                series.flush(self.sync)
+            self._first_pending.clear()
+
+    def query(self, series, start=None, end=None, columns=None, numpy=False):
+        """
+        Returns the records within the time range, including the ones not flushed yet
+        :param series: name of the series
+        :param start: first time.time() value, None for the beginning
+        :param end: last time.time() value, None for the end
+        :param columns: list of column names, None for every column
+        :param numpy: return numpy arrays instead of array('d'), decoded with vector operations
+        :return: dict with key timestamp and a key for every column, missing values are NaN
+        """
+        start = -(1 << 63) if start is None else int(math.floor(start * 1e6))
+        end = (1 << 63) - 1 if end is None else int(math.ceil(end * 1e6))
+        with self._lock:
+            target = self._get(series)
+            indexes = target.column_indexes(columns)
+            parts = target.read(start, end, indexes, numpy)
+        names = [target.columns[i].name for i in indexes]
+        if numpy:
+            np = _numpy()
+            result = {'timestamp': np.concatenate([part[0] for part in parts]) if parts else np.empty(0)}
+            for i, name in enumerate(names):
+                result[name] = np.concatenate([part[1][i] for part in parts]) if parts else np.empty(0)
+            return result
+        result = {'timestamp': array.array('d')}
+        for name in names:
+            result[name] = array.array('d')
+        for timestamps, values in parts:
+            result['timestamp'] += timestamps
+            for name, value in zip(names, values):
+                result[name] += value
+        return result
+
+    def downsample(self, series, interval, start=None, end=None, columns=None, how='mean'):
+        """
+        Aggregates the records into buckets of interval secs, missing values are skipped
+        :param interval: bucket size in secs, buckets are aligned to multiples of interval
+        :param how: mean, min, max, first or last
+        :return: dict with keys timestamp (start of the bucket), count and a key for every column
+        """
+        aggregate = {'mean': lambda values: sum(values) / len(values), 'min': min, 'max': max,
+                     'first': lambda values: values[0], 'last': lambda values: values[-1]}[how]
+        data = self.query(series, start, end, columns)
+        names = [name for name in data if name != 'timestamp']
+        result = {'timestamp': [], 'count': []}
+        for name in names:
+            result[name] = []
+        timestamps = data['timestamp']
+        first = 0
+        while first < len(timestamps):
+            bucket = math.floor(timestamps[first] / interval) * interval
+            last = bisect.bisect_left(timestamps, bucket + interval, first)
+            if last == first:
+                # timestamps went back in time across chunks
+                last = first + 1
+            result['timestamp'].append(bucket)
+            result['count'].append(last - first)
+            for name in names:
+                values = [value for value in data[name][first:last] if value == value]
+                result[name].append(aggregate(values) if values else None)
+            first = last
+        return result
+
+    def size(self):
+        """
+        :return: bytes used by the chunk files of every series
+        """
+        with self._lock:
+            return sum(series.size() for series in self._series.values())
+
+    def _enforce_retention(self):
+        if self.max_bytes is None:
+            return
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        chunks = sorted(((chunk.end, series, chunk) for series in self._series.values() for chunk in series.chunks),
+                        key=lambda item: item[0])
+        for _, series, chunk in chunks:
+            if total <= self.max_bytes:
+                break
+            total -= chunk.size
+            series.remove_chunk(chunk)
+
+    def close(self):
+        """
+        Writes the pending records to the journals, the open chunks are continued on the next open
+        """
+        with self._lock:
+            for series in self._series.values():
+                series.close()
+            self._first_pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
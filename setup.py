@@ -20,5 +20,8 @@ setup(
     classifiers=classifiers,
     keywords='embedded, rfid, gsm, gps, lcd, motor, raspberry pi',
     packages=find_packages(),
-    install_requires=['pyserial']
+    install_requires=['pyserial'],
+    extras_require={
+        'bulk': ['numpy'],
+    }
 )
\ No newline at end of file
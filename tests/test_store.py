@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyembedded.telemetry.store import TelemetryStore
+
+
+class SeriesRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def open_store(self):
+        store = TelemetryStore(self.path, chunk_records=4)
+        if 'values' not in store.series_names:
+            store.create_series('values', [('value', 10, 'i')])
+        return store
+
+    def test_journal_left_next_to_its_chunk(self):
+        store = self.open_store()
+        for i in range(4):
+            store.append('values', [float(i)], timestamp=1000.0 + i)
+        store.flush()
+        series = store._get('values')
+        journal = series._journal_path(series.active.seq)
+        shutil.copy(journal, journal + '.copy')
+        series.seal()
+        store.close()
+        # power cut after the chunk was written, before its journal was removed
+        os.replace(journal + '.copy', journal)
+
+        store = self.open_store()
+        for i in range(4, 9):
+            store.append('values', [float(i)], timestamp=1000.0 + i)
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual(list(store.query('values')['value']), [float(i) for i in range(9)])
+        seqs = [chunk.seq for chunk in store._get('values').chunks]
+        self.assertEqual(len(seqs), len(set(seqs)))
+        store.close()
+
+    def test_late_sample_does_not_seal(self):
+        store = self.open_store()
+        for timestamp in (1000.0, 1001.0, 1000.5, 1002.0):
+            store.append('values', [1.0], timestamp=timestamp)
+        series = store._get('values')
+        self.assertEqual(series.chunks, [])
+        self.assertEqual(list(store.query('values')['timestamp']), [1000.0, 1001.0, 1001.0, 1002.0])
+        store.close()
+
+    def test_chunk_is_little_endian(self):
+        store = self.open_store()
+        for i in range(4):
+            store.append('values', [float(i)], timestamp=1000.0 + i)
+        chunk = store._get('values').seal()
+        with open(chunk.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[4:6], b'\x01\x00')
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()